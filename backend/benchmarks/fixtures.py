@@ -0,0 +1,43 @@
+import fitz
+import random
+from io import BytesIO
+from pptx import Presentation
+from pptx.util import Inches
+
+# Generated lecture files for the benchmarks. The text is made up of random words from a fixed
+# vocabulary with a fixed seed, so the same size always gives the same file (and the same chunks).
+
+VOCABULARY = (
+    "lecture student teacher question answer photosynthesis energy cell membrane protein enzyme "
+    "reaction equation variable function derivative integral theorem proof history revolution "
+    "economy market supply demand language grammar sentence paragraph experiment hypothesis result "
+    "analysis evidence argument example definition concept principle method model system process"
+).split()
+
+def lecture_text(word_count: int, seed: int = 0) -> str:
+    generator = random.Random(seed)
+    words = [generator.choice(VOCABULARY) for _ in range(word_count)]
+    # Breaks the words into sentences of 12 so the chunker has sentence boundaries to split on
+    return " ".join(
+        " ".join(words[start:start + 12]).capitalize() + "."
+        for start in range(0, len(words), 12)
+    )
+
+# PDF with page_count pages of words_per_page words each
+def make_pdf(page_count: int, words_per_page: int = 250) -> bytes:
+    pdf_doc = fitz.open()
+    for page_num in range(page_count):
+        page = pdf_doc.new_page()
+        page.insert_textbox(fitz.Rect(72, 72, 540, 770), lecture_text(words_per_page, seed=page_num), fontsize=9)
+    return pdf_doc.tobytes()
+
+# PPTX with slide_count slides of words_per_slide words each
+def make_pptx(slide_count: int, words_per_slide: int = 60) -> bytes:
+    presentation = Presentation()
+    for slide_num in range(slide_count):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        textbox = slide.shapes.add_textbox(Inches(0.5), Inches(0.5), Inches(9), Inches(6.5))
+        textbox.text = lecture_text(words_per_slide, seed=slide_num)
+    output = BytesIO()
+    presentation.save(output)
+    return output.getvalue()
@@ -0,0 +1,82 @@
+import asyncio
+import math
+import time
+
+# Load generation and reporting for the benchmarks. A scenario is an async function that sends one
+# request and returns the response. run_level keeps concurrency requests in flight until total have
+# been sent, and reports the latency percentiles and throughput.
+
+def percentile(values: list, fraction: float) -> float:
+    # Nearest rank, so the result is always one of the measured values
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+def summarise_latencies(latencies: list, errors: int, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "requests_per_second": round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+# Sends total requests from scenario, concurrency at a time. A request counts as an error if it
+# raises or the response status isn't 2xx. Only successful requests go into the percentiles.
+async def run_level(scenario, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = total
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            request_number = total - remaining
+            started = time.perf_counter()
+            try:
+                response = await scenario(request_number)
+                ok = 200 <= response.status_code < 300
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return summarise_latencies(latencies, errors, time.perf_counter() - started)
+
+# Compares results with a saved baseline. A result regresses if its p95 latency goes up, or its
+# requests per second goes down, by more than tolerance (a fraction), or if it has more errors.
+# Returns a list of messages, one per regression. Results missing from either side are skipped.
+def compare_results(baseline: dict, results: dict, tolerance: float = 0.2) -> list:
+    regressions = []
+    for scenario, levels in baseline.items():
+        for concurrency, expected in levels.items():
+            actual = results.get(scenario, {}).get(concurrency)
+            if actual is None:
+                continue
+            name = f"{scenario} @ {concurrency}"
+            if actual["p95_ms"] > expected["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {actual['p95_ms']}ms vs {expected['p95_ms']}ms baseline")
+            if actual["requests_per_second"] < expected["requests_per_second"] * (1 - tolerance):
+                regressions.append(f"{name}: {actual['requests_per_second']} req/s vs {expected['requests_per_second']} req/s baseline")
+            if actual["errors"] > expected["errors"]:
+                regressions.append(f"{name}: {actual['errors']} errors vs {expected['errors']} baseline")
+    return regressions
+
+# Plain text table of the results, one row per scenario and concurrency level
+def format_results(results: dict) -> str:
+    lines = [f"{'scenario':<24}{'conc':>6}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+    for scenario, levels in results.items():
+        for concurrency, result in levels.items():
+            lines.append(
+                f"{scenario:<24}{concurrency:>6}{result['requests']:>7}{result['errors']:>8}"
+                f"{result['requests_per_second']:>10}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,193 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+# Load tests the API in-process, so results are reproducible and don't depend on a GPU or a MongoDB
+# server. The LLM is a FakeLLM with a fixed per-token latency and MongoDB is replaced by mongomock
+# (or a real server with --mongo-uri). Uploads are generated PDF and PPTX files of several sizes.
+#
+# Reports p50/p95/p99 latency and requests/sec for /summarise, /upload, /evaluate, /login and
+# /upload-history at each concurrency level. Results can be saved as a baseline and compared
+# against later, e.g. in CI:
+#
+#   cd backend
+#   python -m benchmarks.run_benchmarks --save benchmarks/baseline.json
+#   python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json --tolerance 0.25
+#
+# Comparing exits with status 1 if any result regressed by more than the tolerance.
+
+SCENARIOS = ("summarise", "upload", "evaluate", "login", "upload_history")
+EMAIL = "benchmark@example.com"
+PASSWORD = "benchmark-password"
+
+def parse_args(argv: list):
+    parser = argparse.ArgumentParser(description="Benchmark the LessonQA API in-process with a fake LLM.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=40, help="Requests sent at each concurrency level")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated scenarios to run")
+    parser.add_argument("--pages", default="5,25", help="Comma separated PDF sizes (pages) for /summarise")
+    parser.add_argument("--slides", type=int, default=10, help="Slides in the PPTX used for /summarise")
+    parser.add_argument("--token-latency", type=float, default=0.002, help="Seconds per token generated by the fake LLM")
+    parser.add_argument("--first-token-latency", type=float, default=0.02, help="Seconds before the fake LLM's first token")
+    parser.add_argument("--history-lectures", type=int, default=200, help="Lectures stored for the benchmark user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=None, help="BCRYPT_ROUNDS for /login (defaults to the server's)")
+    parser.add_argument("--with-cache", action="store_true", help="Keep the LLM response cache on (repeated requests become hits)")
+    parser.add_argument("--mongo-uri", default=None, help="Use this MongoDB server instead of mongomock")
+    parser.add_argument("--save", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="Compare the results with this baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression against the baseline, as a fraction")
+    return parser.parse_args(argv)
+
+def split_ints(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+# The server reads its configuration from the environment on import, so this has to run first.
+def configure_environment(args):
+    backend = {"type": "fake", "model": "fake", "token_latency": args.token_latency, "first_token_latency": args.first_token_latency}
+    os.environ["LLM_BACKENDS"] = json.dumps([backend])
+    os.environ["LLM_HEALTH_CHECK_INTERVAL"] = "0"
+    os.environ.setdefault("SECRET_AUTH_KEY", "benchmark-secret-key-not-for-production")
+    # Every request comes from the same client, which would otherwise hit the per-client auth limit.
+    os.environ.setdefault("AUTH_MAX_CONCURRENT_PER_KEY", "1000")
+    if args.bcrypt_rounds is not None:
+        os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    if args.mongo_uri:
+        os.environ["MONGO_DB_CONNECTION_STRING"] = args.mongo_uri
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        import utilities.mongodb_helper as mongodb_helper
+        mongodb_helper.AsyncIOMotorClient = lambda *_, **__: AsyncMongoMockClient()
+
+# Registers the benchmark user, logs in and stores history_lectures lectures for /upload-history.
+# Returns the auth headers.
+async def seed(server, client, history_lectures: int) -> dict:
+    await server.mdb.get_user_collection().delete_many({"email": EMAIL})
+    response = await client.post("/register", json={"username": "benchmark", "email": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    response = await client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    user = await server.mdb.get_user_collection().find_one({"email": EMAIL})
+    await server.mdb.get_lecture_collection().delete_many({"user_id": user["_id"]})
+    now = datetime.now(timezone.utc)
+    if history_lectures:
+        await server.mdb.get_lecture_collection().insert_many([
+            {
+                "user_id": user["_id"],
+                "lecture_summary": f"Lecture {number}",
+                "lecture_file_name": f"lecture-{number}.pdf",
+                "created_at": now - timedelta(minutes=number),
+                "response_count": 0,
+                "summaries": []
+            }
+            for number in range(history_lectures)
+        ])
+    return headers
+
+# Builds the request function for each scenario. The number of the request is put into the text
+# sent to the LLM, so each request is new to the response cache.
+def build_scenarios(client, headers: dict, args) -> dict:
+    from benchmarks.fixtures import make_pdf, make_pptx, lecture_text
+
+    scenarios = {}
+
+    def summarise_file(file_name: str, content: bytes, content_type: str):
+        async def scenario(number: int):
+            return await client.post(
+                "/summarise",
+                data={"lecture_summary": f"Benchmark request {number}."},
+                files={"file": (file_name, content, content_type)}
+            )
+        return scenario
+
+    for pages in split_ints(args.pages):
+        scenarios[f"summarise_pdf_{pages}p"] = summarise_file(f"lecture-{pages}.pdf", make_pdf(pages), "application/pdf")
+    if args.slides:
+        scenarios[f"summarise_pptx_{args.slides}s"] = summarise_file(
+            f"lecture-{args.slides}.pptx",
+            make_pptx(args.slides),
+            "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+        )
+
+    summaries = [lecture_text(80, seed=seed) for seed in range(5)]
+
+    async def upload(number: int):
+        return await client.post("/upload", data={"summaries": json.dumps([f"{summary} ({number})" for summary in summaries])})
+
+    async def evaluate(number: int):
+        return await client.post(
+            "/evaluate",
+            data={"question": f"What is photosynthesis? ({number})", "answer": lecture_text(60, seed=number)},
+            headers=headers
+        )
+
+    async def login(number: int):
+        return await client.post("/login", json={"email": EMAIL, "password": PASSWORD})
+
+    async def upload_history(number: int):
+        return await client.get("/upload-history", headers=headers)
+
+    scenarios.update({"upload": upload, "evaluate": evaluate, "login": login, "upload_history": upload_history})
+    return scenarios
+
+def selected(name: str, wanted: set) -> bool:
+    return name in wanted or (name.startswith("summarise_") and "summarise" in wanted)
+
+async def run(args) -> dict:
+    import httpx
+    import server
+    from benchmarks.load import run_level
+
+    results = {}
+    async with server.lifespan(server.app):
+        if not args.with_cache:
+            server.llm.cache = None
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            headers = await seed(server, client, args.history_lectures)
+            wanted = {name.strip() for name in args.scenarios.split(",") if name.strip()}
+            for name, scenario in build_scenarios(client, headers, args).items():
+                if not selected(name, wanted):
+                    continue
+                # One request first, so one-off startup costs (worker processes, imports) aren't measured
+                await scenario(0)
+                results[name] = {}
+                for concurrency in split_ints(args.concurrency):
+                    results[name][str(concurrency)] = await run_level(scenario, concurrency, max(args.requests, concurrency))
+                    print(f"{name} @ {concurrency}: {results[name][str(concurrency)]}", file=sys.stderr)
+    return results
+
+def main(argv: list = None) -> int:
+    args = parse_args(argv if argv is not None else sys.argv[1:])
+    configure_environment(args)
+    from benchmarks.load import compare_results, format_results
+
+    results = asyncio.run(run(args))
+    print(format_results(results))
+
+    settings = {key: getattr(args, key) for key in ("requests", "pages", "slides", "token_latency", "first_token_latency", "history_lectures", "bcrypt_rounds", "with_cache")}
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"settings": settings, "results": results}, file, indent=2)
+        print(f"Saved results to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get("settings") != settings:
+            print(f"Warning: baseline was recorded with different settings: {baseline.get('settings')}")
+        regressions = compare_results(baseline["results"], results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
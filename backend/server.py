@@ -1,31 +1,161 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, status, Depends, Request, Query
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from bson import ObjectId
 from datetime import datetime, timezone
 from utilities.models import *
-from utilities.llm import LLM
 from utilities.mongodb_helper import MongoDBHelper
 from utilities.auth_helpers import AuthHelpers
-from utilities.extraction_tool import ExtractionTool
-from utilities.ollama_llm import OllamaLLM
+from utilities.extraction_tool import ExtractionTool, ExtractionError, ExtractionLimitError
+from utilities.llm_router import LLMRouter
+from utilities.summarisation_pipeline import SummarisationPipeline, SummarisationError
+from utilities.bounded_executor import QueueFullError
+from utilities.concurrency_limiter import ConcurrencyLimiter, TooManyRequestsError
+from utilities.streaming import ndjson_response, token_events, text_events
+from utilities.response_cache import ResponseCache
+from utilities.prompt_registry import PromptRegistry
+from utilities.job_queue import SummarisationJobQueue
+from utilities.question_pool import QuestionPool, lecture_content_prompt
+from utilities.bulk_evaluation import BulkEvaluator
+from utilities.write_behind import WriteBehindBuffer
+from utilities.student_response_writer import StudentResponseWriter, StudentResponseWriteError
+from utilities.embedding_index import EmbeddingIndexStore
+from utilities.summary_manifest import SummaryManifests
+from utilities.chunker import Chunk, fingerprint
+from utilities.observability import HTTP_REQUESTS_IN_FLIGHT, HTTP_REQUEST_SECONDS, QUEUE_DEPTH, trace_id, new_trace_id, render_metrics, log
+from utilities.pagination import NEWEST_FIRST, InvalidCursorError, after_cursor, paginate
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
 from typing import List
 import json
+import os
 import random
+import time
 from typing import Optional
 
+# Startup tasks, run once before the server starts accepting requests...
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await mdb.ensure_indexes()
+    await response_cache.ensure_indexes()
+    await summarisation_jobs.ensure_indexes()
+    await question_pool.ensure_indexes()
+    await summary_manifests.ensure_indexes()
+    summarisation_jobs.start(summarisation_job_workers)
+    llm.start()
+    student_response_writer.start()
+    yield
+    await summarisation_jobs.stop()
+    # Writes whatever is still buffered before the MongoDB client goes away
+    await student_response_writer.stop()
+    await question_pool.stop()
+    await llm.stop()
+    extraction_tool.shutdown()
+    auth_helpers.shutdown()
+
 # Setting up my classes...
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+load_dotenv()
 
-## LLM() = LLM class that uses GGUF model with llama-cpp-python. ***ONLY UNCOMMENT AND USE IF YOUR HARDWARE CAN SUPPORT THIS***
-#llm = LLM()
+# prompts.yaml is parsed once. Set PROMPTS_WATCH_INTERVAL (seconds) to reload it automatically when it changes.
+prompt_registry = PromptRegistry("./prompts/prompts.yaml", watch_interval=float(os.getenv("PROMPTS_WATCH_INTERVAL", "0")))
 
-## OllamaLLM() = LLM class that uses Ollama with llama3.2. ***USE ON LESS POWERFUL SYSTEMS***
-llm = OllamaLLM()
+## LLM_BACKENDS is a JSON list of the LLM backends requests are spread over, e.g.
+##   [{"type": "ollama", "host": "http://gpu1:11434", "model": "llama3.2:1b", "tasks": ["summarise", "merge_summaries"]},
+##    {"type": "ollama", "host": "http://gpu2:11434", "model": "llama3.1:8b", "tasks": ["query", "evaluate"]}]
+## Types are "ollama" (OllamaLLM, ***USE ON LESS POWERFUL SYSTEMS***), "llama_cpp" (LLM class that uses a GGUF model with
+## llama-cpp-python, ***ONLY USE IF YOUR HARDWARE CAN SUPPORT THIS***) and "fake" (FakeLLM, for local testing without a model).
+## Backends without "tasks" serve every task. The default is a single local Ollama server with llama3.2.
+llm = LLMRouter.from_config(
+    json.loads(os.getenv("LLM_BACKENDS", "[]")) or [{"type": "ollama"}],
+    prompt_registry=prompt_registry,
+    health_check_interval=float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "30"))
+)
 
 mdb = MongoDBHelper()
 auth_helpers = AuthHelpers()
-extraction_tool = ExtractionTool()
+QUEUE_DEPTH.labels("bcrypt").set_function(lambda: auth_helpers.executor.queued)
+
+# At most AUTH_MAX_CONCURRENT_PER_KEY logins/registrations can be in progress at once per client IP and per email.
+auth_limiter = ConcurrencyLimiter(max_per_key=int(os.getenv("AUTH_MAX_CONCURRENT_PER_KEY", "2")))
+
+# Documents are parsed in a process pool of EXTRACTION_WORKERS processes. Uploads over
+# EXTRACTION_MAX_PAGES pages or EXTRACTION_MAX_MB megabytes are rejected. Uploads are spooled to
+# temporary files in EXTRACTION_SPOOL_DIR (the system's temporary directory if unset) and parsed from there.
+extraction_tool = ExtractionTool(
+    max_workers=int(os.getenv("EXTRACTION_WORKERS", "4")),
+    max_pages=int(os.getenv("EXTRACTION_MAX_PAGES", "500")),
+    max_bytes=int(os.getenv("EXTRACTION_MAX_MB", "100")) * 1024 * 1024,
+    spool_directory=os.getenv("EXTRACTION_SPOOL_DIR") or None
+)
+
+# Cache summaries and evaluations so re-uploaded lectures don't need the LLM again. Entries are
+# kept in memory (LLM_CACHE_MAX_ENTRIES) and in MongoDB for LLM_CACHE_TTL_DAYS.
+response_cache = ResponseCache(
+    mdb.get_llm_cache_collection(),
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_DAYS", "30")) * 24 * 60 * 60
+)
+llm.cache = response_cache
+
+# Number of chunks summarised at once. Should match the number of parallel slots the backend
+# is configured with (OLLAMA_NUM_PARALLEL for Ollama, 1 for a single llama.cpp instance).
+summarisation_pipeline = SummarisationPipeline(llm, concurrency=int(os.getenv("SUMMARISE_CONCURRENCY", "4")))
+
+# Map-reduce summarisation: default size of the final output, and how much text is merged per LLM call (tokens).
+summary_token_budget = int(os.getenv("SUMMARY_TOKEN_BUDGET", "1024"))
+summary_group_token_budget = int(os.getenv("SUMMARY_GROUP_TOKEN_BUDGET", "2048"))
+
+# Background summarisation jobs (/summarise/jobs), stored in MongoDB. SUMMARISE_JOB_WORKERS jobs are
+# run at once by this server. A job whose worker stops renewing its lease for SUMMARISE_JOB_LEASE_SECONDS
+# is picked up again, continuing from its last finished chunk.
+summarisation_jobs = SummarisationJobQueue(
+    mdb.get_summarisation_job_collection(),
+    mdb.get_summarisation_job_chunk_collection(),
+    summarisation_pipeline,
+    lease_seconds=float(os.getenv("SUMMARISE_JOB_LEASE_SECONDS", "60")),
+    max_attempts=int(os.getenv("SUMMARISE_JOB_MAX_ATTEMPTS", "3"))
+)
+summarisation_job_workers = int(os.getenv("SUMMARISE_JOB_WORKERS", "1"))
+
+# Each stored lecture gets an embedding index of its chunk summaries. Generated questions and
+# evaluations for the lecture include the RETRIEVAL_TOP_K chunks most relevant to them, rather
+# than the whole lecture, so prompts stay short however long the lecture is.
+embedding_index = EmbeddingIndexStore(mdb.get_lecture_embedding_collection(), max_cached=int(os.getenv("EMBEDDING_INDEX_CACHE_SIZE", "64")))
+retrieval_top_k = int(os.getenv("RETRIEVAL_TOP_K", "3"))
+
+# Student questions are generated ahead of time for each stored lecture. QUESTION_POOL_SIZE are kept
+# ready and the pool is topped up once fewer than QUESTION_POOL_LOW_WATER_MARK are left.
+question_pool = QuestionPool(
+    mdb.get_question_pool_collection(),
+    mdb.get_lecture_collection(),
+    llm,
+    prompt_registry,
+    pool_size=int(os.getenv("QUESTION_POOL_SIZE", "20")),
+    low_water_mark=int(os.getenv("QUESTION_POOL_LOW_WATER_MARK", "5")),
+    concurrency=int(os.getenv("QUESTION_POOL_CONCURRENCY", "2")),
+    embedding_index=embedding_index,
+    retrieval_top_k=retrieval_top_k
+)
+
+# /evaluate/bulk grades up to BULK_EVALUATE_MAX_ITEMS answers per request, BULK_EVALUATE_CONCURRENCY at a time.
+bulk_evaluator = BulkEvaluator(llm, concurrency=int(os.getenv("BULK_EVALUATE_CONCURRENCY", "4")))
+bulk_evaluate_max_items = int(os.getenv("BULK_EVALUATE_MAX_ITEMS", "200"))
+
+# Student responses recorded by /evaluate are written behind: batches of up to STUDENT_RESPONSE_BATCH_SIZE
+# are flushed to MongoDB every STUDENT_RESPONSE_FLUSH_INTERVAL seconds (or as soon as a batch fills).
+student_responses = StudentResponseWriter(mdb.get_student_response_collection(), mdb.get_lecture_collection())
+student_response_writer = WriteBehindBuffer(
+    student_responses.write,
+    max_batch=int(os.getenv("STUDENT_RESPONSE_BATCH_SIZE", "100")),
+    flush_interval=float(os.getenv("STUDENT_RESPONSE_FLUSH_INTERVAL", "0.5"))
+)
+QUEUE_DEPTH.labels("student_responses").set_function(lambda: len(student_response_writer.pending))
+
+# The chunks and summaries of the last upload of each file, so re-uploading an edited deck only
+# summarises the chunks holding pages that changed.
+summary_manifests = SummaryManifests(mdb.get_summary_manifest_collection())
 
 # Added middleware to server to avoid CORS issues. 
 app.add_middleware(
@@ -36,53 +166,243 @@ app.add_middleware(
     allow_headers=["*"],                   
 )
 
-# Route for summarizing content from uploaded files or provided lecture summaries
+# Records request latency and the number of requests in flight, and gives every request a trace id
+# (the client's X-Request-ID if it sent one). Log lines written while handling the request are
+# prefixed with the trace id, and it is sent back in the X-Request-ID response header.
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    request_trace_id = request.headers.get("X-Request-ID") or new_trace_id()
+    trace_id.set(request_trace_id)
+    HTTP_REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        HTTP_REQUESTS_IN_FLIGHT.dec()
+        # Labelled with the route's path template (e.g. /upload-history/{lecture_id}) rather than the
+        # actual path, so lecture and job ids don't create a new series each.
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.labels(request.method, route.path if route else "unmatched", str(status_code)).observe(time.perf_counter() - started)
+    response.headers["X-Request-ID"] = request_trace_id
+    return response
+
+# If an LLM backend has too many requests waiting, tell the client to retry later instead of queueing forever.
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request, exc: QueueFullError):
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)})
+
+# Too many logins/registrations in progress from the same client IP or for the same email...
+@app.exception_handler(TooManyRequestsError)
+async def too_many_requests_handler(request, exc: TooManyRequestsError):
+    return JSONResponse(status_code=status.HTTP_429_TOO_MANY_REQUESTS, content={"detail": str(exc)})
+
+# A map-reduce merge failed on every attempt...
+@app.exception_handler(SummarisationError)
+async def summarisation_error_handler(request, exc: SummarisationError):
+    return JSONResponse(status_code=status.HTTP_502_BAD_GATEWAY, content={"detail": str(exc)})
+
+# Uploads over the page/size limits, or that can't be parsed at all...
+@app.exception_handler(ExtractionError)
+async def extraction_error_handler(request, exc: ExtractionError):
+    if isinstance(exc, ExtractionLimitError):
+        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, content={"detail": str(exc)})
+    return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"detail": str(exc)})
+
+# Key used to share LLM capacity fairly between callers of routes that don't require a login.
+def client_key(request: Request) -> str:
+    return f"client:{request.client.host}" if request.client else None
+
+# Returns a stream of the pages (or slides) of an uploaded file. Unsupported file types and files
+# over the size limit are rejected here, before any response has started. The upload is copied to
+# a temporary file in fixed size pieces and parsed from disk, so a large deck is never held in
+# memory as a whole; the file is removed once its pages have been read.
+async def get_page_stream(file: UploadFile):
+    if file.content_type == "application/pdf":  # Check if the file type is a PDF
+        extract = extraction_tool.aiter_pdf_pages
+    elif file.content_type in ["application/vnd.openxmlformats-officedocument.presentationml.presentation", "application/vnd.ms-powerpoint"]:  # Check if the file is a PowerPoint
+        extract = extraction_tool.aiter_pptx_slides
+    else:
+        # Raise an error if the file type is unsupported
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Unsupported file type. Please upload a PDF or PowerPoint file."
+        )
+    spooled = await extraction_tool.spool_upload(file)
+    return spooled.stream(extract(spooled.path))
+
+# Chunks a manual lecture summary and/or the pages of an uploaded file. Chunks are yielded as soon
+# as they are ready, so summarisation starts while later pages are still being extracted.
+# Uploads are chunked page-aligned, so the chunks of pages that haven't changed since the file was
+# last uploaded come out the same and their summaries can be reused.
+# Shared by the regular and streaming summarise routes.
+async def iter_lecture_chunks(lecture_summary: Optional[str], pages, page_aligned: bool = False):
+    # Check if a lecture summary has been provided and process it
+    if lecture_summary:
+        for chunk in llm.split_text(lecture_summary):
+            yield chunk
+
+    # Then the chunks of the uploaded file, with the pages they came from. Page-aligned chunks line up
+    # between uploads of an edited deck so their summaries can be reused, but are about half as big,
+    # so they're only used when the summaries will be saved in a summary manifest.
+    if pages is not None:
+        chunks = llm.chunker.aiter_page_chunks(pages) if page_aligned else llm.chunker.aiter_chunks(pages)
+        async for chunk in chunks:
+            yield chunk
+
+# Passes chunks through, adding each to seen so they can be saved in the summary manifest afterwards
+async def record_chunks(chunks, seen: list):
+    async for chunk in chunks:
+        seen.append(chunk)
+        yield chunk
+
+# The models chunk summaries may come from, saved with the manifest so a model change isn't served old summaries
+def summarising_models() -> str:
+    return ",".join(llm.models_for("summarise"))
+
+# Summary manifests are kept for files uploaded by a logged in user
+def uses_summary_manifest(file: Optional[UploadFile], current_user: Optional[dict]) -> bool:
+    return file is not None and current_user is not None
+
+# Summaries from the last upload of the same file by a logged in user, by chunk fingerprint
+async def load_reusable_summaries(file: Optional[UploadFile], current_user: Optional[dict]) -> dict:
+    if not uses_summary_manifest(file, current_user):
+        return {}
+    return await summary_manifests.load(current_user["_id"], file.filename, prompt_registry.version, summarising_models())
+
+# Saves the chunks of an upload and their summaries (None for failed chunks) for the next upload
+async def save_summary_manifest(file: Optional[UploadFile], current_user: Optional[dict], chunks: list, summaries: list):
+    if uses_summary_manifest(file, current_user):
+        await summary_manifests.save(current_user["_id"], file.filename, chunks, summaries, prompt_registry.version, summarising_models())
+
+# Indexes of the chunks whose summary was reused from the last upload
+def reused_chunk_indexes(chunks: list, reuse: dict) -> list:
+    return [index for index, chunk in enumerate(chunks) if fingerprint(chunk.text if isinstance(chunk, Chunk) else chunk) in reuse]
+
+# Route for summarizing content from uploaded files or provided lecture summaries. For a logged in
+# user re-uploading a file with the same name, chunks that are unchanged since the last upload reuse
+# their summaries; their indexes are returned in reused_chunks.
 @app.post("/summarise")
 async def summarise_content(
+    request: Request,
     lecture_summary: Optional[str] = Form(None),  # Optional string for a manual lecture summary
-    file: Optional[UploadFile] = None  # Optional file upload
+    file: Optional[UploadFile] = None,  # Optional file upload
+    mode: str = Form("chunks"),  # "chunks" for one summary per chunk, "map_reduce" for a bounded hierarchical summary
+    token_budget: Optional[int] = Form(None),  # Maximum size of the map_reduce output in tokens
+    current_user: Optional[dict] = Depends(mdb.get_optional_current_user)
 ):
-    extracted_text = ""
-    extracted_split_text_list = []
-    lecture_summary_chunked_list = []
-
-    # Check if a file has been provided
-    if file:
-        file_content = await file.read()  # Read the file content as bytes
-        if file.content_type == "application/pdf":  # Check if the file type is a PDF
-            extracted_text = extraction_tool.extract_text_from_pdf(file_content)
-            extracted_split_text_list = llm.split_text(extracted_text)
-        elif file.content_type in ["application/vnd.openxmlformats-officedocument.presentationml.presentation", "application/vnd.ms-powerpoint"]:  # Check if the file is a PowerPoint
-            extracted_text = extraction_tool.extract_text_from_pptx(file_content)
-            extracted_split_text_list = llm.split_text(extracted_text)
-        else:
-            # Raise an error if the file type is unsupported
+    if mode not in ("chunks", "map_reduce"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mode must be 'chunks' or 'map_reduce'.")
+
+    pages = await get_page_stream(file) if file else None
+    reuse = await load_reusable_summaries(file, current_user)
+
+    # Create summaries for each text chunk concurrently. Order of summaries matches order of chunks.
+    chunks = []
+    chunk_summaries = await summarisation_pipeline.summarise_chunks(
+        record_chunks(iter_lecture_chunks(lecture_summary, pages, uses_summary_manifest(file, current_user)), chunks),
+        user=client_key(request),
+        reuse=reuse
+    )
+    await save_summary_manifest(file, current_user, chunks, chunk_summaries)
+    reused_chunks = reused_chunk_indexes(chunks, reuse)
+
+    # In map_reduce mode chunk summaries are merged level by level into section summaries and a
+    # single lecture summary, all within token_budget...
+    if mode == "map_reduce":
+        result = await summarisation_pipeline.reduce_summaries(
+            chunk_summaries,
+            token_budget=token_budget or summary_token_budget,
+            group_token_budget=summary_group_token_budget,
+            user=client_key(request)
+        )
+        if result["failed_chunks"] and not result["summaries"]:
             raise HTTPException(
-                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
-                detail="Unsupported file type. Please upload a PDF or PowerPoint file."
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="The LLM failed to summarise the provided content. Please try again."
             )
+        return JSONResponse(content={**result, "reused_chunks": reused_chunks})
 
-    # Check if a lecture summary has been provided and process it
-    if lecture_summary:
-        lecture_summary_chunked_list = llm.split_text(lecture_summary)
-
-    # Combine extracted and manual text chunks for summarization
-    final_chunks = lecture_summary_chunked_list + extracted_split_text_list
+    # Chunks that failed after retrying are dropped from the summaries and reported by index...
+    sentence_summaries = [summary for summary in chunk_summaries if summary is not None]
+    failed_chunks = [index for index, summary in enumerate(chunk_summaries) if summary is None]
+    if chunk_summaries and not sentence_summaries:
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="The LLM failed to summarise the provided content. Please try again."
+        )
 
-    # Create summaries for each text chunk
-    sentence_summaries = []
-    for chunk in final_chunks:
-        summary = llm.summarise(chunk)
-        sentence_summaries.append(summary)
-    
     # Return the list of generated summaries as a JSON response
-    return JSONResponse(content={"summaries": sentence_summaries})
+    return JSONResponse(content={"summaries": sentence_summaries, "failed_chunks": failed_chunks, "reused_chunks": reused_chunks})
 
-# Route for uploading and processing summaries
-@app.post("/upload")
-async def upload_content(
-    summaries: List[str] = Form([])  # Accepts a list of strings containing summaries
+# Streaming version of /summarise. Sends NDJSON events as summaries are generated: chunk_start
+# (with the source pages), token and chunk_done/chunk_failed per chunk (with completed/total counts
+# for progress bars), then a final "done" event with the same summaries and failed_chunks as /summarise.
+# Chunks reused from the last upload of the file are sent as chunk_done with "reused": true.
+@app.post("/summarise/stream")
+async def summarise_content_stream(
+    request: Request,
+    lecture_summary: Optional[str] = Form(None),
+    file: Optional[UploadFile] = None,
+    current_user: Optional[dict] = Depends(mdb.get_optional_current_user)
 ):
+    pages = await get_page_stream(file) if file else None
+    reuse = await load_reusable_summaries(file, current_user)
+
+    async def events():
+        chunks = []
+        summaries = {}
+        async for event in summarisation_pipeline.stream_chunks(record_chunks(iter_lecture_chunks(lecture_summary, pages, uses_summary_manifest(file, current_user)), chunks), user=client_key(request), reuse=reuse):
+            if event["event"] in ("chunk_done", "chunk_failed"):
+                summaries[event["index"]] = event.get("summary")
+            elif event["event"] == "done":
+                await save_summary_manifest(file, current_user, chunks, [summaries[index] for index in range(len(chunks))])
+            yield event
+
+    return ndjson_response(events())
+
+# Queues a summarisation job and returns its id straight away, instead of keeping the connection
+# open until every chunk is summarised. Takes the same form fields as /summarise. The document is
+# read and chunked before returning, so unsupported or oversized uploads are still rejected here.
+# Jobs belong to the user who submitted them and only they can see their progress.
+@app.post("/summarise/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def submit_summarise_job(
+    request: Request,
+    lecture_summary: Optional[str] = Form(None),
+    file: Optional[UploadFile] = None,
+    mode: str = Form("chunks"),
+    token_budget: Optional[int] = Form(None),
+    current_user: dict = Depends(mdb.get_current_user)
+):
+    if mode not in ("chunks", "map_reduce"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="mode must be 'chunks' or 'map_reduce'.")
+
+    pages = await get_page_stream(file) if file else None
+    job = await summarisation_jobs.submit(
+        iter_lecture_chunks(lecture_summary, pages),
+        mode=mode,
+        token_budget=token_budget or summary_token_budget,
+        group_token_budget=summary_group_token_budget,
+        user=client_key(request),
+        user_id=current_user["_id"]
+    )
+    return {"job_id": str(job["_id"]), "status": job["status"], "total_chunks": job["total_chunks"]}
+
+# Reports the progress of a summarisation job: status (queued, running, completed or failed),
+# completed_chunks out of total_chunks, and once completed the same result /summarise returns.
+@app.get("/summarise/jobs/{job_id}")
+async def get_summarise_job(job_id: str, current_user: dict = Depends(mdb.get_current_user)):
+    job = await summarisation_jobs.get(ObjectId(job_id), current_user["_id"]) if ObjectId.is_valid(job_id) else None
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    job["job_id"] = str(job.pop("_id"))
+    job.pop("user", None)
+    job.pop("user_id", None)
+    return job
+
+# Parses the summaries sent to /upload and /store-lecture, which may be a single JSON encoded list.
+def parse_summaries(summaries: List[str]) -> list:
     # Validate if the summaries list contains a single JSON string that needs parsing
     if len(summaries) == 1 and isinstance(summaries[0], str):
         try:
@@ -95,6 +415,21 @@ async def upload_content(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Invalid format for summaries. Ensure it is a valid JSON string."
             )
+    # Ensure each summary is a string for further processing
+    return [summary if isinstance(summary, str) else str(summary) for summary in summaries]
+
+# The chunks of one of the user's stored lectures most relevant to query. Empty if no lecture was
+# given, the caller isn't logged in, or the lecture has no embedding index.
+async def find_lecture_context(lecture_id: Optional[str], current_user: Optional[dict], query: str) -> list:
+    if not lecture_id or current_user is None or not ObjectId.is_valid(lecture_id):
+        return []
+    return await embedding_index.search(ObjectId(lecture_id), current_user["_id"], query, retrieval_top_k)
+
+# Builds the lecture content prompt for a student question from a random summary. For a stored
+# lecture, the chunks most related to that summary are retrieved from its embedding index and
+# included too, so the question can draw on nearby material.
+async def build_question_prompt(summaries: List[str], lecture_id: Optional[str] = None, current_user: Optional[dict] = None) -> str:
+    summaries = parse_summaries(summaries)
 
     # Raise an error if the summaries list is empty
     if not summaries:
@@ -107,13 +442,33 @@ async def upload_content(
     random_index = random.randint(0, len(summaries) - 1)
     random_summary = summaries[random_index]
 
-    # Ensure the selected summary is a string for further processing
-    if not isinstance(random_summary, str):
-        random_summary = str(random_summary)
+    # Combine the selected summary (and its related chunks) with additional text for querying the LLM
+    context = await find_lecture_context(lecture_id, current_user, random_summary)
+    return lecture_content_prompt(random_summary, context)
+
+# Takes a pre-generated question for a stored lecture from the question pool. Returns None if no
+# lecture was given, the caller isn't logged in, or the pool for that lecture is empty.
+async def take_pooled_question(lecture_id: Optional[str], current_user: Optional[dict]) -> Optional[str]:
+    if not lecture_id or current_user is None or not ObjectId.is_valid(lecture_id):
+        return None
+    return await question_pool.take(ObjectId(lecture_id), current_user["_id"])
+
+# Route for uploading and processing summaries. If the id of a stored lecture is sent by a logged
+# in user, a question from that lecture's question pool is returned straight away. Otherwise (or if
+# the pool has run dry) a question is generated from one of the summaries.
+@app.post("/upload")
+async def upload_content(
+    request: Request,
+    summaries: List[str] = Form([]),  # Accepts a list of strings containing summaries
+    lecture_id: Optional[str] = Form(None),
+    current_user: Optional[dict] = Depends(mdb.get_optional_current_user)
+):
+    pooled_question = await take_pooled_question(lecture_id, current_user)
+    if pooled_question:
+        return JSONResponse(content={"message": pooled_question})
 
-    # Combine the selected summary with additional text for querying the LLM
-    text_and_file = f"Lecture Content: {random_summary}"
-    response = llm.query(query=text_and_file)
+    text_and_file = await build_question_prompt(summaries, lecture_id, current_user)
+    response = await llm.aquery(query=text_and_file, user=client_key(request))
 
     # Handle cases where the LLM does not return a response
     if not response:
@@ -122,58 +477,153 @@ async def upload_content(
     # Return the LLM's response as a JSON response
     return JSONResponse(content={"message": response})
 
+# Streaming version of /upload. Sends the generated question token by token as NDJSON,
+# ending with a "done" event whose "message" matches the /upload response.
+@app.post("/upload/stream")
+async def upload_content_stream(
+    request: Request,
+    summaries: List[str] = Form([]),
+    lecture_id: Optional[str] = Form(None),
+    current_user: Optional[dict] = Depends(mdb.get_optional_current_user)
+):
+    pooled_question = await take_pooled_question(lecture_id, current_user)
+    if pooled_question:
+        return ndjson_response(text_events(pooled_question, "message"))
+
+    text_and_file = await build_question_prompt(summaries, lecture_id, current_user)
+    return ndjson_response(token_events(llm.astream_query(query=text_and_file, user=client_key(request)), "message"))
+
 # The evaluate route takes in a question from the LLM on the lecture material, the response to the question by the
 # lecturer, and evalutes the response based on the question, providing feedback and recommendations.
+# If the id of the stored lecture is sent, the lecture chunks most relevant to the question and answer are included.
+# With store, the question, answer and evaluation are also recorded as a student response on the lecture (replacing
+# a separate /store-student-response call). The write goes through the write-behind buffer, so the response doesn't
+# wait for it.
 @app.post("/evaluate")
 async def evaluate_answer(
     question: str = Form(...), 
     answer: str = Form(...), 
+    lecture_id: Optional[str] = Form(None),
+    store: bool = Form(False),
+    current_user: dict = Depends(mdb.get_current_user)
+):
+    # Checked before evaluating, so a request for someone else's lecture doesn't use the LLM
+    lecture = await find_user_lecture(lecture_id, current_user["_id"], {"_id": 1}) if store else None
+    context = await find_lecture_context(lecture_id, current_user, f"{question}\n{answer}")
+    evaluation_result = await llm.aevaluate(question, answer, user=str(current_user["_id"]), context=context)
+    if lecture is None or not evaluation_result:
+        return {"evaluation": evaluation_result}
+
+    # The id is chosen here so that writing the same document again after a failed flush is harmless
+    document = {"_id": ObjectId(), **build_student_response(lecture["_id"], current_user["_id"], question, answer, evaluation_result)}
+    if not student_response_writer.add(document):
+        # The buffer is full or shutting down, write it directly instead
+        await student_responses.write([document])
+    return {"evaluation": evaluation_result, "stored": True}
+
+# Streaming version of /evaluate. Sends the evaluation token by token as NDJSON, ending with
+# a "done" event whose "evaluation" matches the /evaluate response.
+@app.post("/evaluate/stream")
+async def evaluate_answer_stream(
+    question: str = Form(...),
+    answer: str = Form(...),
+    lecture_id: Optional[str] = Form(None),
     current_user: dict = Depends(mdb.get_current_user)
 ):
-    evaluation_result = llm.evaluate(question, answer)
-    return {"evaluation": evaluation_result}
+    context = await find_lecture_context(lecture_id, current_user, f"{question}\n{answer}")
+    return ndjson_response(token_events(llm.astream_evaluate(question, answer, user=str(current_user["_id"]), context=context), "evaluation"))
+
+# Grades many answers to questions on one lecture in a single request, e.g. a whole class. Takes a JSON body with
+# lecture_id and a list of question/answer items, and streams NDJSON: item_done (with the evaluation) or item_failed
+# for each item as it finishes, with completed/total counts, then a "done" event with the result of every item in
+# order. Unless store is false, the graded answers are saved to the lecture's student responses in one bulk write,
+# and "done" says how many were stored (with a store_error if some couldn't be).
+@app.post("/evaluate/bulk")
+async def evaluate_bulk(body: BulkEvaluationModel, current_user: dict = Depends(mdb.get_current_user)):
+    if not body.items:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="At least one item is required.")
+    if len(body.items) > bulk_evaluate_max_items:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {bulk_evaluate_max_items} items can be graded at once.")
+    lecture = await find_user_lecture(body.lecture_id, current_user["_id"], {"_id": 1})
+
+    async def get_context(item: EvaluationItemModel) -> list:
+        return await find_lecture_context(body.lecture_id, current_user, f"{item.question}\n{item.answer}")
+
+    async def events():
+        async for event in bulk_evaluator.stream(body.items, user=str(current_user["_id"]), get_context=get_context):
+            if event["event"] == "done":
+                event["stored"] = 0
+                if body.store:
+                    try:
+                        event["stored"] = await store_student_responses(lecture["_id"], current_user["_id"], body.items, event["results"])
+                    except Exception as e:
+                        # The evaluations are still sent, with how many of them were saved before the error
+                        log(f"Error storing bulk evaluation responses for lecture {lecture['_id']}: {e}")
+                        event["stored"] = e.inserted if isinstance(e, StudentResponseWriteError) else 0
+                        event["store_error"] = "Some evaluations couldn't be saved. Please try storing them again."
+            yield event
+
+    return ndjson_response(events())
 
 # The store-lecture route is responsible for storing the history of the interactions the user has with the LLM
-# in the application. It stores their uploaded lecture summary and lecture file name in the "user_message_history"
-# collection. Each user has one entry in this collection, however this entry is broken down further and each new interaction
-# is appended to the entry in the form of a list.
+# in the application. It stores their uploaded lecture summary and lecture file name as a new document in the
+# "lectures" collection. Each lecture is its own document, so storing one never touches the user's earlier history.
+# If the chunk summaries are sent too, they are indexed for retrieval and saved for the lecture's question pool.
+# The pool starts filling when the first question for the lecture is asked for rather than here, so the page's
+# first questions aren't competing with it for the LLM.
 @app.post("/store-lecture")
 async def store_lecture(
     lecture_summary: str = Form(...),          
     lecture_file_name: str = Form(...),        
+    summaries: List[str] = Form([]),
     current_user: dict = Depends(mdb.get_current_user)
 ):
     # Generating an unique entry for each lecture for the user...
     lecture_entry = {
         "_id": ObjectId(),  
+        "user_id": current_user["_id"],
         "lecture_summary": lecture_summary,
         "lecture_file_name": lecture_file_name,  
         "created_at": datetime.now(timezone.utc),
-        "students": []  # Students list holds the questions, answers and evaluations for each lecture/interaction.
+        "response_count": 0,  # Number of documents in student_responses for this lecture.
+        "summaries": parse_summaries(summaries)  # Used to generate the lecture's question pool.
     }
-    
-    user_history = await mdb.get_user_message_history_collection().find_one({"user_id": current_user["_id"]})
-    
-    # If entry already, append the new interaction to the lectures list...
-    if user_history:
-        await mdb.get_user_message_history_collection().update_one(
-            {"user_id": current_user["_id"]},
-            {"$push": {"lectures": lecture_entry}}
-        )
-    # If no entry for a user yet, create one...
-    else:
-        new_user_history = {
-            "user_id": current_user["_id"],
-            "username": current_user["username"],
-            "email": current_user["email"],
-            "lectures": [lecture_entry]
-        }
-        await mdb.get_user_message_history_collection().insert_one(new_user_history)
+    await mdb.get_lecture_collection().insert_one(lecture_entry)
+    if lecture_entry["summaries"]:
+        try:
+            await embedding_index.build(lecture_entry["_id"], current_user["_id"], lecture_entry["summaries"])
+        except Exception as e:
+            # The lecture is still usable without its index, questions and evaluations just aren't grounded.
+            log(f"Error building embedding index for lecture {lecture_entry['_id']}: {e}")
 
     return {"message": "Lecture stored successfully", "lecture_id": str(lecture_entry["_id"])}
 
+# Builds the student_responses document for one question, answer and evaluation on a lecture
+def build_student_response(lecture_id: ObjectId, user_id: ObjectId, question: str, response: str, evaluation: str) -> dict:
+    return {
+        "lecture_id": lecture_id,
+        "user_id": user_id,
+        "question": question,
+        "response": response,
+        "evaluation": evaluation,
+        "created_at": datetime.now(timezone.utc)
+    }
+
+# Stores the graded items of a bulk evaluation as student responses in one insert, and counts them on the
+# lecture. Items that failed to evaluate are skipped. Returns how many were stored; if only some could be,
+# StudentResponseWriteError says how many.
+async def store_student_responses(lecture_id: ObjectId, user_id: ObjectId, items: list, results: list) -> int:
+    documents = [
+        {"_id": ObjectId(), **build_student_response(lecture_id, user_id, item.question, item.answer, result["evaluation"])}
+        for item, result in zip(items, results)
+        if result["evaluation"] is not None
+    ]
+    if not documents:
+        return 0
+    return await student_responses.write(documents)
+
 # This route is responsible for storing the questions from the LLM, the response from the user and the evaluation from
-# the LLM for each interaction in the "students" list, and each "lecture" will have an associated "students" array...
+# the LLM for each interaction. Each one is a separate document in "student_responses" linked to its lecture...
 @app.post("/store-student-response")
 async def store_student_response(
     lecture_id: str = Form(...),
@@ -186,65 +636,144 @@ async def store_student_response(
     # Check to ensure all entities are present before storing...
     if not all([lecture_id, question, response, evaluation]):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="All fields are required")
-    
-    student_entry = {
-        "question": question,
-        "response": response,
-        "evaluation": evaluation
-    }
 
-    # Uses user_id and lecture_id in collection to insert each new evaluation record...
-    result = await mdb.get_user_message_history_collection().update_one(
-        {
-            "user_id": current_user["_id"],
-            "lectures._id": ObjectId(lecture_id)
-        },
-        {
-            "$push": {"lectures.$.students": student_entry}
-        }
-    )
-    # If no records found for a particular update call, raise an error...
-    if result.matched_count == 0:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lecture not found")
+    # Makes sure the lecture belongs to this user...
+    lecture = await find_user_lecture(lecture_id, current_user["_id"], {"_id": 1})
+
+    # Inserts the response, then counts it on the lecture, so a failed insert is never counted
+    await student_responses.write([
+        {"_id": ObjectId(), **build_student_response(lecture["_id"], current_user["_id"], question, response, evaluation)}
+    ])
     
     return {"message": "Student response stored successfully"}
 
-# This route serves the "History" page in the frontend. It pulls data from the user_message_history collection
-# and displays it accordingly for each user on the page.
+# Fields sent for each lecture in the history list. The summary and student responses are only
+# sent by the detail route, when a lecture is opened.
+LECTURE_LIST_PROJECTION = {"lecture_file_name": 1, "created_at": 1, "response_count": 1}
+LECTURE_DETAIL_PROJECTION = {"user_id": 0, "summaries": 0}
+STUDENT_RESPONSE_PROJECTION = {"_id": 0, "question": 1, "response": 1, "evaluation": 1, "created_at": 1}
+
+# Finds one of the user's lectures by its id, raising 404 if it doesn't exist or isn't theirs
+async def find_user_lecture(lecture_id: str, user_id: ObjectId, projection: dict = None) -> dict:
+    lecture = None
+    if ObjectId.is_valid(lecture_id):
+        lecture = await mdb.get_lecture_collection().find_one({"_id": ObjectId(lecture_id), "user_id": user_id}, projection)
+    if lecture is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Lecture not found")
+    return lecture
+
+# Student responses for one lecture in the order they were given
+def find_student_responses(lecture_id: ObjectId, user_id: ObjectId):
+    return mdb.get_student_response_collection().find(
+        {"lecture_id": lecture_id, "user_id": user_id}, STUDENT_RESPONSE_PROJECTION
+    ).sort([("created_at", 1), ("_id", 1)])
+
+# This route serves the "History" page in the frontend. It returns one page of the user's lectures,
+# newest first, with just the file name, date and number of responses for each. next_cursor is
+# passed back as ?cursor= to get the following page and is null on the last page.
 @app.get("/upload-history")
-async def get_upload_history(current_user: dict = Depends(mdb.get_current_user)):
-    user_history = await mdb.get_user_message_history_collection().find_one({"user_id": current_user["_id"]})
-    
-    if not user_history:
+async def get_upload_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(mdb.get_current_user)
+):
+    query = {"user_id": current_user["_id"]}
+    if cursor:
+        try:
+            query.update(after_cursor(cursor))
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # One extra lecture is fetched to tell whether there is another page.
+    lectures = await mdb.get_lecture_collection().find(query, LECTURE_LIST_PROJECTION).sort(NEWEST_FIRST).limit(limit + 1).to_list(length=limit + 1)
+    if not lectures and not cursor:
         raise HTTPException(status_code=404, detail="No upload history found for this user")
-    
+
+    lectures, next_cursor = paginate(lectures, limit)
     # Converting ObjectIds in MongoDB in lectures to strings. Error thrown otherwise...
-    user_history["lectures"] = mdb.convert_object_ids(user_history["lectures"])
-    
-    return {"lectures": user_history["lectures"]}
+    return {"lectures": mdb.convert_object_ids(lectures), "next_cursor": next_cursor}
+
+# Streams the user's whole history as NDJSON for export, oldest first: a "lecture" line for each
+# lecture followed by a "student_response" line for each of its responses. Documents are read from
+# Motor cursors in batches as the client consumes them, so the full history is never held in memory
+# by the server or the browser.
+@app.get("/upload-history/export")
+async def export_upload_history(current_user: dict = Depends(mdb.get_current_user)):
+    user_id = current_user["_id"]
+
+    async def events():
+        lectures = mdb.get_lecture_collection().find({"user_id": user_id}, LECTURE_DETAIL_PROJECTION).sort([("created_at", 1), ("_id", 1)])
+        async for lecture in lectures:
+            yield {"event": "lecture", **lecture}
+            async for student_entry in find_student_responses(lecture["_id"], user_id):
+                yield {"event": "student_response", "lecture_id": lecture["_id"], **student_entry}
+
+    response = ndjson_response(events())
+    response.headers["Content-Disposition"] = 'attachment; filename="upload-history.ndjson"'
+    return response
+
+# Returns a single lecture with its summary and every student question, response and evaluation,
+# for when a lecture is opened on the "History" page.
+@app.get("/upload-history/{lecture_id}")
+async def get_upload_history_lecture(lecture_id: str, current_user: dict = Depends(mdb.get_current_user)):
+    lecture = await find_user_lecture(lecture_id, current_user["_id"], LECTURE_DETAIL_PROJECTION)
+    students = await find_student_responses(lecture["_id"], current_user["_id"]).to_list(length=None)
+    lecture = mdb.convert_object_ids(lecture)
+    lecture["students"] = students
+    return lecture
+
+# Returns hit/miss counters for the LLM response cache.
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return response_cache.stats()
+
+# Returns the state of each LLM backend (health, circuit breaker, requests in flight) and its
+# prefill/decode timings, showing how much prompt processing is saved by reusing the system prompt prefix.
+@app.get("/llm-stats")
+async def get_llm_stats():
+    return llm.stats()
+
+# Prometheus metrics: per stage latency histograms, LLM token counts and speed per backend, queue
+# depths, cache hit/miss counts and requests in flight.
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
 
 # Register route. Checks if user exists already in user_credentials collection in MongoDB. If not creates a
 # new user, hashes their password and stores it in the collection. For schema verification, I used Pydantic 
 # to ensure the schema is abided by for each new user.
 @app.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user: UserModel):
-    existing_user = await mdb.get_user_collection().find_one({"email": user.email})
-    if existing_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email is already registered")
-
-    user_data = user.dict()
-    user_data["password"] = auth_helpers.hash_password(user_data["password"])
-    result = await mdb.get_user_collection().insert_one(user_data)
+async def register_user(user: UserModel, request: Request):
+    async with auth_limiter.limit(client_key(request), f"email:{user.email.lower()}"):
+        existing_user = await mdb.get_user_collection().find_one({"email": user.email})
+        if existing_user:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email is already registered")
+
+        user_data = user.dict()
+        user_data["password"] = await auth_helpers.ahash_password(user_data["password"])
+        result = await mdb.get_user_collection().insert_one(user_data)
     
     return {"message": "User registered successfully", "user_id": str(result.inserted_id)}
 
 # Login route. Checks using email to see if user exists and then verifies the password. Creates a token
 # which is used in the frontend (stored in local storage) to allow access to particular pages and control access.
+# If the stored hash was made with a different BCRYPT_ROUNDS it is replaced with one at the current cost.
 @app.post("/login")
-async def login_user(user: UserLoginModel):
-    user_record = await mdb.get_user_collection().find_one({"email": user.email})
-    if not user_record or not auth_helpers.verify_password(user.password, user_record["password"]):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+async def login_user(user: UserLoginModel, request: Request):
+    async with auth_limiter.limit(client_key(request), f"email:{user.email.lower()}"):
+        user_record = await mdb.get_user_collection().find_one({"email": user.email})
+        if not user_record or not await auth_helpers.averify_password(user.password, user_record["password"]):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email or password")
+
+        if auth_helpers.needs_rehash(user_record["password"]):
+            new_hash = await auth_helpers.ahash_password(user.password)
+            # Only replaces the hash that was verified, in case the password changed in the meantime.
+            await mdb.get_user_collection().update_one(
+                {"_id": user_record["_id"], "password": user_record["password"]},
+                {"$set": {"password": new_hash}}
+            )
+            mdb.invalidate_user(user_record["_id"])
 
     token_data = {"user_id": str(user_record["_id"])}
     token = auth_helpers.create_access_token(data=token_data)
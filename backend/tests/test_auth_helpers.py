@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import jwt
 from datetime import datetime, timezone
@@ -51,3 +52,27 @@ def test_create_access_token(auth_helpers):
     # Allowing some drift in time (e.g., 60 seconds)
     time_diff = exp_timestamp - now_timestamp
     assert 3500 <= time_diff <= 3600
+
+def test_create_access_token_sets_issued_at(auth_helpers):
+    token = auth_helpers.create_access_token({"user_id": "123"})
+    payload = jwt.decode(token, auth_helpers.SECRET_KEY, algorithms=["HS256"])
+    assert abs(payload["iat"] - datetime.now(timezone.utc).timestamp()) < 5
+
+def test_needs_rehash_when_cost_changes(monkeypatch):
+    monkeypatch.setenv("SECRET_AUTH_KEY", "testsecret")
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")
+    auth_helpers = AuthHelpers()
+    hashed = auth_helpers.hash_password("password")
+
+    assert hashed.startswith("$2b$04$")
+    assert auth_helpers.needs_rehash(hashed) is False
+    auth_helpers.bcrypt_rounds = 5
+    assert auth_helpers.needs_rehash(hashed) is True
+    assert auth_helpers.needs_rehash("not a hash") is True
+
+def test_async_hash_and_verify(auth_helpers):
+    async def run():
+        hashed = await auth_helpers.ahash_password("password")
+        return await auth_helpers.averify_password("password", hashed), await auth_helpers.averify_password("wrong", hashed)
+
+    assert asyncio.run(run()) == (True, False)
@@ -0,0 +1,29 @@
+from utilities.fake_llm import FakeLLM
+from utilities.prompt_registry import PromptRegistry
+from utilities.base_llm import CHAT_TEMPLATE_TOKENS, MIN_CHUNK_SIZE
+
+prompt_registry = PromptRegistry("../prompts/prompts.yaml")
+words = lambda text: text.split()
+
+# FakeLLM with a whitespace tokenizer, so token counts are easy to work out
+class WordFakeLLM(FakeLLM):
+    def tokenizer(self):
+        return words
+
+def test_chunks_fill_the_context_window():
+    llm = WordFakeLLM(prompt_registry=prompt_registry, context_length=4096)
+    prompt_tokens = len(words(prompt_registry.get("summarise"))) + CHAT_TEMPLATE_TOKENS
+    assert llm.chunker.chunk_size == 4096 - prompt_tokens - llm.summary_max_tokens
+
+def test_approximate_tokenizer_keeps_a_margin():
+    exact = WordFakeLLM(prompt_registry=prompt_registry, context_length=4096).chunker.chunk_size
+    approximate = FakeLLM(prompt_registry=prompt_registry, context_length=4096).chunker.chunk_size
+    assert approximate < exact
+
+def test_unknown_or_tiny_context_and_fixed_sizes():
+    assert FakeLLM(prompt_registry=prompt_registry).chunker.chunk_size == 512
+    assert WordFakeLLM(prompt_registry=prompt_registry, context_length=600).chunker.chunk_size == MIN_CHUNK_SIZE
+
+    llm = WordFakeLLM(prompt_registry=prompt_registry, context_length=4096)
+    llm.configure_chunking(256, 10)
+    assert (llm.chunker.chunk_size, llm.chunker.chunk_overlap) == (256, 10)
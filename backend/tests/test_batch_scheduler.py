@@ -0,0 +1,62 @@
+import asyncio
+import threading
+import pytest
+from utilities.batch_scheduler import BatchScheduler
+from utilities.bounded_executor import QueueFullError
+
+# Submits calls that record the order they ran in, while the first call holds the worker busy
+# so everything else queues up behind it.
+def run_with_blocked_worker(scheduler, requests):
+    order = []
+    release = threading.Event()
+
+    async def main():
+        blocker = asyncio.ensure_future(scheduler.submit(release.wait, prefix_key="blocker", user_key="blocker"))
+        await asyncio.sleep(0.05)
+        tasks = [
+            asyncio.ensure_future(scheduler.submit(lambda name=name: order.append(name), prefix_key=prefix, user_key=user))
+            for name, prefix, user in requests
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+    asyncio.run(main())
+    scheduler.shutdown()
+    return order
+
+def test_submit_returns_result():
+    scheduler = BatchScheduler()
+    assert asyncio.run(scheduler.submit(lambda: 42)) == 42
+    scheduler.shutdown()
+
+def test_users_take_turns_in_a_batch():
+    scheduler = BatchScheduler(max_batch_size=4, max_wait=0.01, max_queue=8)
+    order = run_with_blocked_worker(scheduler, [
+        ("a1", "p", "alice"), ("a2", "p", "alice"), ("a3", "p", "alice"), ("b1", "p", "bob")
+    ])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+def test_same_prefix_requests_run_together():
+    scheduler = BatchScheduler(max_batch_size=4, max_wait=0.01, max_queue=8)
+    order = run_with_blocked_worker(scheduler, [
+        ("summary1", "summarise", "u1"), ("eval1", "evaluate", "u2"), ("summary2", "summarise", "u3"), ("eval2", "evaluate", "u4")
+    ])
+    assert order == ["summary1", "summary2", "eval1", "eval2"]
+
+def test_submit_rejects_when_queue_is_full():
+    scheduler = BatchScheduler(max_batch_size=1, max_wait=0, max_queue=1)
+    release = threading.Event()
+
+    async def main():
+        running = asyncio.ensure_future(scheduler.submit(release.wait))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(scheduler.submit(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(QueueFullError):
+            await scheduler.submit(release.wait)
+        release.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(main())
+    scheduler.shutdown()
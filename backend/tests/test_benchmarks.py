@@ -0,0 +1,35 @@
+import asyncio
+from benchmarks.load import percentile, run_level, compare_results
+
+class Response():
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+def test_percentile_uses_nearest_rank():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.50) == 50.0
+    assert percentile(values, 0.95) == 95.0
+    assert percentile(values, 0.99) == 99.0
+    assert percentile([3.0], 0.99) == 3.0
+    assert percentile([], 0.5) == 0.0
+
+def test_run_level_sends_every_request_and_counts_errors():
+    seen = []
+
+    async def scenario(number):
+        seen.append(number)
+        await asyncio.sleep(0)
+        return Response(500 if number % 5 == 0 else 200)
+
+    result = asyncio.run(run_level(scenario, concurrency=4, total=20))
+    assert sorted(seen) == list(range(1, 21))
+    assert result["requests"] == 20
+    assert result["errors"] == 4
+
+def test_compare_results_flags_regressions_beyond_tolerance():
+    baseline = {"login": {"4": {"p95_ms": 100.0, "requests_per_second": 50.0, "errors": 0}}}
+    within = {"login": {"4": {"p95_ms": 115.0, "requests_per_second": 45.0, "errors": 0}}}
+    slower = {"login": {"4": {"p95_ms": 130.0, "requests_per_second": 35.0, "errors": 1}}}
+    assert compare_results(baseline, within, tolerance=0.2) == []
+    assert len(compare_results(baseline, slower, tolerance=0.2)) == 3
+    assert compare_results(baseline, {}, tolerance=0.2) == []
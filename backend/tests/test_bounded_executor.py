@@ -0,0 +1,29 @@
+import asyncio
+import threading
+import pytest
+from utilities.bounded_executor import BoundedExecutor, QueueFullError
+
+def test_run_returns_result_off_event_loop_thread():
+    executor = BoundedExecutor(max_workers=1, max_queue=1)
+    loop_thread = threading.get_ident()
+    result = asyncio.run(executor.run(lambda x: (x * 2, threading.get_ident()), 21))
+    assert result[0] == 42
+    assert result[1] != loop_thread
+
+def test_run_rejects_when_queue_is_full():
+    executor = BoundedExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def main():
+        # One call running and one queued fills the executor, a third is rejected.
+        running = asyncio.ensure_future(executor.run(release.wait))
+        queued = asyncio.ensure_future(executor.run(release.wait))
+        await asyncio.sleep(0.01)
+        assert executor.queued == 1
+        with pytest.raises(QueueFullError):
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(running, queued)
+
+    asyncio.run(main())
+    assert executor.pending == 0
@@ -0,0 +1,68 @@
+import asyncio
+from utilities.bulk_evaluation import BulkEvaluator
+from utilities.bounded_executor import QueueFullError
+from utilities.models import EvaluationItemModel
+
+# Fake LLM whose evaluations take longer for earlier items, so they finish out of order.
+class FakeLLM():
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.contexts = []
+
+    async def aevaluate(self, question, answer, user=None, context=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.contexts.append(context)
+        await asyncio.sleep(0.01 * (10 - int(answer)))
+        self.in_flight -= 1
+        if answer in self.fail_on:
+            raise RuntimeError("backend error")
+        if question == "busy":
+            raise QueueFullError("busy")
+        return f"grade {answer}"
+
+def collect(evaluator, items, **kwargs):
+    async def run():
+        return [event async for event in evaluator.stream(items, **kwargs)]
+    return asyncio.run(run())
+
+def make_items(count, question="q"):
+    return [EvaluationItemModel(question=question, answer=str(index)) for index in range(count)]
+
+def test_streams_items_as_they_finish_and_results_in_order():
+    llm = FakeLLM(fail_on={"2"})
+    events = collect(BulkEvaluator(llm, concurrency=3), make_items(5))
+    progress, done = events[:-1], events[-1]
+
+    assert [event["completed"] for event in progress] == [1, 2, 3, 4, 5]
+    assert [event["index"] for event in progress] != [0, 1, 2, 3, 4]
+    assert [event["event"] for event in progress if event["index"] == 2] == ["item_failed"]
+    assert [result["evaluation"] for result in done["results"]] == ["grade 0", "grade 1", None, "grade 3", "grade 4"]
+    assert done["results"][2]["error"]
+    assert llm.max_in_flight <= 3
+
+def test_context_is_looked_up_per_item_and_queue_full_is_not_retried():
+    llm = FakeLLM()
+
+    async def get_context(item):
+        return [f"context for {item.answer}"]
+
+    events = collect(BulkEvaluator(llm), make_items(2, question="busy"), get_context=get_context)
+    assert sorted(map(tuple, llm.contexts)) == [("context for 0",), ("context for 1",)]
+    assert [result["error"] for result in events[-1]["results"]] == ["busy", "busy"]
+
+def test_context_errors_only_fail_their_item():
+    llm = FakeLLM()
+
+    async def get_context(item):
+        if item.answer == "1":
+            raise RuntimeError("index unavailable")
+        return []
+
+    events = collect(BulkEvaluator(llm), make_items(3), get_context=get_context)
+    done = events[-1]
+    assert done["event"] == "done"
+    assert [result["evaluation"] for result in done["results"]] == ["grade 0", None, "grade 2"]
+    assert done["results"][1]["error"]
@@ -0,0 +1,69 @@
+import asyncio
+from utilities.chunker import Chunker
+
+async def page_stream(pages):
+    for page in pages:
+        yield page
+
+def collect(chunker, pages):
+    async def main():
+        return [chunk async for chunk in chunker.aiter_chunks(page_stream(pages))]
+    return asyncio.run(main())
+
+def make_pages(page_count: int) -> list:
+    return [" ".join(f"Page {page} sentence {n} explains a concept." for n in range(40)) + "\n" for page in range(1, page_count + 1)]
+
+def test_aiter_chunks_covers_the_whole_document_in_order():
+    chunker = Chunker(chunk_size=64, chunk_overlap=8)
+    chunks = collect(chunker, make_pages(6))
+    text = "".join(chunk.text for chunk in chunks)
+    for page in range(1, 7):
+        assert f"Page {page} sentence 0 " in text
+        assert f"Page {page} sentence 39 " in text
+    assert [chunk.start_page for chunk in chunks] == sorted(chunk.start_page for chunk in chunks)
+
+def test_aiter_chunks_attaches_page_numbers():
+    chunker = Chunker(chunk_size=64, chunk_overlap=8)
+    for chunk in collect(chunker, make_pages(4)):
+        assert 1 <= chunk.start_page <= chunk.end_page <= 4
+        assert f"Page {chunk.start_page} " in chunk.text
+        assert f"Page {chunk.end_page} " in chunk.text
+
+def test_aiter_chunks_matches_split_text_for_short_documents():
+    chunker = Chunker(chunk_size=64, chunk_overlap=8)
+    pages = ["A short first slide.\n", "A short second slide.\n"]
+    chunks = collect(chunker, pages)
+    assert [chunk.text for chunk in chunks] == chunker.split_text("".join(pages))
+    assert (chunks[0].start_page, chunks[-1].end_page) == (1, 2)
+
+def collect_page_chunks(chunker, pages):
+    async def main():
+        return [chunk async for chunk in chunker.aiter_page_chunks(page_stream(pages))]
+    return asyncio.run(main())
+
+def test_aiter_page_chunks_hold_whole_pages():
+    chunker = Chunker(chunk_size=400, chunk_overlap=8)
+    pages = make_pages(20)
+    chunks = collect_page_chunks(chunker, pages)
+    assert chunks[0].start_page == 1 and chunks[-1].end_page == 20
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.start_page == previous.end_page + 1
+    for chunk in chunks:
+        assert chunk.text == "".join(pages[chunk.start_page - 1:chunk.end_page]).strip()
+
+def test_aiter_page_chunks_only_change_around_an_edit():
+    chunker = Chunker(chunk_size=400, chunk_overlap=8)
+    pages = make_pages(40)
+    edited = list(pages)
+    edited[19] = edited[19].replace("explains", "describes", 3)
+    before = {chunk.text for chunk in collect_page_chunks(chunker, pages)}
+    after = collect_page_chunks(chunker, edited)
+    changed = [chunk for chunk in after if chunk.text not in before]
+    assert changed and all(chunk.start_page <= 20 for chunk in changed)
+    assert len(changed) < len(after) / 2
+
+def test_aiter_page_chunks_split_oversized_pages():
+    chunker = Chunker(chunk_size=64, chunk_overlap=8)
+    chunks = collect_page_chunks(chunker, make_pages(2))
+    assert len(chunks) > 2
+    assert all(chunk.start_page == chunk.end_page for chunk in chunks)
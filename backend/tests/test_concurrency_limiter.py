@@ -0,0 +1,29 @@
+import asyncio
+import pytest
+from utilities.concurrency_limiter import ConcurrencyLimiter, TooManyRequestsError
+
+def test_rejects_when_any_key_is_at_limit():
+    limiter = ConcurrencyLimiter(max_per_key=1)
+
+    async def run():
+        async with limiter.limit("ip:1", "email:a"):
+            with pytest.raises(TooManyRequestsError):
+                async with limiter.limit("ip:2", "email:a"):
+                    pass
+            # A rejected request doesn't hold a slot for its other keys.
+            assert "ip:2" not in limiter.in_progress
+            async with limiter.limit("ip:2", "email:b"):
+                pass
+        assert limiter.in_progress == {}
+
+    asyncio.run(run())
+
+def test_none_keys_are_ignored():
+    limiter = ConcurrencyLimiter(max_per_key=1)
+
+    async def run():
+        async with limiter.limit(None, "email:a"):
+            async with limiter.limit(None, "email:b"):
+                pass
+
+    asyncio.run(run())
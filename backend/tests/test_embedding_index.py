@@ -0,0 +1,51 @@
+import asyncio
+import numpy as np
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from utilities.embedding_index import HashingEmbedder, EmbeddingIndexStore
+
+CHUNKS = [
+    "Photosynthesis turns light energy into chemical energy in the chloroplast.",
+    "The French revolution began in 1789 with the storming of the Bastille.",
+    "Supply and demand set the market price of a good.",
+    "Chlorophyll in the chloroplast absorbs light for photosynthesis."
+]
+
+def make_store(**kwargs):
+    return EmbeddingIndexStore(AsyncMongoMockClient().db.lecture_embeddings, **kwargs)
+
+def test_embeddings_are_unit_length_and_stable():
+    embedder = HashingEmbedder(dimensions=64)
+    matrix = embedder.embed(CHUNKS + [""])
+    assert matrix.shape == (5, 64) and matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(matrix[:4], axis=1), 1.0)
+    assert not matrix[4].any()
+    assert np.array_equal(matrix, HashingEmbedder(dimensions=64).embed(CHUNKS + [""]))
+
+def test_search_returns_most_relevant_chunks_first():
+    store = make_store()
+    lecture_id, user_id = ObjectId(), ObjectId()
+
+    async def run():
+        assert await store.build(lecture_id, user_id, CHUNKS) == 4
+        return await store.search(lecture_id, user_id, "How does photosynthesis use light?", k=2)
+
+    assert set(asyncio.run(run())) == {CHUNKS[0], CHUNKS[3]}
+
+def test_index_is_loaded_from_mongodb_and_scoped_to_its_owner():
+    store = make_store()
+    lecture_id, user_id = ObjectId(), ObjectId()
+
+    async def run():
+        await store.build(lecture_id, user_id, CHUNKS)
+        # A fresh store (e.g. another worker) reads the saved matrix
+        reloaded = EmbeddingIndexStore(store.collection)
+        index = await reloaded.get(lecture_id, user_id)
+        assert np.array_equal(index.matrix, store.cached[lecture_id].matrix)
+        assert await reloaded.search(lecture_id, ObjectId(), "photosynthesis") == []
+        assert await reloaded.search(ObjectId(), user_id, "photosynthesis") == []
+        # An index saved with other settings is re-embedded rather than misread
+        resized = EmbeddingIndexStore(store.collection, HashingEmbedder(dimensions=32))
+        return await resized.search(lecture_id, user_id, "market price", k=1)
+
+    assert asyncio.run(run()) == [CHUNKS[2]]
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import fitz
+import pytest
+from io import BytesIO
+from pptx import Presentation
+from pptx.util import Inches
+from utilities.extraction_tool import ExtractionTool, ExtractionError, ExtractionLimitError
+
+def make_pdf(page_count: int) -> bytes:
+    pdf_doc = fitz.open()
+    for page_num in range(page_count):
+        page = pdf_doc.new_page()
+        page.insert_text((72, 72), f"Page {page_num + 1}")
+    return pdf_doc.tobytes()
+
+def make_pptx(slide_count: int) -> bytes:
+    presentation = Presentation()
+    for slide_num in range(slide_count):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        textbox = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1))
+        textbox.text = f"Slide {slide_num + 1}"
+    output = BytesIO()
+    presentation.save(output)
+    return output.getvalue()
+
+async def collect(generator):
+    return [item async for item in generator]
+
+def test_aiter_pdf_pages_keeps_page_order_across_workers():
+    extraction_tool = ExtractionTool(max_workers=2, pages_per_task=3)
+    try:
+        pages = asyncio.run(collect(extraction_tool.aiter_pdf_pages(make_pdf(10))))
+    finally:
+        extraction_tool.shutdown()
+    assert [page.strip() for page in pages] == [f"Page {i + 1}" for i in range(10)]
+
+def test_extract_text_from_pptx_matches_slide_stream():
+    extraction_tool = ExtractionTool()
+    pptx_bytes = make_pptx(3)
+    assert extraction_tool.extract_text_from_pptx(pptx_bytes) == "Slide 1\nSlide 2\nSlide 3\n"
+
+def test_limits_are_enforced():
+    with pytest.raises(ExtractionLimitError):
+        ExtractionTool(max_pages=2).extract_text_from_pdf(make_pdf(3))
+    with pytest.raises(ExtractionLimitError):
+        ExtractionTool(max_bytes=10).extract_text_from_pdf(make_pdf(1))
+
+def test_invalid_pdf_raises_extraction_error():
+    with pytest.raises(ExtractionError):
+        ExtractionTool().extract_text_from_pdf(b"not a pdf")
+
+# Stand-in for FastAPI's UploadFile, read in pieces
+class FakeUpload():
+    def __init__(self, content: bytes, size: int = None):
+        self.stream = BytesIO(content)
+        self.size = size
+        self.reads = 0
+
+    async def read(self, size: int = -1) -> bytes:
+        self.reads += 1
+        return self.stream.read(size)
+
+def test_spooled_upload_is_extracted_from_disk_and_removed(tmp_path):
+    extraction_tool = ExtractionTool(max_workers=1, spool_directory=str(tmp_path))
+    upload = FakeUpload(make_pdf(3))
+    try:
+        async def run():
+            spooled = await extraction_tool.spool_upload(upload, chunk_size=256)
+            assert list(tmp_path.iterdir()) == [tmp_path / os.path.basename(spooled.path)]
+            return [page.strip() async for page in spooled.stream(extraction_tool.aiter_pdf_pages(spooled.path))]
+        pages = asyncio.run(run())
+    finally:
+        extraction_tool.shutdown()
+    assert pages == ["Page 1", "Page 2", "Page 3"]
+    assert upload.reads > 2
+    assert list(tmp_path.iterdir()) == []
+
+def test_spool_enforces_size_limit_while_reading(tmp_path):
+    extraction_tool = ExtractionTool(max_bytes=1000, spool_directory=str(tmp_path))
+    upload = FakeUpload(b"x" * 5000)
+    with pytest.raises(ExtractionLimitError):
+        asyncio.run(extraction_tool.spool_upload(upload, chunk_size=256))
+    # Stopped after the limit rather than reading the rest of the upload
+    assert upload.reads == 4
+    assert list(tmp_path.iterdir()) == []
+    with pytest.raises(ExtractionLimitError):
+        asyncio.run(extraction_tool.spool_upload(FakeUpload(b"x", size=5000)))
+
+def test_unread_spooled_upload_is_removed_when_dropped(tmp_path):
+    spooled = asyncio.run(ExtractionTool(spool_directory=str(tmp_path)).spool_upload(FakeUpload(b"content")))
+    assert len(list(tmp_path.iterdir())) == 1
+    del spooled
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,94 @@
+import asyncio
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from utilities.history_migration import split_lecture, migrate_user_message_history
+
+def test_split_lecture_keeps_lecture_id_and_response_order():
+    lecture_id = ObjectId()
+    user_id = ObjectId()
+    lecture = {
+        "_id": lecture_id,
+        "lecture_summary": "summary",
+        "lecture_file_name": "week1.pdf",
+        "students": [
+            {"question": "q1", "response": "r1", "evaluation": "e1"},
+            {"question": "q2", "response": "r2", "evaluation": "e2"}
+        ]
+    }
+
+    lecture_document, response_documents = split_lecture(user_id, lecture)
+
+    assert lecture_document["_id"] == lecture_id
+    assert lecture_document["user_id"] == user_id
+    assert lecture_document["response_count"] == 2
+    assert [document["question"] for document in response_documents] == ["q1", "q2"]
+    assert [document["position"] for document in response_documents] == [0, 1]
+    assert all(document["lecture_id"] == lecture_id for document in response_documents)
+
+# Stands in for MongoDBHelper with mongomock collections
+class FakeMongoDBHelper():
+    def __init__(self):
+        database = AsyncMongoMockClient().user_db
+        self.history = database.user_message_history
+        self.lectures = database.lectures
+        self.responses = database.student_responses
+
+    def get_user_message_history_collection(self):
+        return self.history
+
+    def get_lecture_collection(self):
+        return self.lectures
+
+    def get_student_response_collection(self):
+        return self.responses
+
+def make_history(mdb, lecture_id):
+    students = [{"question": f"q{number}", "response": f"r{number}", "evaluation": f"e{number}"} for number in range(3)]
+    return mdb.history.insert_one({"user_id": ObjectId(), "lectures": [{"_id": lecture_id, "lecture_summary": "summary", "students": students}]})
+
+def test_migration_moves_lectures_and_responses_once():
+    mdb = FakeMongoDBHelper()
+    lecture_id = ObjectId()
+
+    async def run():
+        await make_history(mdb, lecture_id)
+        first = await migrate_user_message_history(mdb)
+        # Nothing is left to migrate the second time
+        second = await migrate_user_message_history(mdb)
+        return first, second, await mdb.responses.count_documents({"lecture_id": lecture_id})
+
+    first, second, responses = asyncio.run(run())
+    assert first == {"users": 1, "lectures": 1, "responses": 3, "skipped_lectures": 0}
+    assert second["users"] == 0
+    assert responses == 3
+
+def test_rerun_after_interruption_does_not_duplicate_responses():
+    mdb = FakeMongoDBHelper()
+    lecture_id = ObjectId()
+
+    async def run():
+        await make_history(mdb, lecture_id)
+        # As if an earlier run wrote the responses, then stopped before writing the lecture
+        history = await mdb.history.find_one({})
+        _, response_documents = split_lecture(history["user_id"], history["lectures"][0])
+        await mdb.responses.insert_many(response_documents)
+
+        await migrate_user_message_history(mdb)
+        lecture = await mdb.lectures.find_one({"_id": lecture_id})
+        return lecture, await mdb.responses.count_documents({"lecture_id": lecture_id})
+
+    lecture, responses = asyncio.run(run())
+    assert lecture["response_count"] == 3
+    assert responses == 3
+
+def test_dry_run_writes_nothing():
+    mdb = FakeMongoDBHelper()
+
+    async def run():
+        await make_history(mdb, ObjectId())
+        counts = await migrate_user_message_history(mdb, dry_run=True)
+        return counts, await mdb.lectures.count_documents({}), await mdb.history.count_documents({"migrated_at": {"$exists": True}})
+
+    counts, lectures, migrated = asyncio.run(run())
+    assert counts["lectures"] == 1 and counts["responses"] == 3
+    assert lectures == 0 and migrated == 0
@@ -0,0 +1,125 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from mongomock_motor import AsyncMongoMockClient
+from utilities.chunker import Chunk
+from utilities.job_queue import SummarisationJobQueue
+from utilities.summarisation_pipeline import SummarisationPipeline
+
+# Fake LLM that records which chunks it was asked to summarise.
+class FakeLLM():
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on or set()
+        self.summarised = []
+
+    async def asummarise(self, content, user=None):
+        self.summarised.append(content)
+        if content in self.fail_on:
+            raise RuntimeError("backend error")
+        return f"summary of {content}"
+
+def make_queue(llm, **kwargs):
+    database = AsyncMongoMockClient().jobs_db
+    return SummarisationJobQueue(database.jobs, database.chunks, SummarisationPipeline(llm, max_retries=0), **kwargs)
+
+def test_submit_then_run_completes_job():
+    llm = FakeLLM(fail_on={"b"})
+    queue = make_queue(llm)
+
+    async def run():
+        job = await queue.submit(["a", Chunk("b", 1, 1), "c"], user="client:1")
+        claimed = await queue.claim()
+        assert claimed["_id"] == job["_id"] and claimed["status"] == "running"
+        await queue.run_job(claimed)
+        return await queue.get(job["_id"]), await queue.chunks.count_documents({})
+
+    job, remaining_chunks = asyncio.run(run())
+    assert job["status"] == "completed"
+    assert job["completed_chunks"] == 3 and job["total_chunks"] == 3
+    assert job["result"] == {"summaries": ["summary of a", "summary of c"], "failed_chunks": [1]}
+    assert remaining_chunks == 0
+
+def test_claimed_job_resumes_from_checkpointed_chunks():
+    llm = FakeLLM()
+    queue = make_queue(llm)
+
+    async def run():
+        job = await queue.submit(["a", "b", "c"])
+        # As if a previous worker finished the first chunk before dying.
+        await queue._checkpoint(job["_id"], 0, "summary of a")
+        await queue.run_job(await queue.claim())
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert llm.summarised == ["b", "c"]
+    assert job["completed_chunks"] == 3
+    assert job["result"]["summaries"] == ["summary of a", "summary of b", "summary of c"]
+
+def test_only_expired_leases_can_be_claimed():
+    queue = make_queue(FakeLLM(), lease_seconds=60)
+
+    async def run():
+        job = await queue.submit(["a"])
+        assert await queue.claim() is not None
+        # The lease is held, so nobody else can claim the job...
+        assert await queue.claim() is None
+        # ...until it runs out.
+        expired = datetime.now(timezone.utc) - timedelta(seconds=1)
+        await queue.jobs.update_one({"_id": job["_id"]}, {"$set": {"lease_expires_at": expired}})
+        reclaimed = await queue.claim()
+        return reclaimed["attempts"]
+
+    assert asyncio.run(run()) == 2
+
+def test_failed_submit_leaves_nothing_queued():
+    queue = make_queue(FakeLLM())
+
+    async def chunks():
+        yield "a"
+        raise ValueError("too many pages")
+
+    async def run():
+        try:
+            await queue.submit(chunks(), batch_size=1)
+        except ValueError:
+            pass
+        return await queue.jobs.count_documents({}), await queue.chunks.count_documents({})
+
+    assert asyncio.run(run()) == (0, 0)
+
+def test_worker_keeps_running_after_a_mongodb_error():
+    queue = make_queue(FakeLLM(), poll_interval=0.01)
+    claim = queue.claim
+    calls = []
+
+    async def flaky_claim():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("mongo blip")
+        return await claim()
+
+    queue.claim = flaky_claim
+
+    async def run():
+        job = await queue.submit(["a"])
+        queue.start()
+        for _ in range(100):
+            if (await queue.get(job["_id"]))["status"] == "completed":
+                break
+            await asyncio.sleep(0.01)
+        await queue.stop()
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert job["status"] == "completed"
+    assert job["result"]["summaries"] == ["summary of a"]
+
+def test_get_only_returns_the_owners_jobs():
+    queue = make_queue(FakeLLM())
+
+    async def run():
+        job = await queue.submit(["a"], user_id="owner")
+        return await queue.get(job["_id"], "owner"), await queue.get(job["_id"], "someone else")
+
+    own, other = asyncio.run(run())
+    assert own["user_id"] == "owner"
+    assert other is None
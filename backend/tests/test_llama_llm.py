@@ -0,0 +1,39 @@
+import asyncio
+import sys
+import types
+import pytest
+from utilities.batch_scheduler import BatchScheduler
+from utilities.bounded_executor import QueueFullError
+
+# llama-cpp-python needs a compiled library and a model file, neither of which the tests have. The
+# streaming logic is tested with a stand-in module and _generate replaced.
+@pytest.fixture
+def llama_llm(monkeypatch):
+    monkeypatch.setitem(sys.modules, "llama_cpp", types.SimpleNamespace(Llama=None))
+    monkeypatch.delitem(sys.modules, "utilities.llm", raising=False)
+    from utilities.llm import LLM
+
+    def make(max_queue: int = 8):
+        llm = LLM.__new__(LLM)
+        llm.scheduler = BatchScheduler(max_queue=max_queue)
+
+        def generate(messages, on_token=None, stop=None):
+            for token in ["Hello", " world"]:
+                on_token(token)
+            return "Hello world"
+
+        llm._generate = generate
+        return llm
+    return make
+
+def collect(llm):
+    async def run():
+        return [token async for token in llm._astream_chat([{"role": "system", "content": "prompt"}])]
+    return asyncio.run(asyncio.wait_for(run(), timeout=5))
+
+def test_stream_yields_generated_tokens(llama_llm):
+    assert collect(llama_llm()) == ["Hello", " world"]
+
+def test_stream_raises_when_the_queue_is_full(llama_llm):
+    with pytest.raises(QueueFullError):
+        collect(llama_llm(max_queue=0))
@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+from utilities.fake_llm import FakeLLM
+from utilities.llm_router import LLMRouter, RoutedBackend, CircuitBreaker, NoBackendAvailableError, create_backend, low_priority
+
+def make_backend(name, tasks=None, **kwargs):
+    return RoutedBackend(name, FakeLLM(model=name, token_latency=0.005), tasks, **kwargs)
+
+def test_routes_tasks_to_their_backends():
+    router = LLMRouter([make_backend("small", ["summarise", "merge_summaries"]), make_backend("large", ["evaluate", "query"])])
+
+    summary = asyncio.run(router.asummarise("some lecture content"))
+    evaluation = asyncio.run(router.aevaluate("question", "answer"))
+
+    assert summary.startswith("[small]")
+    assert evaluation.startswith("[large]")
+
+def test_spreads_concurrent_requests_over_least_loaded_backends():
+    backends = [make_backend("a"), make_backend("b")]
+    router = LLMRouter(backends)
+
+    async def run():
+        return await asyncio.gather(*[router.asummarise(f"chunk {index}") for index in range(4)])
+
+    summaries = asyncio.run(run())
+    assert sorted(summary.split()[0] for summary in summaries) == ["[a]", "[a]", "[b]", "[b]"]
+    assert all(backend.outstanding == 0 for backend in backends)
+
+def test_fails_over_and_opens_circuit(monkeypatch):
+    # Ties are broken at random, keep the pool order so the broken backend is tried first.
+    monkeypatch.setattr("utilities.llm_router.random.shuffle", lambda backends: None)
+    broken = make_backend("broken", failure_threshold=1, reset_timeout=60)
+    broken.llm.healthy = False
+    router = LLMRouter([broken, make_backend("working")])
+
+    async def run():
+        return [await router.asummarise("content") for _ in range(3)]
+
+    assert all(summary.startswith("[working]") for summary in asyncio.run(run()))
+    assert broken.breaker.state == "open"
+
+def test_streams_fail_over_before_first_token():
+    broken = make_backend("broken")
+    broken.llm.healthy = False
+    router = LLMRouter([broken, make_backend("working")])
+
+    async def run():
+        return "".join([token async for token in router.astream_summarise("content")])
+
+    assert asyncio.run(run()).startswith("[working]")
+
+def test_unhealthy_backends_leave_rotation():
+    backend = make_backend("only")
+    router = LLMRouter([backend])
+    backend.llm.healthy = False
+    asyncio.run(router.check_health())
+
+    with pytest.raises(NoBackendAvailableError):
+        asyncio.run(router.asummarise("content"))
+
+def test_circuit_breaker_half_open_allows_one_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+    assert breaker.allow() == (True, True)
+    assert breaker.allow() == (False, False)
+    breaker.record_success()
+    assert breaker.state == "closed"
+    assert breaker.allow() == (True, False)
+
+def test_requests_in_flight_when_the_circuit_opened_dont_free_the_trial():
+    backend = make_backend("flaky", failure_threshold=1, reset_timeout=0)
+    router = LLMRouter([backend])
+
+    async def run():
+        earlier = asyncio.create_task(router.asummarise("content"))
+        await asyncio.sleep(0)
+        # The circuit opens (and is immediately half open) while the earlier request is in flight
+        backend.breaker.record_failure()
+        trial = asyncio.create_task(router.asummarise("content"))
+        await asyncio.sleep(0)
+        # The earlier request ends without a result
+        earlier.cancel()
+        await asyncio.gather(earlier, return_exceptions=True)
+        allowed_during_trial = backend.breaker.allow()
+        await trial
+        return allowed_during_trial
+
+    assert asyncio.run(run()) == (False, False)
+    assert backend.breaker.state == "closed"
+
+def test_create_backend_from_config():
+    backend = create_backend({"type": "fake", "name": "test", "model": "tiny", "tasks": ["summarise"]})
+    assert backend.name == "test"
+    assert backend.llm.model == "tiny"
+    assert backend.serves("summarise") and not backend.serves("evaluate")
+
+def test_chunks_are_sized_for_the_smallest_summarising_context():
+    large = RoutedBackend("large", FakeLLM(model="large", context_length=8192), ["summarise"])
+    small = RoutedBackend("small", FakeLLM(model="small", context_length=2048), ["summarise"])
+    tiny = RoutedBackend("tiny", FakeLLM(model="tiny", context_length=512), ["evaluate"])
+    router = LLMRouter([large, small, tiny])
+    assert router.chunking_backend is small
+    assert router.chunker.chunk_size == small.llm.chunker.chunk_size < large.llm.chunker.chunk_size
+
+def test_low_priority_requests_wait_for_live_requests():
+    router = LLMRouter([make_backend("only")])
+    finished = []
+
+    async def live():
+        await router.asummarise("live " * 20)
+        finished.append("live")
+
+    async def background():
+        low_priority.set(True)
+        await router.asummarise("background")
+        finished.append("background")
+
+    async def run():
+        live_task = asyncio.create_task(live())
+        await asyncio.sleep(0)
+        # The background request is much shorter, but only starts once the live one is done
+        await asyncio.gather(asyncio.create_task(background()), live_task)
+
+    asyncio.run(run())
+    assert finished == ["live", "background"]
+    assert router.live_requests == 0
@@ -0,0 +1,25 @@
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from utilities.pagination import encode_cursor, decode_cursor, after_cursor, paginate, InvalidCursorError
+
+def test_cursor_round_trip():
+    document = {"_id": ObjectId(), "created_at": datetime(2024, 3, 1, 12, 30, 15, 123000)}
+    assert decode_cursor(encode_cursor(document)) == (document["created_at"], document["_id"])
+
+def test_after_cursor_breaks_ties_on_id():
+    document = {"_id": ObjectId(), "created_at": datetime(2024, 3, 1)}
+    query = after_cursor(encode_cursor(document))
+    assert query["$or"][0] == {"created_at": {"$lt": document["created_at"]}}
+    assert query["$or"][1] == {"created_at": document["created_at"], "_id": {"$lt": document["_id"]}}
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(InvalidCursorError):
+        decode_cursor("not a cursor")
+
+def test_paginate_returns_cursor_only_when_more_pages():
+    documents = [{"_id": ObjectId(), "created_at": datetime(2024, 3, day)} for day in (3, 2, 1)]
+    page, next_cursor = paginate(documents, 2)
+    assert page == documents[:2]
+    assert decode_cursor(next_cursor) == (documents[1]["created_at"], documents[1]["_id"])
+    assert paginate(documents, 3) == (documents, None)
@@ -0,0 +1,48 @@
+from utilities.prefix_cache import PrefixStateCache
+
+# Stand-in for a llama_cpp.Llama that tracks which tokens it has evaluated.
+class FakeModel():
+    def __init__(self):
+        self.evaluated = []
+        self.eval_calls = 0
+
+    def tokenize(self, text: bytes, add_bos: bool = True) -> list:
+        return ([0] if add_bos else []) + list(text)
+
+    def reset(self):
+        self.evaluated = []
+
+    def eval(self, tokens):
+        self.eval_calls += 1
+        self.evaluated = self.evaluated + list(tokens)
+
+    def save_state(self):
+        return list(self.evaluated)
+
+    def load_state(self, state):
+        self.evaluated = list(state)
+
+def test_prefix_is_evaluated_once_and_reused():
+    model = FakeModel()
+    cache = PrefixStateCache(model)
+    assert cache.prime("system prompt") == 0
+    assert cache.prime("system prompt") == len("system prompt") + 1
+    assert model.eval_calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_switching_prefix_loads_saved_state():
+    model = FakeModel()
+    cache = PrefixStateCache(model)
+    cache.prime("summarise")
+    cache.prime("evaluate")
+    assert cache.prime("summarise") == len("summarise") + 1
+    assert model.evaluated == model.tokenize(b"summarise")
+    assert model.eval_calls == 2
+
+def test_least_recently_used_prefix_is_evicted():
+    cache = PrefixStateCache(FakeModel(), max_entries=2)
+    cache.prime("a")
+    cache.prime("b")
+    cache.prime("a")
+    cache.prime("c")
+    assert list(cache.states) == [cache.make_key("a"), cache.make_key("c")]
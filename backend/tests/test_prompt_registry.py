@@ -0,0 +1,42 @@
+import os
+import time
+from utilities.prompt_registry import PromptRegistry
+
+def write_prompts(path, summarise_text):
+    path.write_text(
+        f"default_student: |\n  Ask a question.\n"
+        f"summarise: |\n  {summarise_text}\n"
+        f"evaluate_response: |\n  Evaluate.\n"
+        f"curious_persona: |\n  The Curious One.\n"
+    )
+
+def test_registry_serves_prompts_and_persona_keys(tmp_path):
+    prompts_file = tmp_path / "prompts.yaml"
+    write_prompts(prompts_file, "Summarise this.")
+    registry = PromptRegistry(str(prompts_file))
+    assert registry.get("summarise").strip() == "Summarise this."
+    assert registry.persona_keys == ["curious_persona"]
+    assert len(registry.version) == 16
+
+def test_registry_reloads_when_file_changes(tmp_path):
+    prompts_file = tmp_path / "prompts.yaml"
+    write_prompts(prompts_file, "Old prompt.")
+    registry = PromptRegistry(str(prompts_file), watch_interval=0.01)
+    old_version = registry.version
+
+    write_prompts(prompts_file, "New prompt.")
+    # Make sure the mtime moves even on filesystems with coarse timestamps.
+    stat = os.stat(prompts_file)
+    os.utime(prompts_file, (stat.st_atime, stat.st_mtime + 5))
+    time.sleep(0.02)
+
+    assert registry.get("summarise").strip() == "New prompt."
+    assert registry.version != old_version
+
+def test_registry_keeps_prompts_when_reload_fails(tmp_path):
+    prompts_file = tmp_path / "prompts.yaml"
+    write_prompts(prompts_file, "Good prompt.")
+    registry = PromptRegistry(str(prompts_file))
+    prompts_file.write_text("summarise: [unclosed")
+    assert registry.reload() is False
+    assert registry.get("summarise").strip() == "Good prompt."
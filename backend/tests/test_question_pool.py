@@ -0,0 +1,112 @@
+import asyncio
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from utilities.embedding_index import EmbeddingIndexStore
+from utilities.llm_router import low_priority
+from utilities.question_pool import QuestionPool, question_key
+
+class FakeRegistry():
+    persona_keys = ["curious", "confused", "sceptical"]
+
+# Fake LLM whose question depends on the persona and the lecture content it was asked about.
+class FakeLLM():
+    def __init__(self, duplicate=False):
+        self.calls = []
+        self.priorities = []
+        self.duplicate = duplicate
+
+    async def aquery(self, query, persona=None, user=None):
+        self.calls.append((persona, query))
+        self.priorities.append(low_priority.get())
+        if self.duplicate:
+            return "What is this lecture about?"
+        return f"{persona} question about {query}"
+
+def make_pool(llm, **kwargs):
+    database = AsyncMongoMockClient().pool_db
+    return QuestionPool(database.question_pool, database.lectures, llm, FakeRegistry(), **kwargs)
+
+async def store_lecture(pool, summaries):
+    lecture = {"_id": ObjectId(), "user_id": ObjectId(), "summaries": summaries}
+    await pool.lecture_collection.insert_one(lecture)
+    await pool.ensure_indexes()
+    return lecture
+
+def test_fill_uses_each_prompt_once():
+    llm = FakeLLM()
+    pool = make_pool(llm, pool_size=4)
+
+    async def run():
+        lecture = await store_lecture(pool, ["summary one", "summary two"])
+        first = await pool.fill(lecture["_id"])
+        # Already full, so nothing more is generated.
+        again = await pool.fill(lecture["_id"])
+        return first, again
+
+    assert asyncio.run(run()) == (4, 0)
+    assert len(set(llm.calls)) == len(llm.calls) == 4
+
+def test_take_serves_pooled_questions_and_refills_below_low_water_mark():
+    llm = FakeLLM()
+    pool = make_pool(llm, pool_size=3, low_water_mark=2)
+
+    async def run():
+        lecture = await store_lecture(pool, ["summary one", "summary two"])
+        await pool.fill(lecture["_id"])
+        first = await pool.take(lecture["_id"], lecture["user_id"])
+        second = await pool.take(lecture["_id"], lecture["user_id"])
+        # Another user can't take this lecture's questions.
+        other = await pool.take(lecture["_id"], ObjectId())
+        await asyncio.gather(*pool.filling.values())
+        return first, second, other, await pool.available(lecture["_id"])
+
+    first, second, other, available = asyncio.run(run())
+    assert first and second and first != second
+    assert other is None
+    assert available == 3
+    # Refilling never reuses a persona/summary pair.
+    assert len(set(llm.calls)) == len(llm.calls) == 5
+
+def test_duplicate_questions_are_dropped():
+    pool = make_pool(FakeLLM(duplicate=True), pool_size=3, concurrency=1)
+
+    async def run():
+        lecture = await store_lecture(pool, ["summary one"])
+        return await pool.fill(lecture["_id"])
+
+    assert asyncio.run(run()) == 1
+
+def test_question_key_ignores_case_spacing_and_punctuation():
+    assert question_key("What is  recursion?") == question_key("what is recursion")
+    assert question_key("What is recursion?") != question_key("What is iteration?")
+
+def test_fill_includes_chunks_retrieved_for_the_summary():
+    llm = FakeLLM()
+    database = AsyncMongoMockClient().pool_db
+    index = EmbeddingIndexStore(database.lecture_embeddings)
+    pool = QuestionPool(database.question_pool, database.lectures, llm, FakeRegistry(), pool_size=1, embedding_index=index, retrieval_top_k=2)
+    chunks = ["photosynthesis turns light into sugar", "chlorophyll absorbs light in photosynthesis", "the french revolution began in 1789"]
+
+    async def run():
+        lecture = await store_lecture(pool, ["photosynthesis and light"])
+        await index.build(lecture["_id"], lecture["user_id"], chunks)
+        await pool.fill(lecture["_id"])
+
+    asyncio.run(run())
+    _, query = llm.calls[0]
+    assert query.startswith("Lecture Content: photosynthesis and light")
+    assert chunks[0] in query and chunks[1] in query
+    assert chunks[2] not in query
+
+def test_scheduled_fills_run_at_low_priority():
+    llm = FakeLLM()
+    pool = make_pool(llm, pool_size=2)
+
+    async def run():
+        lecture = await store_lecture(pool, ["summary one"])
+        await pool.schedule_fill(lecture["_id"])
+
+    asyncio.run(run())
+    assert llm.priorities == [True, True]
+    # The caller's context isn't changed
+    assert low_priority.get() is False
@@ -0,0 +1,51 @@
+import asyncio
+from utilities.response_cache import ResponseCache
+
+# Minimal stand-in for a Motor collection holding documents in a dict.
+class FakeCollection():
+    def __init__(self):
+        self.documents = {}
+
+    async def find_one(self, query, projection=None):
+        return self.documents.get(query["_id"])
+
+    async def update_one(self, query, update, upsert=False):
+        self.documents[query["_id"]] = dict(update["$set"])
+
+def test_make_key_depends_on_every_input():
+    messages = [{"role": "user", "content": "chunk"}]
+    key = ResponseCache.make_key("summarise", messages, "llama3.2", {})
+    assert key == ResponseCache.make_key("summarise", [dict(m) for m in messages], "llama3.2", {})
+    assert key != ResponseCache.make_key("summarise", messages, "mistral", {})
+    assert key != ResponseCache.make_key("summarise", messages, "llama3.2", {"temperature": 0.5})
+    assert key != ResponseCache.make_key("evaluate", messages, "llama3.2", {})
+
+def test_get_falls_back_to_mongo_and_counts_hits():
+    collection = FakeCollection()
+
+    async def main():
+        writer = ResponseCache(collection)
+        await writer.set("key", "summary")
+        # A new process has an empty memory tier but shares the collection.
+        reader = ResponseCache(collection)
+        assert await reader.get("missing") is None
+        assert await reader.get("key") == "summary"
+        assert await reader.get("key") == "summary"
+        return reader.stats()
+
+    stats = asyncio.run(main())
+    assert stats["misses"] == 1
+    assert stats["mongo_hits"] == 1
+    assert stats["memory_hits"] == 1
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2)
+
+    async def main():
+        await cache.set("a", "1")
+        await cache.set("b", "2")
+        await cache.get("a")
+        await cache.set("c", "3")
+
+    asyncio.run(main())
+    assert list(cache.memory) == ["a", "c"]
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import BulkWriteError
+from utilities.student_response_writer import StudentResponseWriter, StudentResponseWriteError
+
+def make_writer():
+    database = AsyncMongoMockClient().user_db
+    return StudentResponseWriter(database.student_responses, database.lectures)
+
+async def store_lecture(writer):
+    lecture = {"_id": ObjectId(), "user_id": ObjectId(), "response_count": 0}
+    await writer.lectures.insert_one(lecture)
+    return lecture
+
+def make_responses(lecture, count):
+    return [{"_id": ObjectId(), "lecture_id": lecture["_id"], "user_id": lecture["user_id"], "question": f"q{number}"} for number in range(count)]
+
+def test_write_inserts_responses_and_counts_them():
+    writer = make_writer()
+
+    async def run():
+        first, second = await store_lecture(writer), await store_lecture(writer)
+        await writer.write(make_responses(first, 2) + make_responses(second, 1))
+        return [(await writer.lectures.find_one({"_id": lecture["_id"]}))["response_count"] for lecture in (first, second)]
+
+    assert asyncio.run(run()) == [2, 1]
+
+def test_count_update_is_retried_on_its_own():
+    writer = make_writer()
+    writer.retry_delay = 0
+
+    async def run():
+        lecture = await store_lecture(writer)
+        documents = make_responses(lecture, 3)
+        update_one = writer.lectures.update_one
+        failures = [RuntimeError("mongo blip")]
+
+        async def flaky_update(*args, **kwargs):
+            if failures:
+                raise failures.pop()
+            return await update_one(*args, **kwargs)
+
+        writer.lectures.update_one = flaky_update
+        written = await writer.write(documents)
+        writer.lectures.update_one = update_one
+        # Written again, e.g. if the flush was retried: nothing new is inserted or counted
+        rewritten = await writer.write(documents)
+        lecture = await writer.lectures.find_one({"_id": lecture["_id"]})
+        return written, rewritten, lecture["response_count"], await writer.responses.count_documents({})
+
+    assert asyncio.run(run()) == (3, 0, 3, 3)
+
+def test_counts_add_to_responses_stored_by_other_writers():
+    writer = make_writer()
+
+    async def run():
+        lecture = await store_lecture(writer)
+        # Stored by another route, which counted it itself
+        await writer.responses.insert_one(make_responses(lecture, 1)[0])
+        await writer.lectures.update_one({"_id": lecture["_id"]}, {"$inc": {"response_count": 1}})
+        await writer.write(make_responses(lecture, 2))
+        return (await writer.lectures.find_one({"_id": lecture["_id"]}))["response_count"]
+
+    assert asyncio.run(run()) == 3
+
+def test_partly_failed_insert_counts_what_was_inserted():
+    writer = make_writer()
+
+    async def run():
+        lecture = await store_lecture(writer)
+        documents = make_responses(lecture, 3)
+        insert_many = writer.responses.insert_many
+
+        # The second document is rejected, e.g. for being too large
+        async def partly_failing_insert(batch, ordered=True):
+            await insert_many([batch[0], batch[2]], ordered=ordered)
+            raise BulkWriteError({"writeErrors": [{"index": 1, "code": 10334, "errmsg": "too large"}], "nInserted": 2})
+
+        writer.responses.insert_many = partly_failing_insert
+        with pytest.raises(StudentResponseWriteError) as error:
+            await writer.write(documents)
+        return error.value.inserted, (await writer.lectures.find_one({"_id": lecture["_id"]}))["response_count"]
+
+    assert asyncio.run(run()) == (2, 2)
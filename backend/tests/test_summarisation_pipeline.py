@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+from utilities.bounded_executor import QueueFullError
+from utilities.chunker import Chunker, fingerprint
+from utilities.summarisation_pipeline import SummarisationPipeline
+
+# Fake LLM that records how many summarise calls are running at the same time.
+class FakeLLM():
+    def __init__(self, fail_on=None, delay=0.02):
+        self.fail_on = fail_on or set()
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chunker = Chunker(tokenizer=lambda text: text.split())
+
+    async def asummarise(self, content, user=None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if content == "overloaded":
+            raise QueueFullError("busy")
+        if content in self.fail_on:
+            raise RuntimeError("backend error")
+        return f"summary of {content}"
+
+    async def astream_summarise(self, content, user=None):
+        if content in self.fail_on:
+            raise RuntimeError("backend error")
+        for word in ["summary", " of", f" {content}"]:
+            await asyncio.sleep(0)
+            yield word
+
+    async def amerge_summaries(self, summaries, user=None):
+        self.merges = getattr(self, "merges", 0) + 1
+        return "merged(" + ",".join(summaries) + ")"
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+def test_summarise_chunks_keeps_order():
+    pipeline = SummarisationPipeline(FakeLLM(), concurrency=4)
+    chunks = [f"chunk {i}" for i in range(10)]
+    summaries = asyncio.run(pipeline.summarise_chunks(chunks))
+    assert summaries == [f"summary of chunk {i}" for i in range(10)]
+
+def test_summarise_chunks_respects_concurrency_limit():
+    llm = FakeLLM()
+    pipeline = SummarisationPipeline(llm, concurrency=3)
+    asyncio.run(pipeline.summarise_chunks([f"chunk {i}" for i in range(9)]))
+    assert 1 < llm.max_in_flight <= 3
+
+def test_summarise_chunks_failed_chunk_returns_none():
+    pipeline = SummarisationPipeline(FakeLLM(fail_on={"bad"}), concurrency=2, max_retries=1)
+    summaries = asyncio.run(pipeline.summarise_chunks(["good", "bad", "also good"]))
+    assert summaries == ["summary of good", None, "summary of also good"]
+
+def test_summarise_chunks_queue_full_is_not_swallowed():
+    pipeline = SummarisationPipeline(FakeLLM(), concurrency=2)
+    with pytest.raises(QueueFullError):
+        asyncio.run(pipeline.summarise_chunks(["good", "overloaded"]))
+
+def test_stream_chunks_reports_progress_and_ordered_summaries():
+    pipeline = SummarisationPipeline(FakeLLM(fail_on={"bad"}), concurrency=2, max_retries=0)
+
+    async def collect():
+        return [event async for event in pipeline.stream_chunks(["first", "bad", "third"])]
+
+    events = asyncio.run(collect())
+    finished = [event for event in events if event["event"] in ("chunk_done", "chunk_failed")]
+    assert [event["completed"] for event in finished] == [1, 2, 3]
+    assert events[-1] == {"event": "done", "summaries": ["summary of first", "summary of third"], "failed_chunks": [1]}
+
+def test_map_reduce_output_fits_token_budget():
+    llm = FakeLLM(delay=0)
+    pipeline = SummarisationPipeline(llm, concurrency=4)
+    chunks = [f"chunk{i}" for i in range(20)]
+    result = asyncio.run(pipeline.map_reduce(chunks, token_budget=8, group_token_budget=9))
+    # Each chunk summary is 3 "tokens", so 20 of them must be merged over several levels.
+    assert result["levels"] > 2
+    assert sum(llm.count_tokens(summary) for summary in result["summaries"]) <= 8
+    assert llm.count_tokens(result["lecture_summary"]) <= 8
+    assert result["failed_chunks"] == []
+
+def test_map_reduce_small_input_is_not_merged():
+    llm = FakeLLM(delay=0)
+    pipeline = SummarisationPipeline(llm)
+    result = asyncio.run(pipeline.map_reduce(["only"], token_budget=100))
+    assert result == {"summaries": ["summary of only"], "lecture_summary": "summary of only", "levels": 1, "failed_chunks": []}
+    assert getattr(llm, "merges", 0) == 0
+
+def test_reused_chunks_skip_the_llm():
+    llm = FakeLLM()
+    pipeline = SummarisationPipeline(llm)
+    reuse = {fingerprint("b"): "earlier summary of b"}
+    summaries = asyncio.run(pipeline.summarise_chunks(["a", "b", "c"], reuse=reuse))
+    assert summaries == ["summary of a", "earlier summary of b", "summary of c"]
+
+    async def stream():
+        return [event async for event in pipeline.stream_chunks(["a", "b"], reuse=reuse)]
+
+    events = asyncio.run(stream())
+    assert [event["index"] for event in events if event.get("reused")] == [1]
+    assert events[-1]["summaries"] == ["summary of a", "earlier summary of b"]
@@ -0,0 +1,31 @@
+import asyncio
+from mongomock_motor import AsyncMongoMockClient
+from utilities.chunker import Chunk
+from utilities.summary_manifest import SummaryManifests
+
+def make_manifests():
+    return SummaryManifests(AsyncMongoMockClient().manifest_db.summary_manifests)
+
+def test_load_returns_summaries_of_the_last_upload():
+    manifests = make_manifests()
+
+    async def run():
+        await manifests.save("user", "deck.pptx", [Chunk("slide one", 1, 1), "slide two"], ["summary one", None], "v1", "model-a")
+        return await manifests.load("user", "deck.pptx", "v1", "model-a"), await manifests.load("user", "other.pptx", "v1", "model-a")
+
+    reusable, other = asyncio.run(run())
+    # Failed chunks aren't reused
+    assert list(reusable.values()) == ["summary one"]
+    assert other == {}
+
+def test_summaries_from_other_prompts_or_models_are_not_reused():
+    manifests = make_manifests()
+
+    async def run():
+        await manifests.save("user", "deck.pptx", ["slide one"], ["summary one"], "v1", "model-a")
+        return (
+            await manifests.load("user", "deck.pptx", "v2", "model-a"),
+            await manifests.load("user", "deck.pptx", "v1", "model-b")
+        )
+
+    assert asyncio.run(run()) == ({}, {})
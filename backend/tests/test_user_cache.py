@@ -0,0 +1,37 @@
+import time
+from utilities.user_cache import UserCache
+
+def test_get_returns_cached_user_for_same_token():
+    cache = UserCache(ttl_seconds=60)
+    cache.set("user1", 100, {"_id": "user1", "username": "alice"})
+
+    assert cache.get("user1", 100) == {"_id": "user1", "username": "alice"}
+    # A token issued at a different time is looked up fresh.
+    assert cache.get("user1", 200) is None
+    assert cache.hits == 1 and cache.misses == 1
+
+def test_entries_expire_after_ttl():
+    cache = UserCache(ttl_seconds=0.01)
+    cache.set("user1", 100, {"_id": "user1"})
+    time.sleep(0.02)
+    assert cache.get("user1", 100) is None
+    assert cache.stats()["entries"] == 0
+
+def test_invalidate_drops_every_token_for_user():
+    cache = UserCache()
+    cache.set("user1", 100, {"_id": "user1"})
+    cache.set("user1", 200, {"_id": "user1"})
+    cache.set("user2", 100, {"_id": "user2"})
+
+    cache.invalidate("user1")
+
+    assert cache.get("user1", 100) is None
+    assert cache.get("user1", 200) is None
+    assert cache.get("user2", 100) == {"_id": "user2"}
+
+def test_oldest_entries_are_evicted():
+    cache = UserCache(max_entries=2)
+    for user_id in ("user1", "user2", "user3"):
+        cache.set(user_id, 100, {"_id": user_id})
+    assert cache.get("user1", 100) is None
+    assert cache.get("user3", 100) == {"_id": "user3"}
@@ -0,0 +1,92 @@
+import asyncio
+from utilities.write_behind import WriteBehindBuffer
+
+class Recorder():
+    def __init__(self, failures: int = 0):
+        self.batches = []
+        self.failures = failures
+
+    async def flush(self, batch: list):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("MongoDB unavailable")
+        self.batches.append(list(batch))
+
+def test_flushes_full_batches_without_waiting_for_the_interval():
+    recorder = Recorder()
+
+    async def run():
+        buffer = WriteBehindBuffer(recorder.flush, max_batch=3, flush_interval=60)
+        buffer.start()
+        for item in range(7):
+            assert buffer.add(item)
+        await asyncio.sleep(0.05)
+        flushed = list(recorder.batches)
+        await buffer.stop()
+        return flushed
+
+    flushed = asyncio.run(run())
+    assert flushed == [[0, 1, 2], [3, 4, 5]]
+    assert recorder.batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_flushes_partial_batches_on_the_interval():
+    recorder = Recorder()
+
+    async def run():
+        buffer = WriteBehindBuffer(recorder.flush, max_batch=100, flush_interval=0.01)
+        buffer.start()
+        buffer.add("a")
+        buffer.add("b")
+        await asyncio.sleep(0.1)
+        flushed = list(recorder.batches)
+        await buffer.stop()
+        return flushed
+
+    assert asyncio.run(run()) == [["a", "b"]]
+
+def test_retries_failed_flushes_in_order():
+    recorder = Recorder(failures=2)
+
+    async def run():
+        buffer = WriteBehindBuffer(recorder.flush, max_batch=2, flush_interval=0.01, retry_delay=0.001)
+        buffer.start()
+        for item in range(3):
+            buffer.add(item)
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(run())
+    assert recorder.batches == [[0, 1], [2]]
+    assert not buffer.pending
+
+def test_drops_a_batch_after_max_retries():
+    recorder = Recorder(failures=2)
+
+    async def run():
+        buffer = WriteBehindBuffer(recorder.flush, max_batch=1, max_retries=1, retry_delay=0.001)
+        buffer.add("lost")
+        buffer.add("kept")
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert recorder.batches == [["kept"]]
+
+def test_stop_drains_the_buffer_and_refuses_new_items():
+    recorder = Recorder()
+
+    async def run():
+        buffer = WriteBehindBuffer(recorder.flush, max_batch=10, flush_interval=60)
+        buffer.start()
+        buffer.add("first")
+        await buffer.stop()
+        return buffer.add("late")
+
+    assert asyncio.run(run()) is False
+    assert recorder.batches == [["first"]]
+
+def test_add_refuses_items_when_full():
+    buffer = WriteBehindBuffer(Recorder().flush, max_batch=10, max_pending=2)
+    assert buffer.add(1)
+    assert buffer.add(2)
+    assert not buffer.add(3)
+    assert list(buffer.pending) == [1, 2]
@@ -3,29 +3,57 @@ import jwt
 import os
 from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from utilities.bounded_executor import BoundedExecutor
 
 class AuthHelpers():
     def __init__(self):
         load_dotenv()
         self.SECRET_KEY = os.getenv("SECRET_AUTH_KEY") 
+        # bcrypt work factor for new hashes. Existing hashes with a different cost are rehashed at login.
+        self.bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        # bcrypt takes 100ms+ of CPU per call, so the async versions below run it on a small thread pool
+        # (bcrypt releases the GIL) instead of the event loop. Calls beyond BCRYPT_MAX_QUEUE waiting
+        # are rejected with QueueFullError, so a login burst can't take every core from the LLM routes.
+        self.executor = BoundedExecutor(
+            max_workers=int(os.getenv("BCRYPT_WORKERS", "2")),
+            max_queue=int(os.getenv("BCRYPT_MAX_QUEUE", "32")),
+            thread_name_prefix="bcrypt"
+        )
     
     # Hashes passwords for storage in user_credentials collection in MongoDB
     def hash_password(self, password: str) -> str:
-        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds=self.bcrypt_rounds)).decode("utf-8")
 
     # Verifies string password against it's hash for verification
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         return bcrypt.checkpw(plain_password.encode("utf-8"), hashed_password.encode("utf-8"))
 
+    # Async versions of hash_password and verify_password, for use in routes
+    async def ahash_password(self, password: str) -> str:
+        return await self.executor.run(self.hash_password, password)
+
+    async def averify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await self.executor.run(self.verify_password, plain_password, hashed_password)
+
+    # True if the hash was made with a different work factor than bcrypt_rounds. Hashes look like
+    # $2b$12$<salt and hash>, where 12 is the cost.
+    def needs_rehash(self, hashed_password: str) -> bool:
+        try:
+            return int(hashed_password.split("$")[2]) != self.bcrypt_rounds
+        except (IndexError, ValueError):
+            return True
+
     # Creates an access token for authorisation features in the frontend
     def create_access_token(self, data: dict) -> str:
         to_encode = data.copy()
         
-        # Tokens expire after 1 hour, prompting re-login
-        expire = datetime.now(timezone.utc) + timedelta(hours=1)
-        to_encode.update({"exp": expire})
+        # Tokens expire after 1 hour, prompting re-login. iat (issued at) is part of the user cache key.
+        issued_at = datetime.now(timezone.utc)
+        expire = issued_at + timedelta(hours=1)
+        to_encode.update({"exp": expire, "iat": issued_at})
         
         token = jwt.encode(to_encode, self.SECRET_KEY, algorithm="HS256")
         return token
-    
 
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,274 @@
+import yaml
+import random
+from llama_index.core.utils import get_tokenizer
+from utilities.chunker import Chunker
+from utilities.llm_timings import LLMTimings
+from utilities.prompt_registry import PromptRegistry, NON_PERSONA_PROMPTS
+from utilities.observability import log
+
+# This file contains the behaviour shared by every LLM backend (OllamaLLM, LLM and FakeLLM). Prompt
+# loading and message building live here, and each backend only has to say how a list of
+# chat messages is turned into a completion:
+#   _chat(messages)        - blocking call, used by notebooks and scripts.
+#   _achat(messages)       - non-blocking call, used by the FastAPI routes so a long generation
+#                            never stalls the event loop.
+#   _astream_chat(messages) - async generator yielding the reply token by token as the backend
+#                            produces it, used by the streaming routes.
+# Summaries and evaluations are close enough to deterministic that, when a ResponseCache is set,
+# they are served from it instead of running the model again. Questions are never cached since
+# they are meant to vary between calls.
+#
+# Chunks are sized to fill the backend's context window: whatever is left after the summarise
+# prompt, the chat template and the summary itself, counted with the backend's own tokenizer. So
+# a lecture is summarised in as few calls (and system prompt prefills) as possible without
+# overflowing the context. Backends that don't know their context length keep chunk_size.
+
+# Tokens added by the chat template around the messages (role markers, [INST] tags etc.)
+CHAT_TEMPLATE_TOKENS = 64
+# Chunks never get smaller than this, however little room the prompt leaves
+MIN_CHUNK_SIZE = 128
+
+class BaseLLM():
+    def __init__(self, prompt_registry: PromptRegistry = None):
+        # Prompts are parsed once and shared, rather than re-reading the YAML file on every call.
+        self.prompt_registry = prompt_registry or PromptRegistry.shared()
+        self._personas_override = None
+        # Set by subclasses, both are part of the response cache key.
+        self.model = ""
+        self.sampling_options = {}
+        self.cache = None
+        # Prefill/decode time of every request, filled in by the backends.
+        self.timings = LLMTimings()
+        # Chunking settings, the chunker itself is built the first time it is needed. chunk_size
+        # is only used as is if adaptive_chunking is off or the context length is unknown.
+        self.chunk_size = 512
+        self.chunk_overlap = 20
+        self.adaptive_chunking = True
+        # Tokens kept free in the context window for the summary of each chunk
+        self.summary_max_tokens = 512
+        self._chunker = None
+
+    # All prompts and personas, served from the prompt registry. Can be replaced with a dict,
+    # e.g. to try out a different set of personas.
+    @property
+    def personas(self) -> dict:
+        if self._personas_override is not None:
+            return self._personas_override
+        return self.prompt_registry.prompts
+
+    @personas.setter
+    def personas(self, value: dict):
+        self._personas_override = value
+
+    # Helper function to get a prompt, served from memory by the prompt registry
+    def load_prompt(self, prompt: str, filepath: str = None) -> str:
+        registry = self.prompt_registry
+        if filepath is not None and filepath != registry.filepath:
+            registry = PromptRegistry.shared(filepath)
+        return registry.get(prompt)
+
+    # Function to load all prompts from YAML file
+    def _load_personas(self, filepath: str) -> dict:
+        try:
+            with open(filepath, 'r') as file:
+                data = yaml.safe_load(file)
+                return data
+        except FileNotFoundError:
+            log(f"File not found: {filepath}")
+        except yaml.YAMLError as e:
+            log(f"Error parsing YAML file: {e}")
+        except Exception as e:
+            log(f"Unexpected error: {e}")
+        return {}
+
+    # Function to randomly choose a persona from an array of personas. The registry keeps the
+    # list of persona keys with each version of the prompts, so it isn't rebuilt on every call.
+    def _choose_random_persona(self) -> str:
+        if self._personas_override is not None:
+            persona_keys = [key for key in self._personas_override if key not in NON_PERSONA_PROMPTS]
+        else:
+            persona_keys = self.prompt_registry.persona_keys
+        chosen_persona = random.choice(persona_keys)
+        return chosen_persona
+
+    # Builds the messages for generating a student question with the given persona, or a random one
+    def _query_messages(self, query: str, student: str = "default_student", persona: str = None) -> list:
+        student_prompt = self.load_prompt(prompt=student)
+
+        chosen_persona_key = persona or self._choose_random_persona()
+        chosen_persona_description = self.personas[chosen_persona_key]
+
+        final_prompt = f"{student_prompt}\n\nPersona: {chosen_persona_description}"
+
+        return [
+            {"role": "system", "content": final_prompt},
+            {"role": "user", "content": query}
+        ]
+
+    # Builds the messages for evaluating the users answer to a generated question. context is a
+    # list of the lecture chunks most relevant to the question, if the lecture is known.
+    def _evaluate_messages(self, question: str, answer: str, context: list = None) -> list:
+        evaluation_prompt = self.load_prompt(prompt="evaluate_response")
+        lecture_context = "Lecture Context:\n" + "\n\n".join(context) + "\n\n" if context else ""
+        return [
+            {"role": "system", "content": evaluation_prompt},
+            {"role": "user", "content": lecture_context+"Question: "+question+"\n\nAnswer: "+answer}
+        ]
+
+    # Builds the messages for summarising a chunk of lecture content
+    def _summarise_messages(self, content: str) -> list:
+        summarise_prompt = self.load_prompt(prompt="summarise")
+        return [
+            {"role": "system", "content": summarise_prompt},
+            {"role": "user", "content": content}
+        ]
+
+    # Builds the messages for combining consecutive section summaries into one
+    def _merge_messages(self, summaries: list) -> list:
+        merge_prompt = self.load_prompt(prompt="merge_summaries")
+        sections = "\n\n".join(f"Section {number}: {summary}" for number, summary in enumerate(summaries, start=1))
+        return [
+            {"role": "system", "content": merge_prompt},
+            {"role": "user", "content": sections}
+        ]
+
+    # Backend specific. Blocking chat completion, returns the content of the reply.
+    def _chat(self, messages: list) -> str:
+        raise NotImplementedError
+
+    # Backend specific. Non-blocking chat completion, returns the content of the reply. user
+    # identifies who the request is for, so backends that queue requests can share fairly.
+    async def _achat(self, messages: list, user: str = None) -> str:
+        raise NotImplementedError
+
+    # Backend specific. Async generator yielding pieces of the reply as they are generated.
+    async def _astream_chat(self, messages: list, user: str = None):
+        raise NotImplementedError
+        yield
+
+    # Backend specific. Returns False if the backend can't currently serve requests. Used by the
+    # LLM router to take backends out of rotation; in-process backends are always healthy.
+    async def ahealth_check(self) -> bool:
+        return True
+
+    # Looks the call up in the response cache before running it, storing the result on a miss.
+    async def _acached_chat(self, kind: str, messages: list, user: str = None) -> str:
+        if self.cache is None:
+            return await self._achat(messages, user)
+
+        key = self.cache.make_key(kind, messages, self.model, self.sampling_options)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return cached
+
+        output = await self._achat(messages, user)
+        if output:
+            await self.cache.set(key, output, kind=kind)
+        return output
+
+    # Streaming version of _acached_chat. A hit is sent as a single token.
+    async def _astream_cached_chat(self, kind: str, messages: list, user: str = None):
+        if self.cache is None:
+            async for token in self._astream_chat(messages, user):
+                yield token
+            return
+
+        key = self.cache.make_key(kind, messages, self.model, self.sampling_options)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for token in self._astream_chat(messages, user):
+            parts.append(token)
+            yield token
+        if parts:
+            await self.cache.set(key, "".join(parts), kind=kind)
+
+    # Main function to query LLM
+    def query(self, query: str, student: str = "default_student") -> str:
+        return self._chat(self._query_messages(query, student))
+
+    # Function to evaluate the quality of the users response based on the LLM generated question.
+    def evaluate(self, question: str, answer: str) -> str:
+        return self._chat(self._evaluate_messages(question, answer))
+
+    # Function to summarise content to condense information that has been extracted from PDFs/Powerpoints.
+    def summarise(self, content) -> str:
+        return self._chat(self._summarise_messages(content))
+
+    # Async versions of the above, used by the server routes.
+    async def aquery(self, query: str, student: str = "default_student", user: str = None, persona: str = None) -> str:
+        return await self._achat(self._query_messages(query, student, persona), user)
+
+    async def aevaluate(self, question: str, answer: str, user: str = None, context: list = None) -> str:
+        return await self._acached_chat("evaluate", self._evaluate_messages(question, answer, context), user)
+
+    async def asummarise(self, content, user: str = None) -> str:
+        return await self._acached_chat("summarise", self._summarise_messages(content), user)
+
+    # Combines summaries of consecutive sections into one, used for map-reduce summarisation.
+    # Cached like summarise, so unchanged levels of a re-summarised lecture are reused.
+    async def amerge_summaries(self, summaries: list, user: str = None) -> str:
+        return await self._acached_chat("merge_summaries", self._merge_messages(summaries), user)
+
+    # Streaming versions, yielding tokens as they are generated.
+    async def astream_query(self, query: str, student: str = "default_student", user: str = None):
+        async for token in self._astream_chat(self._query_messages(query, student), user):
+            yield token
+
+    async def astream_evaluate(self, question: str, answer: str, user: str = None, context: list = None):
+        async for token in self._astream_cached_chat("evaluate", self._evaluate_messages(question, answer, context), user):
+            yield token
+
+    async def astream_summarise(self, content, user: str = None):
+        async for token in self._astream_cached_chat("summarise", self._summarise_messages(content), user):
+            yield token
+
+    # Backend specific. Returns a function turning text into the model's tokens, or None if the
+    # backend has no local tokenizer (llama_index's default is used for counting instead).
+    def tokenizer(self):
+        return None
+
+    # Backend specific. Size of the model's context window in tokens, or None if it isn't known.
+    def context_length(self):
+        return None
+
+    # Largest chunk that fits in the context window along with the summarise prompt and a summary
+    # of up to summary_max_tokens. Backends without a local tokenizer are counted with llama_index's
+    # default one, which only approximates theirs, so 10% is kept back to be safe.
+    def adaptive_chunk_size(self) -> int:
+        context_length = self.context_length()
+        if not context_length:
+            return self.chunk_size
+        tokenizer = self.tokenizer()
+        count = tokenizer or get_tokenizer()
+        prompt_tokens = len(count(self.load_prompt(prompt="summarise") or "")) + CHAT_TEMPLATE_TOKENS
+        available = context_length - prompt_tokens - self.summary_max_tokens
+        if tokenizer is None:
+            available = int(available * 0.9)
+        return max(MIN_CHUNK_SIZE, available)
+
+    # Chunker sized for this backend, built once and reused for every document.
+    @property
+    def chunker(self) -> Chunker:
+        if self._chunker is None:
+            chunk_size = self.adaptive_chunk_size() if self.adaptive_chunking else self.chunk_size
+            self._chunker = Chunker(chunk_size=chunk_size, chunk_overlap=self.chunk_overlap, tokenizer=self.tokenizer())
+        return self._chunker
+
+    # Sets a fixed chunk size/overlap instead of sizing chunks to the context window.
+    def configure_chunking(self, chunk_size: int, chunk_overlap: int):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.adaptive_chunking = False
+        self._chunker = None
+
+    # Number of tokens in text for this backend
+    def count_tokens(self, text: str) -> int:
+        return self.chunker.count_tokens(text)
+
+    # Function to chunk text into chunks sized for this backend. Sentence Splitter aims to keep paragraphs and sentences intact.
+    def split_text(self, extracted_text) -> list:
+        return self.chunker.split_text(extracted_text)
@@ -0,0 +1,139 @@
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from utilities.bounded_executor import QueueFullError
+
+# A queued call waiting to be run by the scheduler
+class ScheduledRequest():
+    def __init__(self, fn, prefix_key: str, future: asyncio.Future):
+        self.fn = fn
+        self.prefix_key = prefix_key
+        self.future = future
+
+# Sits in front of a single llama.cpp model, which can only generate for one request at a time.
+# Requests are queued per user and collected into micro-batches: once work arrives, the scheduler
+# waits up to max_wait seconds for up to max_batch_size requests, taking one request from each user
+# in turn so one user's burst can't starve everyone else. Within a batch, requests that share a
+# system prompt run back to back, so llama.cpp can reuse the already evaluated prompt prefix
+# instead of processing it again for every request.
+class BatchScheduler():
+    def __init__(self, max_batch_size: int = 4, max_wait: float = 0.02, max_queue: int = 8):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="batch-scheduler")
+        self.queues = OrderedDict()
+        self.pending = 0
+        self.running = 0
+        self._arrival = None
+        self._worker = None
+
+    # Number of requests waiting to be run
+    @property
+    def queued(self) -> int:
+        return self.pending
+
+    # Starts the scheduling loop on the running event loop if it isn't already running
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._arrival = asyncio.Event()
+            self._worker = asyncio.create_task(self._run())
+
+    # Queues fn (a blocking callable) and waits for its result. prefix_key identifies the prompt
+    # prefix (e.g. the system prompt) and user_key the user the request is queued under.
+    async def submit(self, fn, prefix_key: str = "", user_key: str = None):
+        if self.pending >= self.max_queue:
+            raise QueueFullError("Too many requests are waiting for this backend. Please try again shortly.")
+        self._ensure_worker()
+
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(user_key, deque()).append(ScheduledRequest(fn, prefix_key, future))
+        self.pending += 1
+        self._arrival.set()
+        return await future
+
+    # Takes up to max_batch_size requests, one per user in turn. Users who were served move to the
+    # back of the order so the next batch starts with someone else.
+    def _take_batch(self) -> list:
+        batch = []
+        while len(batch) < self.max_batch_size and self.queues:
+            for user_key in list(self.queues):
+                if len(batch) >= self.max_batch_size:
+                    break
+                user_queue = self.queues[user_key]
+                request = user_queue.popleft()
+                self.pending -= 1
+                if not request.future.cancelled():
+                    batch.append(request)
+                if user_queue:
+                    self.queues.move_to_end(user_key)
+                else:
+                    del self.queues[user_key]
+        return batch
+
+    # Orders a batch so requests with the same prefix are next to each other, keeping the order in
+    # which each prefix first appeared.
+    @staticmethod
+    def _group_by_prefix(batch: list) -> list:
+        first_seen = {}
+        for position, request in enumerate(batch):
+            first_seen.setdefault(request.prefix_key, position)
+        return sorted(batch, key=lambda request: first_seen[request.prefix_key])
+
+    # Runs a batch on the worker thread, resolving each request's future as soon as it finishes.
+    def _run_batch(self, loop, batch: list):
+        for request in batch:
+            if request.future.cancelled():
+                continue
+            try:
+                result = request.fn()
+            except Exception as e:
+                loop.call_soon_threadsafe(self._resolve, request.future, None, e)
+            else:
+                loop.call_soon_threadsafe(self._resolve, request.future, result, None)
+
+    @staticmethod
+    def _resolve(future: asyncio.Future, result, error):
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    # Scheduling loop: waits for work, gives the batch max_wait seconds to fill, then runs it.
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._arrival.wait()
+            self._arrival.clear()
+            if not self.pending:
+                continue
+
+            deadline = loop.time() + self.max_wait
+            while self.pending < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._arrival.wait(), remaining)
+                    self._arrival.clear()
+                except asyncio.TimeoutError:
+                    break
+
+            batch = self._group_by_prefix(self._take_batch())
+            if not batch:
+                continue
+            self.running = len(batch)
+            try:
+                await loop.run_in_executor(self.executor, self._run_batch, loop, batch)
+            finally:
+                self.running = 0
+            # Requests that arrived while the batch was running are picked up straight away.
+            if self.pending:
+                self._arrival.set()
+
+    def shutdown(self, wait: bool = True):
+        if self._worker is not None:
+            self._worker.cancel()
+        self.executor.shutdown(wait=wait)
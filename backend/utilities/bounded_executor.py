@@ -0,0 +1,37 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# Raised when more work is submitted than the executor is allowed to queue. Routes turn this
+# into a 503 so the client can back off, rather than piling requests up behind a busy backend.
+class QueueFullError(Exception):
+    pass
+
+# Runs blocking functions (e.g. llama.cpp generation) on a dedicated thread pool so they never
+# block the event loop. The number of calls waiting for a worker is capped at max_queue.
+class BoundedExecutor():
+    def __init__(self, max_workers: int = 1, max_queue: int = 8, thread_name_prefix: str = "bounded-executor"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        # Only touched from the event loop thread, so no lock is needed.
+        self.pending = 0
+
+    # Number of calls that are waiting for a free worker.
+    @property
+    def queued(self) -> int:
+        return max(0, self.pending - self.max_workers)
+
+    # Runs fn(*args, **kwargs) on the pool and awaits its result.
+    async def run(self, fn, *args, **kwargs):
+        if self.pending >= self.max_workers + self.max_queue:
+            raise QueueFullError("Too many requests are waiting for this backend. Please try again shortly.")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.pending -= 1
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,58 @@
+import asyncio
+from utilities.bounded_executor import QueueFullError
+from utilities.observability import log
+
+# Grades many answers to questions on one lecture in a single request, for marking a whole class at
+# once. Answers are evaluated concurrently (at most `concurrency` LLM calls at a time) and progress
+# events are yielded in the order they finish, so the client can show results as they arrive
+# instead of waiting for the slowest one.
+
+class BulkEvaluator():
+    def __init__(self, llm, concurrency: int = 4, max_retries: int = 1):
+        self.llm = llm
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+
+    # Evaluates one item, retrying on failure. Returns (index, evaluation, error), with evaluation
+    # None if every attempt failed. get_context, if given, is awaited with the item to find the
+    # lecture context for it; if that fails only this item fails.
+    async def _evaluate(self, semaphore: asyncio.Semaphore, index: int, item, user: str = None, get_context=None) -> tuple:
+        async with semaphore:
+            try:
+                context = await get_context(item) if get_context is not None else None
+            except Exception as e:
+                log(f"Error finding the lecture context for item {index}: {e}")
+                return index, None, "The lecture context for this answer couldn't be loaded. Please try again."
+            error = None
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return index, await self.llm.aevaluate(item.question, item.answer, user=user, context=context), None
+                except QueueFullError as e:
+                    # The backend is overloaded, retrying straight away won't help.
+                    error = str(e)
+                    break
+                except Exception as e:
+                    log(f"Error evaluating item {index} (attempt {attempt + 1}): {e}")
+                    error = "The LLM failed to evaluate this answer. Please try again."
+            return index, None, error
+
+    # Yields an item_done (with the evaluation) or item_failed (with the error) event as each item
+    # finishes, with completed/total counts for progress bars, then a "done" event holding the
+    # results of every item in the order they were given.
+    async def stream(self, items: list, user: str = None, get_context=None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.create_task(self._evaluate(semaphore, index, item, user, get_context)) for index, item in enumerate(items)]
+        results = [None] * len(items)
+        try:
+            for completed, task in enumerate(asyncio.as_completed(tasks), start=1):
+                index, evaluation, error = await task
+                results[index] = {"index": index, "evaluation": evaluation, "error": error}
+                if evaluation is not None:
+                    yield {"event": "item_done", "index": index, "evaluation": evaluation, "completed": completed, "total": len(items)}
+                else:
+                    yield {"event": "item_failed", "index": index, "detail": error, "completed": completed, "total": len(items)}
+        finally:
+            # Stop any outstanding work if the consumer goes away early.
+            for task in tasks:
+                task.cancel()
+        yield {"event": "done", "results": results}
@@ -0,0 +1,143 @@
+import bisect
+import hashlib
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.utils import get_tokenizer
+from utilities.observability import observe_stage
+
+# A chunk of lecture text along with the pages (or slides) it came from, numbered from 1.
+# Chunks from a manually entered summary have no pages.
+class Chunk():
+    def __init__(self, text: str, start_page: int = None, end_page: int = None):
+        self.text = text
+        self.start_page = start_page
+        self.end_page = end_page
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "start_page": self.start_page, "end_page": self.end_page}
+
+# Hash of text ignoring differences in whitespace, used to recognise pages and chunks that haven't
+# changed between two uploads of a lecture.
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:32]
+
+# Splits lecture text into chunks for the LLM. The SentenceSplitter is built once and reused.
+# tokenizer should be the active backend's tokenizer so chunk_size is measured in the model's
+# own tokens; if it is None llama_index's default tokenizer is used.
+class Chunker():
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 20, tokenizer=None):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.sentence_splitter = SentenceSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, tokenizer=self.tokenizer)
+        # How much page text to buffer before splitting. Roughly four chunks, assuming ~4 characters
+        # per token, so a chunk is only cut at the end of the buffer when a page is very long.
+        self.buffer_chars = chunk_size * 4 * 4
+
+    # Number of tokens in text, counted the same way as chunk sizes
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text)) if text else 0
+
+    # Function to chunk text. Sentence Splitter aims to keep paragraphs and sentences intact.
+    def split_text(self, text: str) -> list:
+        if not text:
+            return []
+        with observe_stage("chunk"):
+            return self.sentence_splitter.split_text(text)
+
+    # Splits the buffered text and works out which pages each chunk came from. page_starts holds
+    # the offset of each page in the buffer and first_page is the number of the first one.
+    def _split_buffer(self, buffer: str, page_starts: list, first_page: int) -> list:
+        chunks = []
+        search_from = 0
+        for text in self.split_text(buffer):
+            # The splitter may trim whitespace, so look the chunk up by a prefix. Chunks come out
+            # in order, so the search can start from where the previous chunk started.
+            start = buffer.find(text[:64], search_from)
+            if start == -1:
+                start = search_from
+            end = start + len(text)
+            start_page = first_page + bisect.bisect_right(page_starts, start) - 1
+            end_page = first_page + bisect.bisect_right(page_starts, max(start, end - 1)) - 1
+            chunks.append((start, Chunk(text, start_page, end_page)))
+            search_from = start
+        return chunks
+
+    # Consumes a stream of pages and yields chunks as soon as enough text is buffered, so the
+    # first chunks are ready while later pages are still being extracted. Only a few chunks of
+    # text are held in memory at once rather than the whole document.
+    async def aiter_chunks(self, pages):
+        buffer = ""
+        page_starts = []
+        first_page = 1
+        page_number = 0
+
+        async for page_text in pages:
+            page_number += 1
+            if not page_starts:
+                first_page = page_number
+            page_starts.append(len(buffer))
+            buffer += page_text
+
+            if len(buffer) < self.buffer_chars:
+                continue
+
+            chunks = self._split_buffer(buffer, page_starts, first_page)
+            if len(chunks) < 2:
+                continue
+            # Everything but the last chunk is final. The last one may continue onto the next
+            # page, so it stays in the buffer and is split again with the following text.
+            for _, chunk in chunks[:-1]:
+                yield chunk
+            tail_start = chunks[-1][0]
+            tail_page_index = bisect.bisect_right(page_starts, tail_start) - 1
+            first_page += tail_page_index
+            page_starts = [max(0, offset - tail_start) for offset in page_starts[tail_page_index:]]
+            buffer = buffer[tail_start:]
+
+        for _, chunk in self._split_buffer(buffer, page_starts, first_page):
+            yield chunk
+
+    # True if a page-aligned chunk should end after this page. Depends only on the page itself, with
+    # a chance proportional to its size, so chunks average about half of chunk_size.
+    def _is_boundary(self, page_text: str, tokens: int) -> bool:
+        return int(fingerprint(page_text)[:8], 16) / 0xFFFFFFFF < 2 * tokens / self.chunk_size
+
+    # Page-aligned version of aiter_chunks, for uploads that are likely to be edited and uploaded
+    # again. Chunks only ever hold whole pages (a page too long for one chunk is split on its own),
+    # and where a chunk ends is decided by the content of its pages rather than everything before
+    # them, or by the next page not fitting. Editing a page then only changes the chunk holding it,
+    # and the chunks after an edit line up with the old ones again at the next boundary, so their
+    # summaries can be reused.
+    async def aiter_page_chunks(self, pages):
+        group = []
+        group_tokens = 0
+        first_page = 1
+        page_number = 0
+
+        async for page_text in pages:
+            page_number += 1
+            tokens = self.count_tokens(page_text)
+            if group and group_tokens + tokens > self.chunk_size:
+                text = "".join(group).strip()
+                if text:
+                    yield Chunk(text, first_page, page_number - 1)
+                group, group_tokens = [], 0
+
+            if tokens > self.chunk_size:
+                for text in self.split_text(page_text):
+                    yield Chunk(text, page_number, page_number)
+                continue
+
+            if not group:
+                first_page = page_number
+            group.append(page_text)
+            group_tokens += tokens
+            if self._is_boundary(page_text, tokens):
+                text = "".join(group).strip()
+                if text:
+                    yield Chunk(text, first_page, page_number)
+                group, group_tokens = [], 0
+
+        text = "".join(group).strip()
+        if text:
+            yield Chunk(text, first_page, page_number)
@@ -0,0 +1,32 @@
+from contextlib import asynccontextmanager
+
+# Raised when a key already has as many requests in progress as it is allowed. Routes turn this
+# into a 429 so the client backs off.
+class TooManyRequestsError(Exception):
+    pass
+
+# Caps how many requests can be in progress at once for any one key (e.g. a client IP or an email
+# address). Used on /login and /register so a credential stuffing burst from one source can only
+# ever occupy a few password hashing slots.
+class ConcurrencyLimiter():
+    def __init__(self, max_per_key: int = 2):
+        self.max_per_key = max(1, max_per_key)
+        # Only touched from the event loop thread, so no lock is needed.
+        self.in_progress = {}
+
+    # Holds a slot for every key for the duration of the block. Keys that are None are ignored.
+    # Raises TooManyRequestsError without taking any slots if one of the keys is at its limit.
+    @asynccontextmanager
+    async def limit(self, *keys):
+        keys = [key for key in dict.fromkeys(keys) if key is not None]
+        if any(self.in_progress.get(key, 0) >= self.max_per_key for key in keys):
+            raise TooManyRequestsError("Too many attempts in progress. Please wait and try again.")
+        for key in keys:
+            self.in_progress[key] = self.in_progress.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            for key in keys:
+                self.in_progress[key] -= 1
+                if not self.in_progress[key]:
+                    del self.in_progress[key]
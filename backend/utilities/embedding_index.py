@@ -0,0 +1,121 @@
+import asyncio
+import re
+import zlib
+import numpy as np
+from bson.binary import Binary
+from collections import OrderedDict
+from datetime import datetime, timezone
+from utilities.observability import CACHE_LOOKUPS
+
+# Per-lecture vector index over the chunk summaries of a stored lecture, so question generation and
+# evaluation can be grounded on the few chunks relevant to them instead of the whole lecture.
+# Embeddings are computed on the CPU with the hashing trick (no model to download or load): each
+# word and pair of words is hashed into one of `dimensions` buckets, and the vectors are
+# normalised so a dot product is the cosine similarity. The index is a NumPy float32 matrix with
+# one row per chunk, saved in the lecture_embeddings collection next to the lecture and kept in a
+# small in-process LRU once loaded.
+
+class HashingEmbedder():
+    def __init__(self, dimensions: int = 512):
+        self.dimensions = dimensions
+        # Saved with each index, so indexes built with different settings are rebuilt rather than mixed
+        self.name = f"hashing-v1-{dimensions}"
+
+    # Words and pairs of consecutive words. Hashed with crc32 rather than hash(), which changes
+    # between processes and would make saved indexes useless after a restart.
+    def _features(self, text: str) -> list:
+        words = re.findall(r"\w+", text.lower())
+        return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    # Embeds each text as a row of a (len(texts), dimensions) float32 matrix with unit length rows
+    def embed(self, texts: list) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array([zlib.crc32(feature.encode("utf-8")) for feature in self._features(text)], dtype=np.uint64)
+            if not len(hashes):
+                continue
+            # The top bit picks the sign, so colliding features tend to cancel out rather than add up
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], (hashes % self.dimensions).astype(np.int64), signs)
+        # Dampens words repeated many times in one chunk
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+class LectureIndex():
+    def __init__(self, texts: list, matrix: np.ndarray, user_id=None):
+        self.texts = texts
+        self.matrix = matrix
+        self.user_id = user_id
+
+    # The k texts most similar to the query embedding, most similar first
+    def search(self, query_vector: np.ndarray, k: int = 3) -> list:
+        if not self.texts or k <= 0:
+            return []
+        scores = self.matrix @ query_vector
+        k = min(k, len(self.texts))
+        # Only the top k are sorted, rather than every chunk of a long lecture
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.texts[index] for index in top[np.argsort(-scores[top])]]
+
+class EmbeddingIndexStore():
+    def __init__(self, collection, embedder: HashingEmbedder = None, max_cached: int = 64):
+        self.collection = collection
+        self.embedder = embedder or HashingEmbedder()
+        self.max_cached = max_cached
+        self.cached = OrderedDict()
+
+    def _remember(self, lecture_id, index: LectureIndex):
+        self.cached[lecture_id] = index
+        self.cached.move_to_end(lecture_id)
+        while len(self.cached) > self.max_cached:
+            self.cached.popitem(last=False)
+
+    # Embeds the texts of a lecture and saves the index. Embedding runs in a thread so long
+    # lectures don't hold up the event loop. Returns the number of texts indexed.
+    async def build(self, lecture_id, user_id, texts: list) -> int:
+        texts = list(dict.fromkeys(text for text in texts if text and text.strip()))
+        if not texts:
+            return 0
+        matrix = await asyncio.to_thread(self.embedder.embed, texts)
+        await self.collection.replace_one(
+            {"_id": lecture_id},
+            {
+                "_id": lecture_id,
+                "user_id": user_id,
+                "embedder": self.embedder.name,
+                "texts": texts,
+                "matrix": Binary(matrix.tobytes()),
+                "created_at": datetime.now(timezone.utc)
+            },
+            upsert=True
+        )
+        self._remember(lecture_id, LectureIndex(texts, matrix, user_id))
+        return len(texts)
+
+    # Loads the index of one of the user's lectures, or None if it has none. An index saved by a
+    # different embedder is re-embedded from its texts.
+    async def get(self, lecture_id, user_id):
+        index = self.cached.get(lecture_id)
+        if index is not None:
+            self.cached.move_to_end(lecture_id)
+            CACHE_LOOKUPS.labels("embedding_index", "hit").inc()
+        else:
+            CACHE_LOOKUPS.labels("embedding_index", "miss").inc()
+            document = await self.collection.find_one({"_id": lecture_id})
+            if document is None:
+                return None
+            if document["embedder"] == self.embedder.name:
+                matrix = np.frombuffer(document["matrix"], dtype=np.float32).reshape(len(document["texts"]), -1)
+            else:
+                matrix = await asyncio.to_thread(self.embedder.embed, document["texts"])
+            index = LectureIndex(document["texts"], matrix, document["user_id"])
+            self._remember(lecture_id, index)
+        return index if index.user_id == user_id else None
+
+    # The k chunks of a lecture most relevant to query, or [] if the lecture has no index
+    async def search(self, lecture_id, user_id, query: str, k: int = 3) -> list:
+        index = await self.get(lecture_id, user_id)
+        if index is None:
+            return []
+        return index.search(self.embedder.embed([query])[0], k)
@@ -1,28 +1,213 @@
+import asyncio
+import os
+import tempfile
+import time
+import weakref
 import fitz  # PyMuPDF
+from concurrent.futures import ProcessPoolExecutor
 from pptx import Presentation
 from io import BytesIO
+from utilities.observability import STAGE_SECONDS, EXTRACTED_PAGES
 
-class ExtractionTool:
-    def __init__(self):
+# Raised when a document can't be opened or parsed.
+class ExtractionError(Exception):
+    pass
+
+# Raised when a document is bigger than the configured page or byte limits.
+class ExtractionLimitError(ExtractionError):
+    pass
+
+# An upload copied to a temporary file, so extraction can open it by path instead of holding the
+# whole file in memory (and pickling it to every worker process). The file is removed once its
+# pages have been streamed, or when the object is garbage collected if they never are.
+class SpooledUpload():
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._remover = weakref.finalize(self, _remove_file, path)
+
+    def remove(self):
+        self._remover()
+
+    # Yields from pages, an extraction stream reading this file, removing the file when it ends
+    async def stream(self, pages):
+        try:
+            async for page in pages:
+                yield page
+        finally:
+            self.remove()
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
         pass
 
+# Runs fn in a worker process and returns its result with how long it took there, so extraction
+# time is measured without the time spent waiting for a free worker.
+def _timed(fn, *args) -> tuple:
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+# Opens a PDF from either raw bytes or a path on disk
+def _open_pdf(source):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open("pdf", source)
+    return fitz.open(source)
+
+# Opens a PowerPoint from either raw bytes or a path on disk
+def _open_pptx(source):
+    if isinstance(source, (bytes, bytearray)):
+        # Use BytesIO to read the byte content as a file-like object
+        return Presentation(BytesIO(source))
+    return Presentation(source)
+
+# Returns the number of pages in a PDF without extracting any text. Also run in the process pool.
+def _count_pdf_pages(source) -> int:
+    try:
+        with _open_pdf(source) as pdf_doc:
+            return len(pdf_doc)
+    except Exception as e:
+        raise ExtractionError(f"Unable to open PDF: {e}")
+
+# Worker function, run in the process pool. Extracts the text of pages [start, end) of a PDF.
+def _extract_pdf_page_range(source, start: int, end: int) -> list:
+    with _open_pdf(source) as pdf_doc:
+        return [pdf_doc.load_page(page_num).get_text() for page_num in range(start, end)]
+
+# Worker function, run in the process pool. Extracts the text of every slide of a PowerPoint.
+def _extract_pptx_slides(source) -> list:
+    presentation = _open_pptx(source)
+    slides = []
+    for slide in presentation.slides:
+        slides.append("".join(shape.text + "\n" for shape in slide.shapes if shape.has_text_frame))
+    return slides
+
+# Extracts text from PDFs and PowerPoints. Parsing runs in a process pool so large documents
+# don't block the server, and PDFs are split into page ranges that are parsed in parallel.
+# Pages/slides are yielded in order as soon as they are ready so later stages can start early.
+class ExtractionTool:
+    def __init__(self, max_workers: int = None, pages_per_task: int = 20, max_pages: int = None, max_bytes: int = None, spool_directory: str = None):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.pages_per_task = pages_per_task
+        self.max_pages = max_pages
+        self.max_bytes = max_bytes
+        # Where uploads are spooled, None for the system's temporary directory
+        self.spool_directory = spool_directory
+        self.executor = None
+
+    # The pool is only started the first time a document is extracted
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    # Rejects documents over max_bytes before any parsing is done
+    def _check_size(self, source):
+        if self.max_bytes is None:
+            return
+        size = len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source)
+        if size > self.max_bytes:
+            raise ExtractionLimitError(f"File is too large ({size} bytes). The maximum size is {self.max_bytes} bytes.")
+
+    # Copies an upload (anything with an async read(size), e.g. FastAPI's UploadFile) to a temporary
+    # file chunk_size bytes at a time, so memory use doesn't grow with the size of the file. Uploads
+    # over max_bytes are rejected as soon as that many bytes have been read (or straight away if the
+    # size is known up front) and the partial file is removed.
+    async def spool_upload(self, upload, chunk_size: int = 1024 * 1024) -> SpooledUpload:
+        known_size = getattr(upload, "size", None)
+        if self.max_bytes is not None and known_size is not None and known_size > self.max_bytes:
+            raise ExtractionLimitError(f"File is too large ({known_size} bytes). The maximum size is {self.max_bytes} bytes.")
+
+        descriptor, path = tempfile.mkstemp(prefix="upload-", dir=self.spool_directory)
+        spooled = None
+        try:
+            size = 0
+            with os.fdopen(descriptor, "wb") as output:
+                while True:
+                    data = await upload.read(chunk_size)
+                    if not data:
+                        break
+                    size += len(data)
+                    if self.max_bytes is not None and size > self.max_bytes:
+                        raise ExtractionLimitError(f"File is too large (over {self.max_bytes} bytes). The maximum size is {self.max_bytes} bytes.")
+                    await asyncio.to_thread(output.write, data)
+            spooled = SpooledUpload(path, size)
+            return spooled
+        finally:
+            if spooled is None:
+                _remove_file(path)
+
+    # Rejects documents over max_pages
+    def _check_page_count(self, page_count: int):
+        if self.max_pages is not None and page_count > self.max_pages:
+            raise ExtractionLimitError(f"Document has too many pages ({page_count}). The maximum is {self.max_pages}.")
+
+    # Yields the text of each PDF page, in-process
+    def iter_pdf_pages(self, source):
+        self._check_size(source)
+        self._check_page_count(_count_pdf_pages(source))
+        with _open_pdf(source) as pdf_doc:
+            for page_num in range(len(pdf_doc)):
+                yield pdf_doc.load_page(page_num).get_text()
+
+    # Yields the text of each slide, in-process
+    def iter_pptx_slides(self, source):
+        self._check_size(source)
+        slides = _extract_pptx_slides(source)
+        self._check_page_count(len(slides))
+        yield from slides
+
+    # Yields the text of each PDF page. Page ranges are parsed in parallel in the process pool,
+    # and yielded in order as each range finishes.
+    async def aiter_pdf_pages(self, source):
+        self._check_size(source)
+        loop = asyncio.get_running_loop()
+        page_count = await loop.run_in_executor(self._get_executor(), _count_pdf_pages, source)
+        self._check_page_count(page_count)
+
+        ranges = [(start, min(start + self.pages_per_task, page_count)) for start in range(0, page_count, self.pages_per_task)]
+        futures = [loop.run_in_executor(self._get_executor(), _timed, _extract_pdf_page_range, source, start, end) for start, end in ranges]
+        try:
+            for future in futures:
+                try:
+                    pages, seconds = await future
+                except Exception as e:
+                    raise ExtractionError(f"Unable to extract text from PDF: {e}")
+                STAGE_SECONDS.labels("extract_pdf").observe(seconds)
+                EXTRACTED_PAGES.labels("pdf").inc(len(pages))
+                for page in pages:
+                    yield page
+        finally:
+            # If the consumer stops early, don't keep parsing pages nobody will read.
+            for future in futures:
+                future.cancel()
+
+    # Yields the text of each slide. python-pptx has to load the whole file, so a PowerPoint is
+    # parsed by a single worker.
+    async def aiter_pptx_slides(self, source):
+        self._check_size(source)
+        loop = asyncio.get_running_loop()
+        try:
+            slides, seconds = await loop.run_in_executor(self._get_executor(), _timed, _extract_pptx_slides, source)
+        except Exception as e:
+            raise ExtractionError(f"Unable to extract text from PowerPoint: {e}")
+        STAGE_SECONDS.labels("extract_pptx").observe(seconds)
+        EXTRACTED_PAGES.labels("pptx").inc(len(slides))
+        self._check_page_count(len(slides))
+        for slide in slides:
+            yield slide
+
     # Function to extract text from PDF files using fitz
     def extract_text_from_pdf(self, pdf_bytes: bytes) -> str:
-        # Use the byte stream directly with PyMuPDF
-        with fitz.open("pdf", pdf_bytes) as pdf_doc:
-            text = ""
-            for page_num in range(len(pdf_doc)):
-                page = pdf_doc.load_page(page_num)
-                text += page.get_text()
-            return text
+        return "".join(self.iter_pdf_pages(pdf_bytes))
 
     # Function to extract text from PowerPoint files using Presentation
     def extract_text_from_pptx(self, file_bytes: bytes) -> str:
-        text = ""
-        # Use BytesIO to read the byte content as a file-like object
-        presentation = Presentation(BytesIO(file_bytes))
-        for slide in presentation.slides:
-            for shape in slide.shapes:
-                if shape.has_text_frame:
-                    text += shape.text + "\n"
-        return text
+        return "".join(self.iter_pptx_slides(file_bytes))
@@ -0,0 +1,65 @@
+import asyncio
+import time
+from utilities.base_llm import BaseLLM
+from utilities.prompt_registry import PromptRegistry
+
+# In-process stand-in for a real LLM backend, for local testing and benchmarks without Ollama or a
+# GGUF model. Replies are deterministic: the first max_tokens words of the user message, prefixed
+# with the model name, so the same input always gives the same output (and hits the response
+# cache the same way a real backend would). token_latency and first_token_latency (seconds)
+# simulate decode and prefill time. context_length (tokens) turns on adaptive chunk sizing, as for
+# a real backend; without it chunks stay at chunk_size.
+
+class FakeLLM(BaseLLM):
+    def __init__(self, prompt_registry: PromptRegistry = None, model: str = "fake", max_tokens: int = 32, token_latency: float = 0.0, first_token_latency: float = 0.0, context_length: int = None):
+        super().__init__(prompt_registry)
+        self.model = model
+        self.sampling_options = {}
+        self.max_tokens = max_tokens
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        self._context_length = context_length
+        # Set to make the backend fail, e.g. to test health checks and failover.
+        self.healthy = True
+
+    # Splits the reply into tokens, one word each
+    def _reply_tokens(self, messages: list) -> list:
+        if not self.healthy:
+            raise ConnectionError(f"Fake backend {self.model} is down")
+        user = " ".join(message["content"] for message in messages if message["role"] == "user")
+        words = user.split()[:self.max_tokens]
+        return [f"[{self.model}]"] + [f" {word}" for word in words]
+
+    def _record(self, prompt_tokens: int, output_tokens: int):
+        self.timings.record(
+            prompt_tokens=prompt_tokens,
+            prefill_seconds=self.first_token_latency,
+            output_tokens=output_tokens,
+            decode_seconds=self.token_latency * output_tokens
+        )
+
+    def _chat(self, messages: list) -> str:
+        tokens = self._reply_tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        self._record(sum(len(message["content"].split()) for message in messages), len(tokens))
+        return "".join(tokens)
+
+    async def _achat(self, messages: list, user: str = None) -> str:
+        tokens = self._reply_tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        self._record(sum(len(message["content"].split()) for message in messages), len(tokens))
+        return "".join(tokens)
+
+    async def _astream_chat(self, messages: list, user: str = None):
+        tokens = self._reply_tokens(messages)
+        await asyncio.sleep(self.first_token_latency)
+        for token in tokens:
+            await asyncio.sleep(self.token_latency)
+            yield token
+        self._record(sum(len(message["content"].split()) for message in messages), len(tokens))
+
+    def context_length(self):
+        return self._context_length
+
+    async def ahealth_check(self) -> bool:
+        return self.healthy
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+from datetime import datetime, timezone
+from pymongo import InsertOne
+from utilities.mongodb_helper import MongoDBHelper
+
+# Migrates the old user_message_history collection (one document per user, with every lecture and
+# every student response pushed into nested arrays) to the lectures and student_responses
+# collections. Lectures keep their original _id, so lecture ids held by the frontend stay valid.
+# Safe to run more than once: lectures that already exist in the new collection are skipped, and
+# migrated history documents are marked with migrated_at.
+#
+# Run from the backend folder with:   python -m utilities.history_migration [--dry-run]
+
+# Converts one lecture from the old embedded format into a lecture document and its response documents
+def split_lecture(user_id, lecture: dict) -> tuple:
+    students = lecture.get("students", [])
+    created_at = lecture.get("created_at") or datetime.now(timezone.utc)
+    lecture_document = {
+        "_id": lecture["_id"],
+        "user_id": user_id,
+        "lecture_summary": lecture.get("lecture_summary", ""),
+        "lecture_file_name": lecture.get("lecture_file_name", ""),
+        "created_at": created_at,
+        "response_count": len(students)
+    }
+    response_documents = [
+        {
+            "lecture_id": lecture["_id"],
+            "user_id": user_id,
+            "question": student.get("question", ""),
+            "response": student.get("response", ""),
+            "evaluation": student.get("evaluation", ""),
+            # The old format had no timestamps per response, so keep their order within the lecture.
+            "created_at": created_at,
+            "position": position
+        }
+        for position, student in enumerate(students)
+    ]
+    return lecture_document, response_documents
+
+# Migrates every user history document. Returns counts of what was (or would be) written.
+async def migrate_user_message_history(mdb: MongoDBHelper, dry_run: bool = False) -> dict:
+    counts = {"users": 0, "lectures": 0, "responses": 0, "skipped_lectures": 0}
+    history_collection = mdb.get_user_message_history_collection()
+    lecture_collection = mdb.get_lecture_collection()
+    response_collection = mdb.get_student_response_collection()
+
+    async for user_history in history_collection.find({"migrated_at": {"$exists": False}}):
+        counts["users"] += 1
+        lecture_writes = []
+        response_writes = []
+        lecture_ids = []
+        for lecture in user_history.get("lectures", []):
+            if await lecture_collection.find_one({"_id": lecture["_id"]}, {"_id": 1}):
+                counts["skipped_lectures"] += 1
+                continue
+            lecture_document, response_documents = split_lecture(user_history["user_id"], lecture)
+            lecture_ids.append(lecture["_id"])
+            lecture_writes.append(InsertOne(lecture_document))
+            response_writes.extend(InsertOne(document) for document in response_documents)
+
+        counts["lectures"] += len(lecture_writes)
+        counts["responses"] += len(response_writes)
+        if dry_run:
+            continue
+
+        # Responses are written before their lectures, so if the migration is interrupted the
+        # lecture is retried in full on the next run rather than left without its responses. Any
+        # responses an interrupted run already wrote for these lectures are removed first so they
+        # aren't inserted twice. Lectures not in the lectures collection yet can't have been given
+        # new responses through the API, so nothing else is removed.
+        if lecture_ids:
+            await response_collection.delete_many({"lecture_id": {"$in": lecture_ids}})
+        if response_writes:
+            await response_collection.bulk_write(response_writes, ordered=False)
+        if lecture_writes:
+            await lecture_collection.bulk_write(lecture_writes, ordered=False)
+        await history_collection.update_one(
+            {"_id": user_history["_id"]},
+            {"$set": {"migrated_at": datetime.now(timezone.utc)}}
+        )
+
+    return counts
+
+async def main(dry_run: bool):
+    mdb = MongoDBHelper()
+    await mdb.ensure_indexes()
+    counts = await migrate_user_message_history(mdb, dry_run=dry_run)
+    prefix = "Would migrate" if dry_run else "Migrated"
+    print(f"{prefix} {counts['lectures']} lectures and {counts['responses']} student responses "
+          f"for {counts['users']} users ({counts['skipped_lectures']} lectures already migrated).")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate user_message_history to the lectures and student_responses collections.")
+    parser.add_argument("--dry-run", action="store_true", help="Count what would be migrated without writing anything.")
+    asyncio.run(main(parser.parse_args().dry_run))
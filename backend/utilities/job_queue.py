@@ -0,0 +1,246 @@
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, ReturnDocument
+from bson import ObjectId
+from utilities.bounded_executor import QueueFullError
+from utilities.summarisation_pipeline import SummarisationPipeline, _iterate
+from utilities.chunker import Chunk
+from utilities.observability import trace_id, log
+
+# Durable queue of summarisation jobs stored in MongoDB, so large uploads don't have to hold an
+# HTTP connection open while every chunk goes through the LLM. Submitting a job stores its chunks
+# in the chunks collection and returns straight away; background workers then claim jobs by taking
+# a lease, which they keep renewing (heartbeats) while they work. Each chunk summary is saved as
+# soon as it is ready, so if a worker dies its lease runs out and whichever worker claims the job
+# next only summarises the chunks that aren't finished yet.
+#
+# Job statuses: queued -> running -> completed | failed. A running job whose lease has expired
+# can be claimed again.
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+class SummarisationJobQueue():
+    def __init__(self, jobs_collection, chunks_collection, pipeline: SummarisationPipeline, lease_seconds: float = 60, heartbeat_interval: float = None, poll_interval: float = 1.0, max_attempts: int = 3, retry_delay: float = 5.0):
+        self.jobs = jobs_collection
+        self.chunks = chunks_collection
+        self.pipeline = pipeline
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.workers = []
+
+    # Creates the indexes used to claim jobs and load their chunks. Called once on server startup.
+    async def ensure_indexes(self):
+        try:
+            await self.jobs.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+            await self.chunks.create_index([("job_id", ASCENDING), ("index", ASCENDING)], unique=True)
+        except Exception as e:
+            log(f"Error creating job queue indexes: {e}")
+
+    # Stores the chunks for a new job and queues it. Returns the job document. Chunks are written in
+    # batches as they are read, so a large document is never held in memory as a whole. If reading
+    # the chunks fails (e.g. the upload is over the page limit) nothing is queued and the error is raised.
+    # user is the key the LLM schedules the job's requests under, user_id the owner of the job.
+    async def submit(self, chunks, mode: str = "chunks", token_budget: int = None, group_token_budget: int = None, user: str = None, user_id=None, batch_size: int = 64) -> dict:
+        job_id = ObjectId()
+        total = 0
+        batch = []
+        try:
+            async for chunk in _iterate(chunks):
+                document = {"job_id": job_id, "index": total, "status": "pending", "summary": None}
+                if isinstance(chunk, Chunk):
+                    document.update(chunk.to_dict())
+                else:
+                    document.update({"text": chunk, "start_page": None, "end_page": None})
+                batch.append(document)
+                total += 1
+                if len(batch) >= batch_size:
+                    await self.chunks.insert_many(batch)
+                    batch = []
+            if batch:
+                await self.chunks.insert_many(batch)
+        except BaseException:
+            await self.chunks.delete_many({"job_id": job_id})
+            raise
+
+        now = _now()
+        job = {
+            "_id": job_id,
+            "status": "queued",
+            "mode": mode,
+            "token_budget": token_budget,
+            "group_token_budget": group_token_budget,
+            "user": user,
+            "user_id": user_id,
+            "total_chunks": total,
+            "completed_chunks": 0,
+            "failed_chunks": [],
+            "attempts": 0,
+            "lease_owner": None,
+            # Queued jobs can be claimed straight away
+            "lease_expires_at": now,
+            "created_at": now,
+            "updated_at": now,
+            "result": None,
+            "error": None
+        }
+        await self.jobs.insert_one(job)
+        return job
+
+    # Returns the job with the given id (without its lease details), or None. With user_id, only
+    # returns the job if it belongs to that user.
+    async def get(self, job_id: ObjectId, user_id=None):
+        query = {"_id": job_id} if user_id is None else {"_id": job_id, "user_id": user_id}
+        return await self.jobs.find_one(query, {"lease_owner": 0, "lease_expires_at": 0})
+
+    # Claims the oldest job that is queued or whose worker stopped renewing its lease
+    async def claim(self):
+        now = _now()
+        return await self.jobs.find_one_and_update(
+            {"status": {"$in": ["queued", "running"]}, "lease_expires_at": {"$lte": now}},
+            {
+                "$set": {"status": "running", "lease_owner": self.worker_id, "lease_expires_at": now + timedelta(seconds=self.lease_seconds), "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("created_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    # Extends the lease on a job. Returns False if another worker has taken it over.
+    async def heartbeat(self, job_id: ObjectId) -> bool:
+        result = await self.jobs.update_one(
+            {"_id": job_id, "lease_owner": self.worker_id},
+            {"$set": {"lease_expires_at": _now() + timedelta(seconds=self.lease_seconds)}}
+        )
+        return result.matched_count == 1
+
+    # Gives up a job so it can be claimed again after delay seconds
+    async def release(self, job_id: ObjectId, delay: float = 0):
+        await self.jobs.update_one(
+            {"_id": job_id, "lease_owner": self.worker_id},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_expires_at": _now() + timedelta(seconds=delay), "updated_at": _now()}}
+        )
+
+    async def _finish(self, job_id: ObjectId, status: str, result: dict = None, error: str = None):
+        await self.jobs.update_one(
+            {"_id": job_id, "lease_owner": self.worker_id},
+            {"$set": {"status": status, "result": result, "error": error, "lease_owner": None, "updated_at": _now()}}
+        )
+
+    # Saves one chunk summary (None if the chunk failed) and counts it towards the job's progress.
+    # The chunk is only counted the first time, so a job picked up again never counts a chunk twice.
+    async def _checkpoint(self, job_id: ObjectId, index: int, summary):
+        result = await self.chunks.update_one(
+            {"job_id": job_id, "index": index, "status": "pending"},
+            {"$set": {"status": "done" if summary is not None else "failed", "summary": summary}}
+        )
+        if result.modified_count:
+            update = {"$inc": {"completed_chunks": 1}, "$set": {"updated_at": _now()}}
+            if summary is None:
+                update["$push"] = {"failed_chunks": index}
+            await self.jobs.update_one({"_id": job_id}, update)
+
+    # Summarises the chunks of a job that aren't finished yet, then builds the job's result from
+    # every chunk summary in the same format as the /summarise route.
+    async def _process(self, job: dict):
+        pending = await self.chunks.find({"job_id": job["_id"], "status": "pending"}, {"index": 1, "text": 1}).sort("index", ASCENDING).to_list(length=None)
+
+        async def on_result(position: int, summary):
+            await self._checkpoint(job["_id"], pending[position]["index"], summary)
+
+        await self.pipeline.summarise_chunks([chunk["text"] for chunk in pending], user=job.get("user"), on_result=on_result)
+
+        chunk_summaries = [
+            chunk["summary"] if chunk["status"] == "done" else None
+            async for chunk in self.chunks.find({"job_id": job["_id"]}, {"status": 1, "summary": 1}).sort("index", ASCENDING)
+        ]
+        if chunk_summaries and all(summary is None for summary in chunk_summaries):
+            await self._finish(job["_id"], "failed", error="The LLM failed to summarise the provided content. Please try again.")
+            return
+
+        if job["mode"] == "map_reduce":
+            budgets = {key: job[key] for key in ("token_budget", "group_token_budget") if job.get(key)}
+            result = await self.pipeline.reduce_summaries(chunk_summaries, user=job.get("user"), **budgets)
+        else:
+            result = {
+                "summaries": [summary for summary in chunk_summaries if summary is not None],
+                "failed_chunks": [index for index, summary in enumerate(chunk_summaries) if summary is None]
+            }
+        await self._finish(job["_id"], "completed", result=result)
+        # The chunks are only needed until the result is saved
+        await self.chunks.delete_many({"job_id": job["_id"]})
+
+    # Runs a job, renewing its lease until it finishes. Stops working on the job if the lease is lost.
+    # Log lines written while the job runs are tagged with the job id.
+    async def run_job(self, job: dict):
+        trace_id.set(f"job-{job['_id']}")
+        work = asyncio.create_task(self._process(job))
+        try:
+            while True:
+                done, _ = await asyncio.wait({work}, timeout=self.heartbeat_interval)
+                if done:
+                    return work.result()
+                if not await self.heartbeat(job["_id"]):
+                    log(f"Lost the lease on summarisation job {job['_id']}, stopping")
+                    work.cancel()
+                    return
+        finally:
+            work.cancel()
+
+    # Runs a claimed job. A failed job is retried after retry_delay seconds, up to max_attempts times.
+    # If the LLM backend is overloaded the job is put back without using an attempt.
+    async def _handle(self, job: dict):
+        try:
+            await self.run_job(job)
+        except QueueFullError:
+            await self.jobs.update_one({"_id": job["_id"]}, {"$inc": {"attempts": -1}})
+            await self.release(job["_id"], self.retry_delay)
+        except asyncio.CancelledError:
+            # Shutting down, let another worker pick the job up straight away. If that fails the
+            # lease runs out and the job is picked up then.
+            try:
+                await asyncio.shield(self.release(job["_id"]))
+            except Exception as e:
+                log(f"Error releasing summarisation job {job['_id']} on shutdown: {e}")
+            raise
+        except Exception as e:
+            log(f"Error running summarisation job {job['_id']} (attempt {job['attempts']}): {e}")
+            if job["attempts"] >= self.max_attempts:
+                await self._finish(job["_id"], "failed", error=str(e))
+            else:
+                await self.release(job["_id"], self.retry_delay)
+
+    # Claims and runs jobs until cancelled. Errors talking to MongoDB are logged and the worker tries
+    # again after poll_interval, rather than stopping. A job whose release was lost this way is
+    # claimed again when its lease runs out.
+    async def _worker_loop(self):
+        while True:
+            try:
+                job = await self.claim()
+                if job is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self._handle(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log(f"Error in summarisation worker {self.worker_id}: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    # Starts count worker tasks on the running event loop
+    def start(self, count: int = 1):
+        for _ in range(count):
+            self.workers.append(asyncio.create_task(self._worker_loop()))
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
@@ -1,10 +1,15 @@
+import asyncio
+import threading
+import time
 from llama_cpp import Llama
-from llama_index.core.node_parser import SentenceSplitter
-import yaml
-import random
+from utilities.base_llm import BaseLLM
+from utilities.prompt_registry import PromptRegistry
+from utilities.batch_scheduler import BatchScheduler
+from utilities.prefix_cache import PrefixStateCache
 
-class LLM():
-    def __init__(self, model:str = "./gguf/mistral-7b-instruct-v0.2.Q4_K_M.gguf", n_ctx:int = 8192, n_gpu_layers:int = -1):
+class LLM(BaseLLM):
+    def __init__(self, model:str = "./gguf/mistral-7b-instruct-v0.2.Q4_K_M.gguf", n_ctx:int = 8192, n_gpu_layers:int = -1, max_queue:int = 8, max_batch_size:int = 4, max_batch_wait:float = 0.02, max_prefix_states:int = 8, prompt_registry: PromptRegistry = None):
+        super().__init__(prompt_registry)
         self.llm = Llama(
             model_path=model,
             n_ctx=n_ctx,
@@ -12,94 +17,98 @@ class LLM():
             n_gpu_layers=n_gpu_layers,
             chat_format="llama-2"
         )
-        self.personas = self._load_personas("./prompts/prompts.yaml")
+        self.model = model
+        self.sampling_options = {"temperature": 0.5}
+        # llama-cpp-python has no async API and a single Llama instance can't generate for two
+        # requests at once, so every generation goes through the batch scheduler, which runs them
+        # on one worker thread. Requests sharing a system prompt are run back to back so llama.cpp
+        # only evaluates the prompt prefix once, and users take turns. At most max_queue requests
+        # wait before new ones are rejected.
+        self.scheduler = BatchScheduler(max_batch_size=max_batch_size, max_wait=max_batch_wait, max_queue=max_queue)
+        # The system prompts are the same for every request, so their evaluated state is saved
+        # and reused rather than prefilled each time.
+        self.prefix_cache = PrefixStateCache(self.llm, max_entries=max_prefix_states)
 
-    # Helper function to load prompts from YAML file
-    def load_prompt(self, prompt: str, filepath: str = "./prompts/prompts.yaml") -> str:
-        try:
-            with open(filepath, 'r') as file:
-                data = yaml.safe_load(file)
-                prompt_text = data.get(prompt, "")
-                if not prompt_text:
-                    raise ValueError(f"No text found for the prompt '{prompt}' in the YAML file.")
-                return prompt_text
-        except FileNotFoundError:
-            print(f"File not found: {filepath}")
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML file: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        return ""
-    
-    # Function to load all prompts from YAML file
-    def _load_personas(self, filepath: str) -> dict:
-        try:
-            with open(filepath, 'r') as file:
-                data = yaml.safe_load(file)
-                return data
-        except FileNotFoundError:
-            print(f"File not found: {filepath}")
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML file: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        return {}
-    
-    # Function to randomly choose a persona from an array of personas
-    def _choose_random_persona(self) -> str:
-        personas_without_default = {key: value for key, value in self.personas.items() if key != "default_student" and key != "evaluate_response" and key != "summarise"}
-        chosen_persona = random.choice(list(personas_without_default.keys()))
-        return chosen_persona
+    # Counts chunk sizes with the GGUF model's own tokenizer.
+    def tokenizer(self):
+        return lambda text: self.llm.tokenize(text.encode("utf-8"), add_bos=False)
+
+    # The n_ctx the model was loaded with, chunks are sized to fill it.
+    def context_length(self):
+        return self.llm.n_ctx()
 
-    # Main function to query LLM
-    def query(self, query:str, student:str = "default_student") -> str:
-        student_prompt = self.load_prompt(prompt=student)
+    # Formats the messages with the Mistral/Llama 2 instruct template (the "llama-2" chat format).
+    # Returns the prompt and its prefix, i.e. everything before the user's message, which is
+    # identical for every request using the same system prompt.
+    def _format_prompt(self, messages: list) -> tuple:
+        system = "\n".join(message["content"] for message in messages if message["role"] == "system")
+        user = "\n".join(message["content"] for message in messages if message["role"] == "user")
+        prefix = f"[INST] <<SYS>>\n{system}\n<</SYS>>\n\n" if system else "[INST] "
+        return prefix, f"{prefix}{user} [/INST]"
 
-        chosen_persona_key = self._choose_random_persona()
-        chosen_persona_description = self.personas[chosen_persona_key]
-        
-        final_prompt = f"{student_prompt}\n\nPersona: {chosen_persona_description}"
-        
-        messages = [
-            {"role": "system", "content": final_prompt},
-            {"role": "user", "content": query}
-        ]
+    # Runs one completion on the worker thread. on_token is called with each piece of the reply
+    # as it is generated, and setting stop ends generation early. Prefill (loading/evaluating the
+    # prefix and processing the rest of the prompt, up to the first token) and decode times are
+    # recorded in self.timings.
+    def _generate(self, messages: list, on_token=None, stop: threading.Event = None) -> str:
+        prefix, prompt = self._format_prompt(messages)
+        started = time.perf_counter()
+        cached_tokens = self.prefix_cache.prime(prefix)
 
-        output = self.llm.create_chat_completion(messages=messages, temperature=0.5)                                  
-        output = output['choices'][0]['message']['content']
-        return output
+        parts = []
+        first_token_at = None
+        for part in self.llm.create_completion(prompt=prompt, max_tokens=None, stream=True, **self.sampling_options):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            if stop is not None and stop.is_set():
+                break
+            token = part['choices'][0]['text']
+            if token:
+                parts.append(token)
+                if on_token is not None:
+                    on_token(token)
+        finished = time.perf_counter()
 
-    # Function to evaluate the quality of the users response based on the LLM generated question.
-    def evaluate(self, question: str, answer: str) -> str:
-        
-        evaluation_prompt = self.load_prompt(prompt="evaluate_response")
+        first_token_at = first_token_at or finished
+        self.timings.record(
+            prompt_tokens=len(self.llm.tokenize(prompt.encode("utf-8"), add_bos=True)),
+            prefill_seconds=first_token_at - started,
+            output_tokens=len(parts),
+            decode_seconds=finished - first_token_at,
+            cached_prompt_tokens=cached_tokens
+        )
+        return "".join(parts)
+
+    def _chat(self, messages: list) -> str:
+        return self._generate(messages)
 
-        messages = [
-            {"role": "system", "content": evaluation_prompt},
-            {"role": "user", "content": "Question: "+question+"\n\nAnswer: "+answer}
-        ]
+    async def _achat(self, messages: list, user: str = None) -> str:
+        return await self.scheduler.submit(lambda: self._generate(messages), prefix_key=messages[0]["content"], user_key=user)
 
-        output = self.llm.create_chat_completion(messages=messages,temperature=0.5)
-        output = output['choices'][0]['message']['content']
-        return output
-    
-    # Function to chunk text using a chunk sizes of 512. Sentence Splitter aims to keep paragraphs and sentences intact.
-    def split_text(self, extracted_text) -> list:
-        sentence_splitter = SentenceSplitter(chunk_size=512, chunk_overlap=20)
-        sentences = sentence_splitter.split_text(extracted_text)
-        return sentences
-    
-    # Function to summarise content to condense information that has been extracted from PDFs/Powerpoints.
-    def summarise(self, content) -> str:
-        summarise_prompt = self.load_prompt(prompt="summarise")
-        messages = [
-            {"role": "system", "content": summarise_prompt},
-            {"role": "user", "content": content}
-        ]
+    # llama.cpp streams from a blocking iterator, so the worker thread pushes tokens onto an
+    # asyncio queue which this generator drains. If the client goes away the worker is told to
+    # stop so the backend isn't kept busy generating tokens nobody will read.
+    async def _astream_chat(self, messages: list, user: str = None):
+        loop = asyncio.get_running_loop()
+        tokens = asyncio.Queue()
+        finished = object()
+        stop = threading.Event()
 
-        output = self.llm.create_chat_completion(messages=messages,temperature=0.5)
-        output = output['choices'][0]['message']['content']
-        return output
+        def generate():
+            self._generate(messages, on_token=lambda token: loop.call_soon_threadsafe(tokens.put_nowait, token), stop=stop)
 
-    
-     
\ No newline at end of file
+        generation = asyncio.ensure_future(self.scheduler.submit(generate, prefix_key=messages[0]["content"], user_key=user))
+        # Queued once the request is over, including when it fails before generate runs (e.g. the
+        # scheduler's queue is full). Tokens are queued from the worker thread before the request
+        # finishes, so this always comes after the last of them.
+        generation.add_done_callback(lambda _: tokens.put_nowait(finished))
+        try:
+            while True:
+                token = await tokens.get()
+                if token is finished:
+                    break
+                yield token
+            # Re-raises any error from the worker thread.
+            await generation
+        finally:
+            stop.set()
@@ -0,0 +1,374 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from utilities.observability import LLM_REQUEST_SECONDS, LLM_REQUESTS_IN_FLIGHT, QUEUE_DEPTH, log
+from utilities.bounded_executor import QueueFullError
+from utilities.chunker import Chunker
+from utilities.prompt_registry import PromptRegistry
+
+# Spreads LLM requests over a pool of backends (OllamaLLM servers, llama.cpp models or FakeLLMs),
+# so the app isn't limited to what one box can serve. The router has the same public methods as
+# BaseLLM, so the routes and the summarisation pipeline use it exactly like a single backend.
+#
+#   - Each request goes to the backend with the fewest requests in flight (least outstanding
+#     requests), out of the backends that serve that task.
+#   - Backends can be limited to some tasks, e.g. a small fast model for "summarise" and
+#     "merge_summaries" and a stronger one for "evaluate" and "query".
+#   - A background health check takes backends that are down out of rotation.
+#   - A circuit breaker per backend stops sending requests to one that keeps failing, then lets a
+#     single trial request through after reset_timeout seconds to see if it has recovered.
+#   - A failed request is retried on another backend. Streams are only retried if nothing has been
+#     sent to the client yet.
+#   - Background work (e.g. filling question pools) sets low_priority, and its requests wait until
+#     no live requests are in flight, so they don't slow down users waiting on a response.
+
+TASKS = ("query", "evaluate", "summarise", "merge_summaries")
+
+# Set to True in background tasks whose LLM requests should give way to live requests
+low_priority = ContextVar("low_priority", default=False)
+
+# Raised when no backend can take a request. A QueueFullError, so routes answer 503 and the
+# summarisation pipeline doesn't retry straight away.
+class NoBackendAvailableError(QueueFullError):
+    pass
+
+class CircuitBreaker():
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    # Returns (allowed, trial): whether a request may be sent, and whether it is the half open trial.
+    # Only one trial request is let through while half open, and only that request may release the
+    # trial slot, so requests that were already in flight when the circuit opened can't let more through.
+    def allow(self) -> tuple:
+        state = self.state
+        if state == "closed":
+            return True, False
+        if state == "half_open" and not self.trial_in_progress:
+            self.trial_in_progress = True
+            return True, True
+        return False, False
+
+    # Frees the trial slot taken by allow(), once the trial request has ended
+    def release_trial(self):
+        self.trial_in_progress = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            # Failing while half open re-opens the circuit for another reset_timeout.
+            self.opened_at = time.monotonic()
+
+# One backend in the pool. tasks is the set of tasks it serves, None for all of them.
+class RoutedBackend():
+    def __init__(self, name: str, llm, tasks: list = None, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.name = name
+        self.llm = llm
+        self.tasks = set(tasks) if tasks else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.healthy = True
+        self.outstanding = 0
+        llm.timings.backend = name
+        LLM_REQUESTS_IN_FLIGHT.labels(name).set_function(lambda: self.outstanding)
+        # llama.cpp backends queue requests in their batch scheduler
+        if hasattr(llm, "scheduler"):
+            QUEUE_DEPTH.labels(f"llm:{name}").set_function(lambda: llm.scheduler.queued)
+
+    def serves(self, task: str) -> bool:
+        return self.tasks is None or task in self.tasks
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "model": self.llm.model,
+            "tasks": sorted(self.tasks) if self.tasks else list(TASKS),
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "chunk_size": self.llm.chunker.chunk_size,
+            "timings": self.llm.timings.summary()
+        }
+
+# Builds a backend from one entry of the LLM_BACKENDS config. type is "ollama" (host, model,
+# keep_alive, num_ctx), "llama_cpp" (model path, n_ctx, n_gpu_layers) or "fake" (model,
+# token_latency, context_length).
+def create_backend(config: dict, prompt_registry: PromptRegistry = None, index: int = 0) -> RoutedBackend:
+    config = dict(config)
+    backend_type = config.pop("type", "ollama")
+    name = config.pop("name", f"{backend_type}-{index}")
+    tasks = config.pop("tasks", None)
+    breaker = {key: config.pop(key) for key in ("failure_threshold", "reset_timeout") if key in config}
+
+    # Backends are imported here so llama-cpp-python is only needed if a llama_cpp backend is configured.
+    if backend_type == "ollama":
+        from utilities.ollama_llm import OllamaLLM
+        llm = OllamaLLM(prompt_registry=prompt_registry, **config)
+    elif backend_type == "llama_cpp":
+        from utilities.llm import LLM
+        llm = LLM(prompt_registry=prompt_registry, **config)
+    elif backend_type == "fake":
+        from utilities.fake_llm import FakeLLM
+        llm = FakeLLM(prompt_registry=prompt_registry, **config)
+    else:
+        raise ValueError(f"Unknown LLM backend type: {backend_type}")
+    return RoutedBackend(name, llm, tasks, **breaker)
+
+class LLMRouter():
+    def __init__(self, backends: list, health_check_interval: float = 30):
+        if not backends:
+            raise ValueError("LLMRouter needs at least one backend")
+        self.backends = backends
+        self.health_check_interval = health_check_interval
+        self._health_task = None
+        self._chunking_backend = None
+        self.cache = None
+        # Live (not low_priority) requests in flight, and low priority requests waiting for there to be none
+        self.live_requests = 0
+        self._idle_waiters = []
+
+    @classmethod
+    def from_config(cls, configs: list, prompt_registry: PromptRegistry = None, health_check_interval: float = 30):
+        return cls([create_backend(config, prompt_registry, index) for index, config in enumerate(configs)], health_check_interval)
+
+    # The response cache is shared by every backend. Each backend's model is part of the cache key.
+    @property
+    def cache(self):
+        return self._cache
+
+    @cache.setter
+    def cache(self, value):
+        self._cache = value
+        for backend in self.backends:
+            backend.llm.cache = value
+
+    # Picks the backend with the fewest requests in flight, choosing at random between ties so
+    # idle backends share the load. Returns (backend, trial), with trial True if the request is its
+    # circuit breaker's half open trial, or (None, False) if every backend is down, open or excluded.
+    def _pick(self, task: str, exclude: set) -> tuple:
+        candidates = [
+            backend for backend in self.backends
+            if backend.serves(task) and backend.healthy and backend not in exclude and backend.breaker.state != "open"
+        ]
+        if not candidates:
+            return None, False
+        fewest = min(backend.outstanding for backend in candidates)
+        least_loaded = [backend for backend in candidates if backend.outstanding == fewest]
+        random.shuffle(least_loaded)
+        busier = sorted((backend for backend in candidates if backend.outstanding != fewest), key=lambda backend: backend.outstanding)
+        for backend in least_loaded + busier:
+            allowed, trial = backend.breaker.allow()
+            if allowed:
+                return backend, trial
+        return None, False
+
+    # Counts a live request while it runs, or holds a low priority one back until no live requests
+    # are in flight. Low priority requests already running aren't interrupted.
+    @asynccontextmanager
+    async def _priority(self):
+        if low_priority.get():
+            while self.live_requests:
+                waiter = asyncio.get_running_loop().create_future()
+                self._idle_waiters.append(waiter)
+                await waiter
+            yield
+            return
+        self.live_requests += 1
+        try:
+            yield
+        finally:
+            self.live_requests -= 1
+            if not self.live_requests:
+                waiters, self._idle_waiters = self._idle_waiters, []
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def _call(self, task: str, call):
+        async with self._priority():
+            return await self._call_backends(task, call)
+
+    async def _stream(self, task: str, stream):
+        async with self._priority():
+            async for token in self._stream_backends(task, stream):
+                yield token
+
+    # Runs call(llm) on the best backend for task, moving on to the next backend if it fails.
+    async def _call_backends(self, task: str, call):
+        tried = set()
+        last_error = None
+        while True:
+            backend, trial = self._pick(task, tried)
+            if backend is None:
+                if last_error is not None and not isinstance(last_error, QueueFullError):
+                    raise last_error
+                raise NoBackendAvailableError(f"No LLM backend is available for {task}. Please try again shortly.")
+            tried.add(backend)
+            backend.outstanding += 1
+            started = time.perf_counter()
+            try:
+                result = await call(backend.llm)
+            except QueueFullError as e:
+                # The backend is busy rather than broken, so it doesn't count towards its circuit breaker.
+                last_error = e
+            except Exception as e:
+                log(f"LLM backend {backend.name} failed on {task}: {e}")
+                backend.breaker.record_failure()
+                last_error = e
+            else:
+                backend.breaker.record_success()
+                return result
+            finally:
+                backend.outstanding -= 1
+                # Frees the half open trial slot if this request took it, however it ended (e.g. cancelled).
+                if trial:
+                    backend.breaker.release_trial()
+                LLM_REQUEST_SECONDS.labels(backend.name, task).observe(time.perf_counter() - started)
+
+    # Streaming version of _call_backends. Once a token has been sent a failure can't be retried elsewhere.
+    async def _stream_backends(self, task: str, stream):
+        tried = set()
+        last_error = None
+        while True:
+            backend, trial = self._pick(task, tried)
+            if backend is None:
+                if last_error is not None and not isinstance(last_error, QueueFullError):
+                    raise last_error
+                raise NoBackendAvailableError(f"No LLM backend is available for {task}. Please try again shortly.")
+            tried.add(backend)
+            backend.outstanding += 1
+            started = False
+            started_at = time.perf_counter()
+            try:
+                async for token in stream(backend.llm):
+                    started = True
+                    yield token
+            except QueueFullError as e:
+                if started:
+                    raise
+                last_error = e
+            except Exception as e:
+                log(f"LLM backend {backend.name} failed on {task}: {e}")
+                backend.breaker.record_failure()
+                if started:
+                    raise
+                last_error = e
+            else:
+                backend.breaker.record_success()
+                return
+            finally:
+                backend.outstanding -= 1
+                # Frees the half open trial slot if this request took it, however it ended (e.g. cancelled).
+                if trial:
+                    backend.breaker.release_trial()
+                LLM_REQUEST_SECONDS.labels(backend.name, task).observe(time.perf_counter() - started_at)
+
+    # Same methods as BaseLLM, each routed by task.
+    async def aquery(self, query: str, student: str = "default_student", user: str = None, persona: str = None) -> str:
+        return await self._call("query", lambda llm: llm.aquery(query, student, user, persona))
+
+    async def aevaluate(self, question: str, answer: str, user: str = None, context: list = None) -> str:
+        return await self._call("evaluate", lambda llm: llm.aevaluate(question, answer, user, context))
+
+    async def asummarise(self, content, user: str = None) -> str:
+        return await self._call("summarise", lambda llm: llm.asummarise(content, user))
+
+    async def amerge_summaries(self, summaries: list, user: str = None) -> str:
+        return await self._call("merge_summaries", lambda llm: llm.amerge_summaries(summaries, user))
+
+    async def astream_query(self, query: str, student: str = "default_student", user: str = None):
+        async for token in self._stream("query", lambda llm: llm.astream_query(query, student, user)):
+            yield token
+
+    async def astream_evaluate(self, question: str, answer: str, user: str = None, context: list = None):
+        async for token in self._stream("evaluate", lambda llm: llm.astream_evaluate(question, answer, user, context)):
+            yield token
+
+    async def astream_summarise(self, content, user: str = None):
+        async for token in self._stream("summarise", lambda llm: llm.astream_summarise(content, user)):
+            yield token
+
+    # Blocking versions for notebooks and scripts, sent to the first backend serving the task.
+    def _first_backend(self, task: str):
+        return next((backend.llm for backend in self.backends if backend.serves(task)), self.backends[0].llm)
+
+    def query(self, query: str, student: str = "default_student") -> str:
+        return self._first_backend("query").query(query, student)
+
+    def evaluate(self, question: str, answer: str) -> str:
+        return self._first_backend("evaluate").evaluate(question, answer)
+
+    def summarise(self, content) -> str:
+        return self._first_backend("summarise").summarise(content)
+
+    # The models of the backends serving task, e.g. to record which models a summary may have come from
+    def models_for(self, task: str) -> list:
+        return sorted({backend.llm.model for backend in self.backends if backend.serves(task)})
+
+    # Any backend serving "summarise" may get a chunk, so chunks are made for the one with the
+    # smallest context window and counted with its tokenizer.
+    @property
+    def chunking_backend(self) -> RoutedBackend:
+        if self._chunking_backend is None:
+            summarisers = [backend for backend in self.backends if backend.serves("summarise")] or self.backends
+            self._chunking_backend = min(summarisers, key=lambda backend: backend.llm.chunker.chunk_size)
+        return self._chunking_backend
+
+    @property
+    def chunker(self) -> Chunker:
+        return self.chunking_backend.llm.chunker
+
+    def configure_chunking(self, chunk_size: int, chunk_overlap: int):
+        for backend in self.backends:
+            backend.llm.configure_chunking(chunk_size, chunk_overlap)
+        self._chunking_backend = None
+
+    def count_tokens(self, text: str) -> int:
+        return self.chunking_backend.llm.count_tokens(text)
+
+    def split_text(self, extracted_text) -> list:
+        return self.chunking_backend.llm.split_text(extracted_text)
+
+    # Checks every backend once, updating which are in rotation
+    async def check_health(self):
+        results = await asyncio.gather(*[backend.llm.ahealth_check() for backend in self.backends], return_exceptions=True)
+        for backend, healthy in zip(self.backends, results):
+            if healthy is not True and backend.healthy:
+                log(f"LLM backend {backend.name} is unhealthy, taking it out of rotation")
+            backend.healthy = healthy is True
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_check_interval)
+
+    # Starts the background health checks on the running event loop
+    def start(self):
+        if self.health_check_interval and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    def stats(self) -> dict:
+        return {"backends": [backend.stats() for backend in self.backends]}
@@ -0,0 +1,49 @@
+import threading
+from utilities.observability import LLM_PREFILL_SECONDS, LLM_DECODE_SECONDS, LLM_TOKENS, LLM_DECODE_TOKENS_PER_SECOND
+
+# Running totals of where LLM time goes, split into prefill (processing the prompt) and decode
+# (generating the reply). cached_prompt_tokens counts prompt tokens that didn't need prefilling
+# because a saved prompt prefix was reused. Every request is also recorded in the Prometheus
+# metrics, labelled with backend (set by the LLM router to the backend's name).
+class LLMTimings():
+    def __init__(self, backend: str = "default"):
+        self.backend = backend
+        # Recorded from the llama.cpp worker thread as well as the event loop.
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.output_tokens = 0
+        self.prefill_seconds = 0.0
+        self.decode_seconds = 0.0
+
+    def record(self, prompt_tokens: int, prefill_seconds: float, output_tokens: int, decode_seconds: float, cached_prompt_tokens: int = 0):
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_prompt_tokens += cached_prompt_tokens
+            self.output_tokens += output_tokens
+            self.prefill_seconds += prefill_seconds
+            self.decode_seconds += decode_seconds
+        LLM_PREFILL_SECONDS.labels(self.backend).observe(prefill_seconds)
+        LLM_DECODE_SECONDS.labels(self.backend).observe(decode_seconds)
+        LLM_TOKENS.labels(self.backend, "prompt").inc(prompt_tokens)
+        LLM_TOKENS.labels(self.backend, "cached_prompt").inc(cached_prompt_tokens)
+        LLM_TOKENS.labels(self.backend, "output").inc(output_tokens)
+        if decode_seconds > 0:
+            LLM_DECODE_TOKENS_PER_SECOND.labels(self.backend).observe(output_tokens / decode_seconds)
+
+    def summary(self) -> dict:
+        with self.lock:
+            requests = self.requests or 1
+            return {
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "output_tokens": self.output_tokens,
+                "prefill_seconds": round(self.prefill_seconds, 3),
+                "decode_seconds": round(self.decode_seconds, 3),
+                "avg_prefill_ms": round(self.prefill_seconds / requests * 1000, 1),
+                "avg_decode_ms": round(self.decode_seconds / requests * 1000, 1),
+                "decode_tokens_per_second": round(self.output_tokens / self.decode_seconds, 2) if self.decode_seconds else 0.0
+            }
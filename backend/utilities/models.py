@@ -1,6 +1,7 @@
+from typing import List
 from pydantic import BaseModel, EmailStr
 
-# Pydantic models, used for verification of User schema on login or register
+# Pydantic models, used for verification of User schema on login or register and of JSON request bodies
 
 class UserModel(BaseModel):
     username: str
@@ -12,3 +13,14 @@ class UserLoginModel(BaseModel):
     password: str
 
 
+
+# One question and the answer given to it, for bulk grading
+class EvaluationItemModel(BaseModel):
+    question: str
+    answer: str
+
+# Body of /evaluate/bulk. store saves every graded answer to the lecture's student responses.
+class BulkEvaluationModel(BaseModel):
+    lecture_id: str
+    items: List[EvaluationItemModel]
+    store: bool = True
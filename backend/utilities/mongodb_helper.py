@@ -2,22 +2,40 @@ import os
 import jwt
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING
 from dotenv import load_dotenv
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from utilities.user_cache import UserCache
+from utilities.observability import MongoCommandMetrics, log
 
 class MongoDBHelper():
 
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
+    # Same as oauth2_scheme, but gives None instead of a 401 when there is no token
+    optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login", auto_error=False)
 
     def __init__(self):
         load_dotenv()
         self.SECRET_KEY = os.getenv("SECRET_AUTH_KEY")
         self.MONGO_DB_CONNECTION_STRING = os.getenv("MONGO_DB_CONNECTION_STRING")
-        self.client = AsyncIOMotorClient(self.MONGO_DB_CONNECTION_STRING)
+        # Every command's duration is recorded in the Prometheus metrics
+        self.client = AsyncIOMotorClient(self.MONGO_DB_CONNECTION_STRING, event_listeners=[MongoCommandMetrics()])
         self.database = self.client.user_db 
         self.user_collection = self.database.get_collection("user_credentials")
+        # Legacy collection holding one ever-growing document per user. Only read by the migration
+        # in utilities/history_migration.py, new data goes into lectures and student_responses.
         self.user_message_history_collection = self.database.get_collection("user_message_history")
+        self.lecture_collection = self.database.get_collection("lectures")
+        self.student_response_collection = self.database.get_collection("student_responses")
+        self.llm_cache_collection = self.database.get_collection("llm_response_cache")
+        self.summarisation_job_collection = self.database.get_collection("summarisation_jobs")
+        self.summarisation_job_chunk_collection = self.database.get_collection("summarisation_job_chunks")
+        self.question_pool_collection = self.database.get_collection("question_pool")
+        self.lecture_embedding_collection = self.database.get_collection("lecture_embeddings")
+        self.summary_manifest_collection = self.database.get_collection("summary_manifests")
+        # Authenticated users are cached briefly so get_current_user doesn't hit MongoDB on every request.
+        self.user_cache = UserCache(ttl_seconds=float(os.getenv("USER_CACHE_TTL_SECONDS", "60")))
 
     # Gets MongoDB database
     def get_database(self):
@@ -31,6 +49,48 @@ class MongoDBHelper():
     def get_user_message_history_collection(self):
         return self.user_message_history_collection
     
+    # Gets MongoDB lectures collection, one document per lecture a user has stored
+    def get_lecture_collection(self):
+        return self.lecture_collection
+
+    # Gets MongoDB student_responses collection, one document per question/answer/evaluation, keyed by lecture_id and user_id
+    def get_student_response_collection(self):
+        return self.student_response_collection
+
+    # Creates the indexes used by the history routes. Called once on server startup.
+    async def ensure_indexes(self):
+        try:
+            await self.lecture_collection.create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+            await self.student_response_collection.create_index([("lecture_id", ASCENDING), ("user_id", ASCENDING), ("created_at", ASCENDING)])
+            await self.student_response_collection.create_index([("user_id", ASCENDING), ("created_at", ASCENDING)])
+            await self.user_collection.create_index("email")
+        except Exception as e:
+            log(f"Error creating MongoDB indexes: {e}")
+
+    # Gets MongoDB llm_response_cache collection, contains cached summaries and evaluations
+    def get_llm_cache_collection(self):
+        return self.llm_cache_collection
+
+    # Gets MongoDB summarisation_jobs collection, one document per background summarisation job with its lease, progress and result
+    def get_summarisation_job_collection(self):
+        return self.summarisation_job_collection
+
+    # Gets MongoDB summarisation_job_chunks collection, the chunks of each job along with their summaries once done
+    def get_summarisation_job_chunk_collection(self):
+        return self.summarisation_job_chunk_collection
+
+    # Gets MongoDB question_pool collection, pre-generated student questions for each lecture
+    def get_question_pool_collection(self):
+        return self.question_pool_collection
+
+    # Gets MongoDB lecture_embeddings collection, the embedding index of each lecture's chunk summaries, keyed by lecture id
+    def get_lecture_embedding_collection(self):
+        return self.lecture_embedding_collection
+
+    # Gets MongoDB summary_manifests collection, the chunk fingerprints and summaries of the last upload of each of a user's files
+    def get_summary_manifest_collection(self):
+        return self.summary_manifest_collection
+
     # Helper function to turn MongoDB ObjectIDs into strings
     def convert_object_ids(self, data):
         if isinstance(data, list):
@@ -39,9 +99,14 @@ class MongoDBHelper():
             return {k: (str(v) if isinstance(v, ObjectId) else v) for k, v in data.items()}
         return data
     
+    # Drops a user from the authenticated user cache. Call after changing their user_credentials document.
+    def invalidate_user(self, user_id):
+        self.user_cache.invalidate(str(user_id))
+
     # Helper authorization function
     # Decodes and verifies the JWT token to authenticate the current user.
-    # Extracts the user ID from the token payload and retrieves the user from the database.
+    # Extracts the user ID from the token payload and retrieves the user from the user cache, or from the
+    # database (without the password hash) if it isn't cached.
     # If the user ID is missing, the user is not found, the token is expired, or invalid, it raises a 401 Unauthorized error.
     # Returns the user data if authentication is successful.
     async def get_current_user(self, token: str = Depends(oauth2_scheme)):
@@ -51,11 +116,27 @@ class MongoDBHelper():
             if user_id is None:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authentication credentials")
             
-            user = await self.get_user_collection().find_one({"_id": ObjectId(user_id)})
+            issued_at = payload.get("iat")
+            user = self.user_cache.get(user_id, issued_at)
+            if user is not None:
+                return user
+
+            user = await self.get_user_collection().find_one({"_id": ObjectId(user_id)}, {"password": 0})
             if user is None:
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
+            self.user_cache.set(user_id, issued_at, user)
             return user
         except jwt.ExpiredSignatureError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
         except jwt.PyJWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+
+    # Like get_current_user, for routes that also work without logging in. Returns None instead of
+    # raising a 401 if there is no token or it is invalid or expired.
+    async def get_optional_current_user(self, token: str = Depends(optional_oauth2_scheme)):
+        if token is None:
+            return None
+        try:
+            return await self.get_current_user(token)
+        except HTTPException:
+            return None
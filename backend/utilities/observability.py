@@ -0,0 +1,70 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from pymongo import monitoring
+
+# Prometheus metrics and request trace ids. Every module records into the metrics defined here, and
+# the server exposes them on /metrics. Histograms are per stage, so a slow /summarise can be broken
+# down into extraction, chunking, LLM prefill/decode and MongoDB time.
+
+# Buckets from 5ms to 5 minutes, covering everything from a MongoDB write to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HTTP_REQUESTS_IN_FLIGHT = Gauge("lessonqa_http_requests_in_flight", "HTTP requests being handled")
+HTTP_REQUEST_SECONDS = Histogram("lessonqa_http_request_duration_seconds", "Time to respond to HTTP requests (until the response starts, for streams)", ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+
+# stage is e.g. extract_pdf, extract_pptx or chunk
+STAGE_SECONDS = Histogram("lessonqa_stage_duration_seconds", "Time spent in each processing stage", ["stage"], buckets=LATENCY_BUCKETS)
+EXTRACTED_PAGES = Counter("lessonqa_extracted_pages_total", "Pages or slides extracted from uploads", ["file_type"])
+
+LLM_REQUEST_SECONDS = Histogram("lessonqa_llm_request_duration_seconds", "Time for an LLM call, including queueing", ["backend", "task"], buckets=LATENCY_BUCKETS)
+LLM_PREFILL_SECONDS = Histogram("lessonqa_llm_prefill_seconds", "Time processing the prompt, up to the first token", ["backend"], buckets=LATENCY_BUCKETS)
+LLM_DECODE_SECONDS = Histogram("lessonqa_llm_decode_seconds", "Time generating the reply", ["backend"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("lessonqa_llm_tokens_total", "Tokens processed by LLM backends. type is prompt, cached_prompt or output", ["backend", "type"])
+LLM_DECODE_TOKENS_PER_SECOND = Histogram("lessonqa_llm_decode_tokens_per_second", "Decode speed of each LLM request", ["backend"], buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500))
+LLM_REQUESTS_IN_FLIGHT = Gauge("lessonqa_llm_requests_in_flight", "Requests sent to each LLM backend and not finished yet", ["backend"])
+
+# queue is e.g. bcrypt or llm:<backend>
+QUEUE_DEPTH = Gauge("lessonqa_queue_depth", "Work waiting for a free worker", ["queue"])
+# cache is llm_response or user. result is memory_hit, mongo_hit, hit or miss
+CACHE_LOOKUPS = Counter("lessonqa_cache_lookups_total", "Cache lookups by result", ["cache", "result"])
+
+MONGODB_COMMAND_SECONDS = Histogram("lessonqa_mongodb_command_duration_seconds", "Time for MongoDB commands", ["command", "status"], buckets=LATENCY_BUCKETS)
+
+# Trace id of the request (or background job) being handled, added to log lines
+trace_id = ContextVar("trace_id", default=None)
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+# Prints a log line, prefixed with the current trace id if there is one
+def log(message: str):
+    current = trace_id.get()
+    print(f"[{current}] {message}" if current else message)
+
+# Times a block of code as a stage
+@contextmanager
+def observe_stage(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+
+# Records the time of every MongoDB command. Passed to the Motor client as an event listener, so
+# every read and write is covered without wrapping each call.
+class MongoCommandMetrics(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGODB_COMMAND_SECONDS.labels(event.command_name, "ok").observe(event.duration_micros / 1e6)
+
+    def failed(self, event):
+        MONGODB_COMMAND_SECONDS.labels(event.command_name, "error").observe(event.duration_micros / 1e6)
+
+# Text exposition of every metric, for the /metrics route
+def render_metrics() -> tuple:
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,95 +1,73 @@
 import ollama
-import yaml
-import random
-from llama_index.core.node_parser import SentenceSplitter
+from utilities.base_llm import BaseLLM
+from utilities.prompt_registry import PromptRegistry
+from utilities.observability import log
 
 # This file contains code to support use of a Llama LLM through use of Ollama.
 # Used for local testing and development on my own laptop. Unable to run 
 # GGUF models on my local system.
 
-class OllamaLLM():
-    def __init__(self):
-        self.model = "llama3.2"
-        self.personas = self._load_personas("./prompts/prompts.yaml")
+# host is the Ollama server to use (None for OLLAMA_HOST or the local default) and model any
+# model that server has pulled. num_ctx is the context window Ollama runs the model with; longer
+# prompts are silently truncated, so chunks are sized to fit it. Ollama's own default is 2048,
+# well under what llama3.2 supports, so raise it if the server has the memory.
+class OllamaLLM(BaseLLM):
+    def __init__(self, prompt_registry: PromptRegistry = None, keep_alive: str = "30m", model: str = "llama3.2", host: str = None, num_ctx: int = 2048):
+        super().__init__(prompt_registry)
+        self.model = model
+        self.host = host
+        self.num_ctx = num_ctx
+        self.sampling_options = {"num_ctx": num_ctx}
+        # Ollama reuses the evaluated prompt prefix of the previous request in a slot, so requests
+        # sharing a system prompt only prefill the new part. keep_alive stops the model (and that
+        # cache) being unloaded between requests; Ollama's default is 5 minutes.
+        self.keep_alive = keep_alive
+        # Ollama ships a native async client, so requests from the server never block the event loop.
+        self.client = ollama.Client(host=host)
+        self.async_client = ollama.AsyncClient(host=host)
 
-    def load_prompt(self, prompt: str, filepath: str = "./prompts/prompts.yaml") -> str:
-        try:
-            with open(filepath, 'r') as file:
-                data = yaml.safe_load(file)
-                prompt_text = data.get(prompt, "")
-                if not prompt_text:
-                    raise ValueError(f"No text found for the prompt '{prompt}' in the YAML file.")
-                return prompt_text
-        except FileNotFoundError:
-            print(f"File not found: {filepath}")
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML file: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        return ""
-
-    def _load_personas(self, filepath: str) -> dict:
-        try:
-            with open(filepath, 'r') as file:
-                data = yaml.safe_load(file)
-                return data
-        except FileNotFoundError:
-            print(f"File not found: {filepath}")
-        except yaml.YAMLError as e:
-            print(f"Error parsing YAML file: {e}")
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-        return {}
-
-    def _choose_random_persona(self) -> str:
-        personas_without_default = {key: value for key, value in self.personas.items() if key != "default_student" and key != "evaluate_response" and key != "summarise"}
-        chosen_persona = random.choice(list(personas_without_default.keys()))
-        return chosen_persona
-
-
-    def query(self, query:str, student:str = "default_student") -> str:
-        student_prompt = self.load_prompt(prompt=student)
+    # Ollama has no tokenizer in the client, so chunks are counted with llama_index's default.
+    def context_length(self):
+        return self.num_ctx
 
-        chosen_persona_key = self._choose_random_persona()
-        chosen_persona_description = self.personas[chosen_persona_key]
-        
-        final_prompt = f"{student_prompt}\n\nPersona: {chosen_persona_description}"
+    # Records prefill/decode timings from the statistics Ollama returns with the final response.
+    # Durations are in nanoseconds. prompt_eval_count only counts tokens that were evaluated, so
+    # a reused prefix shows up as fewer prompt tokens and a shorter prefill.
+    def _record_timings(self, response):
+        self.timings.record(
+            prompt_tokens=response.get('prompt_eval_count', 0),
+            prefill_seconds=response.get('prompt_eval_duration', 0) / 1e9,
+            output_tokens=response.get('eval_count', 0),
+            decode_seconds=response.get('eval_duration', 0) / 1e9
+        )
 
-        messages = [
-            {"role": "system", "content": final_prompt},
-            {"role": "user", "content": query}
-        ]
-
-        response = ollama.chat(model='llama3.2', messages=messages)
+    def _chat(self, messages: list) -> str:
+        response = self.client.chat(model=self.model, messages=messages, options=self.sampling_options, keep_alive=self.keep_alive)
+        self._record_timings(response)
         output = response['message']['content']
         return output
-    
-    def evaluate(self, question: str, answer: str) -> str:
-        
-        evaluation_prompt = self.load_prompt(prompt="evaluate_response")
-
-        messages = [
-            {"role": "system", "content": evaluation_prompt},
-            {"role": "user", "content": "Question: "+question+"\n\nAnswer: "+answer}
-        ]
 
-        response = ollama.chat(model='llama3.2', messages=messages)
+    async def _achat(self, messages: list, user: str = None) -> str:
+        response = await self.async_client.chat(model=self.model, messages=messages, options=self.sampling_options, keep_alive=self.keep_alive)
+        self._record_timings(response)
         output = response['message']['content']
         return output
-    
-    def split_text(self, extracted_text) -> list:
-        sentence_splitter = SentenceSplitter(chunk_size=512, chunk_overlap=20)
-        sentences = sentence_splitter.split_text(extracted_text)
-        return sentences
-    
-    def summarise(self, content) -> str:
-        summarise_prompt = self.load_prompt(prompt="summarise")
-        messages = [
-            {"role": "system", "content": summarise_prompt},
-            {"role": "user", "content": content}
-        ]
 
-        response = ollama.chat(model='llama3.2', messages=messages)
-        output = response['message']['content']
-        return output
-    
\ No newline at end of file
+    async def _astream_chat(self, messages: list, user: str = None):
+        stream = await self.async_client.chat(model=self.model, messages=messages, options=self.sampling_options, keep_alive=self.keep_alive, stream=True)
+        async for part in stream:
+            token = part['message']['content']
+            if token:
+                yield token
+            if part.get('done'):
+                self._record_timings(part)
+
+    # The server is healthy if it responds and has the model available.
+    async def ahealth_check(self) -> bool:
+        try:
+            response = await self.async_client.list()
+        except Exception as e:
+            log(f"Ollama health check failed for {self.host or 'default host'}: {e}")
+            return False
+        names = {model.get('name') or model.get('model') for model in response.get('models', [])}
+        return self.model in names or f"{self.model}:latest" in names
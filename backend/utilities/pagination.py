@@ -0,0 +1,44 @@
+import base64
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# Cursor (keyset) pagination for lists sorted newest first by (created_at, _id). Rather than
+# skipping over earlier pages, each page carries an opaque cursor holding the sort key of its last
+# document and the next page starts just after it, so every page is a single index range scan on
+# (user_id, created_at, _id) however far back the user pages.
+
+# Sort order matching the cursor. _id breaks ties between documents created in the same millisecond.
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+# Raised when a cursor sent by the client can't be decoded
+class InvalidCursorError(ValueError):
+    pass
+
+# Encodes the sort key of the last document on a page as a URL safe string
+def encode_cursor(document: dict) -> str:
+    raw = f"{document['created_at'].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        created_at, _id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), ObjectId(_id)
+    except (ValueError, InvalidId, UnicodeError) as e:
+        raise InvalidCursorError("Invalid pagination cursor") from e
+
+# Filter matching every document that comes after the cursor in NEWEST_FIRST order
+def after_cursor(cursor: str) -> dict:
+    created_at, _id = decode_cursor(cursor)
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "_id": {"$lt": _id}}
+    ]}
+
+# Splits the limit + 1 documents fetched for a page into the page itself and the cursor for the
+# next one, which is None on the last page.
+def paginate(documents: list, limit: int) -> tuple:
+    if len(documents) <= limit:
+        return documents, None
+    page = documents[:limit]
+    return page, encode_cursor(page[-1])
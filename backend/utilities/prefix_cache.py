@@ -0,0 +1,59 @@
+import hashlib
+from collections import OrderedDict
+
+# Keeps llama.cpp state snapshots for prompt prefixes (the chat template plus a system prompt).
+# The first request with a given prefix evaluates it once and saves the state; later requests
+# load that state, so llama.cpp only has to prefill the part of the prompt after the prefix.
+# Since the key is a hash of the prefix text, editing prompts.yaml creates new entries and the
+# old ones are evicted. States hold the prefix's KV cache, so only max_entries are kept.
+# Must only be used from the thread that runs the model.
+class PrefixStateCache():
+    def __init__(self, model, max_entries: int = 8):
+        self.model = model
+        self.max_entries = max_entries
+        self.states = OrderedDict()
+        self.active_key = None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(prefix: str) -> str:
+        return hashlib.sha256(prefix.encode("utf-8")).hexdigest()
+
+    # Makes sure the model's state starts with prefix. Returns the number of prefix tokens that
+    # are already evaluated and won't need prefilling for this request.
+    def prime(self, prefix: str) -> int:
+        if not prefix:
+            return 0
+        key = self.make_key(prefix)
+
+        # The last request used the same prefix, so the model already holds it.
+        if key == self.active_key and key in self.states:
+            self.hits += 1
+            self.states.move_to_end(key)
+            return self.states[key][1]
+
+        if key in self.states:
+            self.hits += 1
+            state, token_count = self.states[key]
+            self.model.load_state(state)
+            self.states.move_to_end(key)
+        else:
+            self.misses += 1
+            tokens = self.model.tokenize(prefix.encode("utf-8"), add_bos=True)
+            self.model.reset()
+            self.model.eval(tokens)
+            token_count = len(tokens)
+            self.states[key] = (self.model.save_state(), token_count)
+            while len(self.states) > self.max_entries:
+                self.states.popitem(last=False)
+            # Filling the cache is a prefill too, so none of it was reused.
+            self.active_key = key
+            return 0
+
+        self.active_key = key
+        return token_count
+
+    # Forgets which prefix the model holds, e.g. after the model was used without prime().
+    def invalidate(self):
+        self.active_key = None
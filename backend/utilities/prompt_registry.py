@@ -0,0 +1,111 @@
+import hashlib
+import os
+import threading
+import time
+import yaml
+from utilities.observability import log
+
+# Prompts that are not student personas. Everything else in prompts.yaml is a persona.
+NON_PERSONA_PROMPTS = {"default_student", "evaluate_response", "summarise", "merge_summaries"}
+
+# One parsed version of prompts.yaml. Snapshots are never modified, a reload builds a new one and
+# swaps it in, so a reader always sees a complete and consistent set of prompts.
+class PromptSnapshot():
+    def __init__(self, prompts: dict, version: str, mtime: float):
+        self.prompts = prompts
+        self.version = version
+        self.mtime = mtime
+        self.persona_keys = [key for key in prompts if key not in NON_PERSONA_PROMPTS]
+
+# Parses prompts.yaml once and serves prompts from memory. If watch_interval is set, the file's
+# mtime is checked at most once per interval and the prompts are reloaded when it changes.
+# version is a hash of the file contents, for anything that needs to know which prompts were used.
+class PromptRegistry():
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, filepath: str = "./prompts/prompts.yaml", watch_interval: float = 0):
+        self.filepath = filepath
+        self.watch_interval = watch_interval
+        self._snapshot = PromptSnapshot({}, "", 0)
+        self._last_checked = time.monotonic()
+        self._reload_lock = threading.Lock()
+        self.reload()
+
+    # Returns the registry for filepath, creating it the first time. Lets every LLM class share
+    # one parsed copy of the same file. If the file couldn't be loaded before it is tried again.
+    @classmethod
+    def shared(cls, filepath: str = "./prompts/prompts.yaml") -> "PromptRegistry":
+        with cls._shared_lock:
+            if filepath not in cls._shared:
+                cls._shared[filepath] = cls(filepath)
+            elif not cls._shared[filepath]._snapshot.version:
+                cls._shared[filepath].reload()
+            return cls._shared[filepath]
+
+    # Re-reads the YAML file. If it can't be read or parsed the current prompts are kept.
+    # Returns True if new prompts were loaded.
+    def reload(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.filepath) if os.path.exists(self.filepath) else 0
+            with open(self.filepath, 'r') as file:
+                contents = file.read()
+            data = yaml.safe_load(contents) or {}
+        except FileNotFoundError:
+            log(f"File not found: {self.filepath}")
+            return False
+        except yaml.YAMLError as e:
+            log(f"Error parsing YAML file: {e}")
+            return False
+        except Exception as e:
+            log(f"Unexpected error: {e}")
+            return False
+
+        version = hashlib.sha256(contents.encode("utf-8")).hexdigest()[:16]
+        if self._snapshot.version and version != self._snapshot.version:
+            log(f"Reloaded prompts from {self.filepath} (version {version})")
+        self._snapshot = PromptSnapshot(data, version, mtime)
+        return True
+
+    # Reloads the file if watching is enabled, the interval has passed and the mtime changed.
+    def _maybe_reload(self):
+        if self.watch_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_checked < self.watch_interval:
+            return
+        # Only one caller checks the file, everyone else carries on with the current snapshot.
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_checked = now
+            try:
+                mtime = os.path.getmtime(self.filepath)
+            except OSError:
+                return
+            if mtime != self._snapshot.mtime:
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    @property
+    def prompts(self) -> dict:
+        self._maybe_reload()
+        return self._snapshot.prompts
+
+    @property
+    def version(self) -> str:
+        self._maybe_reload()
+        return self._snapshot.version
+
+    @property
+    def persona_keys(self) -> list:
+        self._maybe_reload()
+        return self._snapshot.persona_keys
+
+    # Returns the text for a prompt, or "" if it doesn't exist.
+    def get(self, name: str) -> str:
+        prompt_text = self.prompts.get(name, "")
+        if not prompt_text:
+            log(f"Unexpected error: No text found for the prompt '{name}' in the YAML file.")
+        return prompt_text
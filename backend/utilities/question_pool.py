@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import random
+import re
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
+from utilities.prompt_registry import PromptRegistry
+from utilities.llm_router import low_priority
+from utilities.observability import log
+
+# Pre-generated student questions for each stored lecture, so /upload can hand out a question
+# straight away instead of waiting seconds for the LLM on every click. The first time a question is
+# asked for, a background task starts generating questions across every persona and summary.
+# Handing a question out marks it as served, and once fewer than low_water_mark are left the pool
+# is topped back up to pool_size in the background. Fills run at low priority, so their LLM
+# requests wait for live requests (like the questions generated while the pool is still empty).
+#
+# Every question remembers the prompt (persona + summary) it came from, and a prompt is never used
+# twice for the same lecture. Questions that come out the same as an earlier one (ignoring case,
+# spacing and punctuation) are dropped, so students don't repeat each other. With an embedding index,
+# the lecture chunks most related to the summary are retrieved and put in the prompt as well, the
+# same as questions generated by /upload.
+
+# Builds the lecture content prompt for a student question from one summary and any chunks
+# retrieved for it
+def lecture_content_prompt(summary: str, context: list = None) -> str:
+    content = "\n\n".join(dict.fromkeys([summary] + (context or [])))
+    return f"Lecture Content: {content}"
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+# Key of the persona and summary a question was generated from
+def prompt_key(persona: str, summary: str) -> str:
+    return _hash(f"{persona}\n{summary}")
+
+# Key that is the same for questions differing only in case, spacing or punctuation
+def question_key(question: str) -> str:
+    return _hash(" ".join(re.sub(r"[^\w\s]", " ", question.lower()).split()))
+
+class QuestionPool():
+    def __init__(self, collection, lecture_collection, llm, prompt_registry: PromptRegistry, pool_size: int = 20, low_water_mark: int = 5, concurrency: int = 2, embedding_index=None, retrieval_top_k: int = 3):
+        self.collection = collection
+        self.lecture_collection = lecture_collection
+        self.llm = llm
+        self.prompt_registry = prompt_registry
+        self.embedding_index = embedding_index
+        self.retrieval_top_k = retrieval_top_k
+        self.pool_size = pool_size
+        self.low_water_mark = low_water_mark
+        self.concurrency = max(1, concurrency)
+        # Lectures being filled at the moment, so only one fill runs per lecture
+        self.filling = {}
+
+    # Creates the indexes used to hand out questions and deduplicate them. Called once on server startup.
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index([("lecture_id", ASCENDING), ("served_at", ASCENDING), ("created_at", ASCENDING)])
+            await self.collection.create_index([("lecture_id", ASCENDING), ("prompt_key", ASCENDING)], unique=True)
+            await self.collection.create_index([("lecture_id", ASCENDING), ("question_key", ASCENDING)], unique=True)
+        except Exception as e:
+            log(f"Error creating question pool indexes: {e}")
+
+    # Number of questions waiting to be handed out for a lecture
+    async def available(self, lecture_id) -> int:
+        return await self.collection.count_documents({"lecture_id": lecture_id, "served_at": None})
+
+    # Hands out the oldest unserved question for one of the user's lectures, or None if the pool is
+    # empty. Tops the pool up in the background when it runs low.
+    async def take(self, lecture_id, user_id):
+        entry = await self.collection.find_one_and_update(
+            {"lecture_id": lecture_id, "user_id": user_id, "served_at": None},
+            {"$set": {"served_at": datetime.now(timezone.utc)}},
+            sort=[("created_at", ASCENDING)]
+        )
+        if entry is None or await self.available(lecture_id) < self.low_water_mark:
+            self.schedule_fill(lecture_id)
+        return entry["question"] if entry else None
+
+    # Starts filling a lecture's pool in the background, unless it is already being filled
+    def schedule_fill(self, lecture_id):
+        task = self.filling.get(lecture_id)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self._fill_safely(lecture_id))
+        self.filling[lecture_id] = task
+        task.add_done_callback(lambda _: self.filling.pop(lecture_id, None) if self.filling.get(lecture_id) is task else None)
+        return task
+
+    async def _fill_safely(self, lecture_id):
+        # Only affects this task and the requests it makes
+        low_priority.set(True)
+        try:
+            return await self.fill(lecture_id)
+        except Exception as e:
+            log(f"Error filling question pool for lecture {lecture_id}: {e}")
+            return 0
+
+    # The chunks of the lecture most related to a summary, or [] without an embedding index
+    async def _find_context(self, lecture_id, user_id, summary: str) -> list:
+        if self.embedding_index is None:
+            return []
+        return await self.embedding_index.search(lecture_id, user_id, summary, self.retrieval_top_k)
+
+    # Generates questions until the lecture has pool_size waiting, using prompts (persona and
+    # summary pairs) that haven't been used for this lecture yet. Returns how many were added.
+    async def fill(self, lecture_id) -> int:
+        lecture = await self.lecture_collection.find_one({"_id": lecture_id}, {"user_id": 1, "summaries": 1})
+        summaries = (lecture or {}).get("summaries") or []
+        wanted = self.pool_size - await self.available(lecture_id)
+        if not summaries or wanted <= 0:
+            return 0
+
+        used = set(await self.collection.distinct("prompt_key", {"lecture_id": lecture_id}))
+        prompts = [
+            (persona, summary)
+            for persona in self.prompt_registry.persona_keys
+            for summary in dict.fromkeys(summaries)
+            if prompt_key(persona, summary) not in used
+        ]
+        random.shuffle(prompts)
+
+        added = 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def generate(persona: str, summary: str) -> bool:
+            async with semaphore:
+                context = await self._find_context(lecture_id, lecture["user_id"], summary)
+                question = await self.llm.aquery(query=lecture_content_prompt(summary, context), persona=persona, user=f"question-pool:{lecture['user_id']}")
+                if not question:
+                    return False
+                try:
+                    await self.collection.insert_one({
+                        "lecture_id": lecture_id,
+                        "user_id": lecture["user_id"],
+                        "question": question,
+                        "persona": persona,
+                        "prompt_key": prompt_key(persona, summary),
+                        "question_key": question_key(question),
+                        "created_at": datetime.now(timezone.utc),
+                        "served_at": None
+                    })
+                except DuplicateKeyError:
+                    # Another fill used the same prompt, or the question repeats an earlier one.
+                    return False
+                return True
+
+        # Generates in rounds of the number still wanted, as some questions may turn out to be duplicates.
+        while prompts and added < wanted:
+            batch, prompts = prompts[:wanted - added], prompts[wanted - added:]
+            results = await asyncio.gather(*[generate(persona, summary) for persona, summary in batch], return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    log(f"Error generating pooled question for lecture {lecture_id}: {result}")
+                elif result:
+                    added += 1
+            # The backend is failing, try again the next time the pool runs low.
+            if all(isinstance(result, Exception) for result in results):
+                break
+        return added
+
+    # Cancels background fills, e.g. on shutdown
+    async def stop(self):
+        tasks = list(self.filling.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,92 @@
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone
+from utilities.observability import CACHE_LOOKUPS, log
+
+# Content-addressed cache for LLM responses. Keys are a hash of everything that decides the output
+# (the messages, so the prompt text and chunk text, plus the model name and sampling options), so
+# re-uploading a known slide deck is answered without running inference again.
+# There are two tiers: an in-process LRU for hot entries and a MongoDB collection shared between
+# workers and restarts, whose entries are removed by a TTL index.
+
+class ResponseCache():
+    def __init__(self, collection=None, max_entries: int = 1024, ttl_seconds: int = 30 * 24 * 60 * 60):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory = OrderedDict()
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.misses = 0
+
+    # Builds the cache key for a call
+    @staticmethod
+    def make_key(kind: str, messages: list, model: str, options: dict) -> str:
+        payload = json.dumps({"kind": kind, "messages": messages, "model": model, "options": options}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    # Creates the TTL index on the MongoDB tier. Called once on server startup.
+    async def ensure_indexes(self):
+        if self.collection is None:
+            return
+        try:
+            await self.collection.create_index("created_at", expireAfterSeconds=self.ttl_seconds)
+        except Exception as e:
+            log(f"Error creating response cache index: {e}")
+
+    def _remember(self, key: str, value: str):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    # Returns the cached response for key, or None. MongoDB errors are treated as a miss so the
+    # cache can never take the LLM routes down with it.
+    async def get(self, key: str):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            self.memory_hits += 1
+            CACHE_LOOKUPS.labels("llm_response", "memory_hit").inc()
+            return self.memory[key]
+
+        if self.collection is not None:
+            try:
+                entry = await self.collection.find_one({"_id": key}, {"response": 1})
+            except Exception as e:
+                log(f"Error reading from response cache: {e}")
+                entry = None
+            if entry:
+                self.mongo_hits += 1
+                CACHE_LOOKUPS.labels("llm_response", "mongo_hit").inc()
+                self._remember(key, entry["response"])
+                return entry["response"]
+
+        self.misses += 1
+        CACHE_LOOKUPS.labels("llm_response", "miss").inc()
+        return None
+
+    # Stores a response in both tiers
+    async def set(self, key: str, value: str, kind: str = ""):
+        self._remember(key, value)
+        if self.collection is None:
+            return
+        try:
+            await self.collection.update_one(
+                {"_id": key},
+                {"$set": {"response": value, "kind": kind, "created_at": datetime.now(timezone.utc)}},
+                upsert=True
+            )
+        except Exception as e:
+            log(f"Error writing to response cache: {e}")
+
+    # Hit/miss counters for monitoring
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.mongo_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.mongo_hits) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory)
+        }
@@ -0,0 +1,48 @@
+import json
+from datetime import datetime
+from bson import ObjectId
+from fastapi.responses import StreamingResponse
+from utilities.observability import log
+
+# Helpers for the streaming routes. Responses are newline-delimited JSON (NDJSON), one event
+# per line, so the frontend can render tokens as soon as each line arrives.
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# Lets events carry MongoDB documents as they come out of a cursor
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Serialises a single event as one NDJSON line
+def ndjson_line(event: dict) -> str:
+    return json.dumps(event, default=_json_default) + "\n"
+
+# Wraps an async generator of event dicts in a StreamingResponse. Errors raised while streaming
+# can no longer change the status code, so they are sent to the client as an "error" event.
+def ndjson_response(events) -> StreamingResponse:
+    async def body():
+        try:
+            async for event in events:
+                yield ndjson_line(event)
+        except Exception as e:
+            log(f"Error while streaming response: {e}")
+            yield ndjson_line({"event": "error", "detail": str(e)})
+    # X-Accel-Buffering stops nginx style proxies from holding tokens back until the response ends.
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# Streams the tokens of a single completion, ending with a "done" event holding the full text.
+async def token_events(tokens, result_key: str):
+    parts = []
+    async for token in tokens:
+        parts.append(token)
+        yield {"event": "token", "content": token}
+    yield {"event": "done", result_key: "".join(parts)}
+
+# Same events as token_events for a reply that is already complete, e.g. a pre-generated question.
+async def text_events(text: str, result_key: str):
+    yield {"event": "token", "content": text}
+    yield {"event": "done", result_key: text}
@@ -0,0 +1,61 @@
+import asyncio
+from collections import Counter
+from pymongo.errors import BulkWriteError
+from utilities.observability import log
+
+# Writes student responses and adds them to the response_count of their lectures, for the
+# write-behind buffer behind /evaluate and the other routes storing responses. Documents come with
+# their ids, so a batch written again after a failed attempt skips the ones already inserted, and
+# only the documents this attempt inserted are counted. The count is retried on its own (per
+# lecture) rather than by writing the batch again, as a retried batch would find its documents
+# already inserted and count nothing.
+
+# Raised when a write fails part way, with how many documents were inserted before it did
+class StudentResponseWriteError(Exception):
+    def __init__(self, inserted: int, error: Exception):
+        super().__init__(str(error))
+        self.inserted = inserted
+        self.error = error
+
+class StudentResponseWriter():
+    def __init__(self, response_collection, lecture_collection, max_retries: int = 3, retry_delay: float = 0.2):
+        self.responses = response_collection
+        self.lectures = lecture_collection
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    # Inserts the documents and counts the ones inserted on their lectures. Returns how many were
+    # inserted. If some couldn't be inserted (other than as duplicates), the rest are still counted
+    # and a StudentResponseWriteError is raised afterwards, as it is if counting fails.
+    async def write(self, documents: list) -> int:
+        error = None
+        inserted = documents
+        try:
+            await self.responses.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            write_errors = e.details.get("writeErrors", [])
+            failed = {write_error["index"] for write_error in write_errors}
+            inserted = [document for index, document in enumerate(documents) if index not in failed]
+            # Duplicates were inserted by an earlier attempt, anything else is a real failure
+            if any(write_error["code"] != 11000 for write_error in write_errors):
+                error = e
+
+        counts = Counter((document["lecture_id"], document["user_id"]) for document in inserted)
+        try:
+            await asyncio.gather(*(self._increment(lecture_id, user_id, count) for (lecture_id, user_id), count in counts.items()))
+        except Exception as e:
+            error = e
+        if error is not None:
+            raise StudentResponseWriteError(len(inserted), error)
+        return len(inserted)
+
+    async def _increment(self, lecture_id, user_id, count: int):
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.lectures.update_one({"_id": lecture_id, "user_id": user_id}, {"$inc": {"response_count": count}})
+                return
+            except Exception as e:
+                log(f"Error counting {count} responses on lecture {lecture_id} (attempt {attempt + 1}): {e}")
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
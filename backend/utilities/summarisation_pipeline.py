@@ -0,0 +1,235 @@
+import asyncio
+from utilities.bounded_executor import QueueFullError
+from utilities.chunker import Chunk, Chunker, fingerprint
+from utilities.observability import log
+
+# This file contains the summarisation pipeline used by the /summarise route. Rather than
+# summarising each chunk one after another, chunks are fanned out to the LLM concurrently,
+# limited by a semaphore so we never send more requests than the backend has parallel slots for.
+# Chunks can be given as a list or as an async iterator (e.g. straight from the chunker), in which
+# case summarisation of the first chunks starts while the rest of the document is still being read.
+# reuse maps chunk fingerprints to summaries from an earlier upload of the same lecture; chunks
+# found in it are passed straight through without calling the LLM.
+
+# Iterates over a list or an async iterator of chunks
+async def _iterate(chunks):
+    if hasattr(chunks, "__aiter__"):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
+
+# Raised when a map-reduce merge fails on every attempt, leaving no bounded summary to return.
+class SummarisationError(Exception):
+    pass
+
+# Chunks may be plain strings or Chunk objects carrying their page numbers
+def _chunk_text(chunk) -> str:
+    return chunk.text if isinstance(chunk, Chunk) else chunk
+
+# Summary of the chunk from an earlier upload, or None if it has to be summarised
+def _reused_summary(reuse: dict, chunk: str):
+    return reuse.get(fingerprint(chunk)) if reuse else None
+
+class SummarisationPipeline():
+    def __init__(self, llm, concurrency: int = 4, max_retries: int = 1):
+        self.llm = llm
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max(0, max_retries)
+
+    # Summarises a single chunk, retrying on failure. Returns None if every attempt failed
+    # so one bad chunk doesn't throw away the summaries of the others.
+    async def _summarise_chunk(self, semaphore: asyncio.Semaphore, index: int, chunk: str, user: str = None):
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self.llm.asummarise(chunk, user=user)
+                except QueueFullError:
+                    # The backend is overloaded, retrying straight away won't help.
+                    raise
+                except Exception as e:
+                    log(f"Error summarising chunk {index} (attempt {attempt + 1}): {e}")
+        return None
+
+    # Summarises a chunk and passes the result to on_result as soon as it is ready
+    async def _summarise_and_report(self, semaphore: asyncio.Semaphore, index: int, chunk: str, user: str = None, on_result=None, reuse: dict = None):
+        summary = _reused_summary(reuse, chunk)
+        if summary is None:
+            summary = await self._summarise_chunk(semaphore, index, chunk, user)
+        if on_result is not None:
+            await on_result(index, summary)
+        return summary
+
+    # Summarises every chunk concurrently. Output order always matches input order.
+    # Returns the list of summaries (None for chunks that failed) so callers can decide what to do.
+    # user is passed on to the LLM so backends that queue requests can share fairly between users.
+    # on_result, if given, is awaited with (index, summary) as each chunk finishes, e.g. to checkpoint it.
+    async def summarise_chunks(self, chunks, user: str = None, on_result=None, reuse: dict = None) -> list:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        try:
+            index = 0
+            async for chunk in _iterate(chunks):
+                tasks.append(asyncio.create_task(self._summarise_and_report(semaphore, index, _chunk_text(chunk), user, on_result, reuse)))
+                index += 1
+            return await asyncio.gather(*tasks)
+        finally:
+            # Only does anything if reading the chunks or a summary failed part way through.
+            for task in tasks:
+                task.cancel()
+
+    # Streams a single chunk's summary onto the shared event queue. Tokens from a failed attempt
+    # are discarded by the client when it receives the chunk_retry event.
+    async def _stream_chunk(self, semaphore: asyncio.Semaphore, events: asyncio.Queue, index: int, chunk, user: str = None, reuse: dict = None):
+        start_event = {"event": "chunk_start", "index": index}
+        if isinstance(chunk, Chunk) and chunk.start_page is not None:
+            start_event.update({"start_page": chunk.start_page, "end_page": chunk.end_page})
+        summary = _reused_summary(reuse, _chunk_text(chunk))
+        if summary is not None:
+            await events.put(start_event)
+            await events.put({"event": "chunk_done", "index": index, "summary": summary, "reused": True})
+            return
+        async with semaphore:
+            await events.put(start_event)
+            for attempt in range(self.max_retries + 1):
+                parts = []
+                try:
+                    async for token in self.llm.astream_summarise(_chunk_text(chunk), user=user):
+                        parts.append(token)
+                        await events.put({"event": "token", "index": index, "content": token})
+                    await events.put({"event": "chunk_done", "index": index, "summary": "".join(parts)})
+                    return
+                except QueueFullError as e:
+                    log(f"Error summarising chunk {index}: {e}")
+                    break
+                except Exception as e:
+                    log(f"Error summarising chunk {index} (attempt {attempt + 1}): {e}")
+                    if attempt < self.max_retries:
+                        await events.put({"event": "chunk_retry", "index": index})
+        await events.put({"event": "chunk_failed", "index": index})
+
+    # Reads the chunks, starting a summarisation task for each, and reports the total count (or
+    # the error that stopped it) on the event queue once the source is exhausted.
+    async def _read_chunks(self, chunks, semaphore: asyncio.Semaphore, events: asyncio.Queue, tasks: list, user: str = None, reuse: dict = None):
+        index = 0
+        try:
+            async for chunk in _iterate(chunks):
+                tasks.append(asyncio.create_task(self._stream_chunk(semaphore, events, index, chunk, user, reuse)))
+                index += 1
+        except Exception as e:
+            await events.put({"event": "source_error", "error": e})
+            return
+        await events.put({"event": "source_done", "total": index})
+
+    # Streaming version of summarise_chunks. Yields progress events as dicts while chunks are
+    # summarised concurrently, finishing with a "done" event holding the ordered summaries.
+    # "total" is None on progress events until every chunk has been read from the source. Reused
+    # chunks are sent as chunk_done with "reused": true and no tokens.
+    async def stream_chunks(self, chunks, user: str = None, reuse: dict = None):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        events = asyncio.Queue()
+        tasks = []
+        reader = asyncio.create_task(self._read_chunks(chunks, semaphore, events, tasks, user, reuse))
+
+        summaries = {}
+        total = None
+        try:
+            while total is None or len(summaries) < total:
+                event = await events.get()
+                if event["event"] == "source_error":
+                    raise event["error"]
+                if event["event"] == "source_done":
+                    total = event["total"]
+                    continue
+                if event["event"] in ("chunk_done", "chunk_failed"):
+                    summaries[event["index"]] = event.get("summary")
+                    event = {**event, "completed": len(summaries), "total": total}
+                yield event
+        finally:
+            # Stop any outstanding work if the consumer goes away early.
+            reader.cancel()
+            for task in tasks:
+                task.cancel()
+
+        ordered = [summaries[index] for index in range(total)]
+        yield {
+            "event": "done",
+            "summaries": [summary for summary in ordered if summary is not None],
+            "failed_chunks": [index for index, summary in enumerate(ordered) if summary is None]
+        }
+
+    # Merges one group of summaries, retrying on failure. A group of one is passed through as is.
+    async def _merge_group(self, semaphore: asyncio.Semaphore, group: list, user: str = None) -> str:
+        if len(group) == 1:
+            return group[0]
+        async with semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return await self.llm.amerge_summaries(group, user=user)
+                except QueueFullError:
+                    raise
+                except Exception as e:
+                    log(f"Error merging summaries (attempt {attempt + 1}): {e}")
+        raise SummarisationError("The LLM failed to merge the lecture summaries. Please try again.")
+
+    # Splits a level into runs of consecutive summaries whose combined size fits group_token_budget.
+    # Every group has at least two summaries where possible so each level is smaller than the last.
+    def _group_level(self, level: list, group_token_budget: int) -> list:
+        groups = []
+        group = []
+        group_tokens = 0
+        for summary in level:
+            tokens = self.llm.count_tokens(summary)
+            if group and len(group) >= 2 and group_tokens + tokens > group_token_budget:
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append(summary)
+            group_tokens += tokens
+        if group:
+            # Don't leave a lone summary at the end unmerged if it can join the previous group.
+            if len(group) == 1 and groups:
+                groups[-1].append(group[0])
+            else:
+                groups.append(group)
+        return groups
+
+    # Cuts text down to at most token_budget tokens, keeping whole sentences where possible.
+    def _trim_to_budget(self, text: str, token_budget: int) -> str:
+        if self.llm.count_tokens(text) <= token_budget:
+            return text
+        chunks = Chunker(chunk_size=token_budget, chunk_overlap=0, tokenizer=self.llm.chunker.tokenizer).split_text(text)
+        return chunks[0] if chunks else ""
+
+    # Hierarchical (map-reduce) summarisation. Chunks are summarised concurrently (map), then
+    # consecutive summaries are merged level by level (reduce) until a level fits in token_budget.
+    # That level is returned as the section summaries along with a single lecture summary, so the
+    # output size is bounded however long the lecture is. Every call goes through the LLM's
+    # response cache, so re-running with different budgets only recomputes the levels that change.
+    async def map_reduce(self, chunks, token_budget: int = 1024, group_token_budget: int = 2048, user: str = None, reuse: dict = None) -> dict:
+        chunk_summaries = await self.summarise_chunks(chunks, user=user, reuse=reuse)
+        return await self.reduce_summaries(chunk_summaries, token_budget, group_token_budget, user)
+
+    # The reduce half of map_reduce, for chunk summaries that are already done (None for failed chunks)
+    async def reduce_summaries(self, chunk_summaries: list, token_budget: int = 1024, group_token_budget: int = 2048, user: str = None) -> dict:
+        failed_chunks = [index for index, summary in enumerate(chunk_summaries) if summary is None]
+        level = [summary for summary in chunk_summaries if summary is not None]
+        if not level:
+            return {"summaries": [], "lecture_summary": "", "levels": 0, "failed_chunks": failed_chunks}
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        levels = 1
+        while len(level) > 1 and sum(self.llm.count_tokens(summary) for summary in level) > token_budget:
+            groups = self._group_level(level, group_token_budget)
+            level = list(await asyncio.gather(*[self._merge_group(semaphore, group, user) for group in groups]))
+            levels += 1
+
+        sections = [self._trim_to_budget(summary, token_budget) for summary in level]
+        lecture_summary = await self._merge_group(semaphore, sections, user)
+        return {
+            "summaries": sections,
+            "lecture_summary": self._trim_to_budget(lecture_summary, token_budget),
+            "levels": levels,
+            "failed_chunks": failed_chunks
+        }
@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+from pymongo import ASCENDING
+from utilities.chunker import Chunk, fingerprint
+from utilities.observability import CACHE_LOOKUPS, log
+
+# Remembers the chunks of the last upload of each of a user's files (by file name) along with their
+# summaries, so when a lecturer fixes a slide and uploads the deck again only the chunks holding
+# changed pages go back to the LLM. Uploads are chunked page-aligned (Chunker.aiter_page_chunks),
+# so unchanged pages come out as the same chunks and are matched by fingerprint. Unlike the
+# response cache this doesn't depend on the entry still being in an LRU or inside its TTL. The
+# prompts version and summarising model are saved with the manifest, and summaries written with a
+# different prompt or model are never reused.
+
+class SummaryManifests():
+    def __init__(self, collection):
+        self.collection = collection
+
+    # Creates the index used to find a user's file. Called once on server startup.
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index([("user_id", ASCENDING), ("file_name", ASCENDING)], unique=True)
+        except Exception as e:
+            log(f"Error creating summary manifest indexes: {e}")
+
+    # Chunk fingerprint -> summary for the previous upload of the file, empty if there wasn't one or
+    # it was summarised with another version of the prompts or another model
+    async def load(self, user_id, file_name: str, prompt_version: str, model: str) -> dict:
+        manifest = await self.collection.find_one({"user_id": user_id, "file_name": file_name}, {"chunks": 1, "prompt_version": 1, "model": 1})
+        if manifest is not None and (manifest.get("prompt_version") != prompt_version or manifest.get("model") != model):
+            manifest = None
+        CACHE_LOOKUPS.labels("summary_manifest", "hit" if manifest else "miss").inc()
+        if manifest is None:
+            return {}
+        return {chunk["fingerprint"]: chunk["summary"] for chunk in manifest["chunks"] if chunk["summary"] is not None}
+
+    # Replaces the manifest of the file with the chunks of this upload and their summaries (None for
+    # chunks that failed, which are summarised again next time).
+    async def save(self, user_id, file_name: str, chunks: list, summaries: list, prompt_version: str, model: str):
+        entries = []
+        for chunk, summary in zip(chunks, summaries):
+            text = chunk.text if isinstance(chunk, Chunk) else chunk
+            entry = {"fingerprint": fingerprint(text), "summary": summary}
+            if isinstance(chunk, Chunk):
+                entry.update({"start_page": chunk.start_page, "end_page": chunk.end_page})
+            entries.append(entry)
+        await self.collection.update_one(
+            {"user_id": user_id, "file_name": file_name},
+            {"$set": {"chunks": entries, "prompt_version": prompt_version, "model": model, "updated_at": datetime.now(timezone.utc)}},
+            upsert=True
+        )
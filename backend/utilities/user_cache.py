@@ -0,0 +1,63 @@
+import time
+from collections import OrderedDict
+from utilities.observability import CACHE_LOOKUPS
+
+# In-process cache of authenticated users, so requests don't each need a user_credentials lookup.
+# Entries are keyed by user id and the token's iat (issued at) claim, so logging in again always
+# reads the user fresh, and expire after ttl_seconds so changes made by other workers are picked
+# up quickly. Cached users never include the password hash.
+
+class UserCache():
+    def __init__(self, ttl_seconds: float = 60, max_entries: int = 4096):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # Cache keys held for each user, so invalidate doesn't have to scan every entry
+        self.keys_by_user = {}
+        self.hits = 0
+        self.misses = 0
+
+    # Returns a copy of the cached user, or None if it isn't cached or has expired
+    def get(self, user_id: str, issued_at=None):
+        key = (user_id, issued_at)
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            CACHE_LOOKUPS.labels("user", "miss").inc()
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        CACHE_LOOKUPS.labels("user", "hit").inc()
+        return dict(entry[1])
+
+    def set(self, user_id: str, issued_at, user: dict):
+        key = (user_id, issued_at)
+        self.entries[key] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self.entries.move_to_end(key)
+        self.keys_by_user.setdefault(user_id, set()).add(key)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    # Drops every cached entry for a user. Call whenever their user_credentials document changes.
+    def invalidate(self, user_id: str):
+        for key in self.keys_by_user.pop(user_id, set()):
+            self.entries.pop(key, None)
+
+    def _remove(self, key: tuple):
+        self.entries.pop(key, None)
+        user_keys = self.keys_by_user.get(key[0])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self.keys_by_user[key[0]]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.entries)
+        }
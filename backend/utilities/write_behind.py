@@ -0,0 +1,84 @@
+import asyncio
+from collections import deque
+from utilities.observability import log
+
+# In-process write-behind buffer. Callers add items and carry on straight away; a background task
+# hands them to flush (an async function taking a list) in batches of up to max_batch, as soon as
+# a batch is full or every flush_interval seconds otherwise. A failed flush is retried with
+# backoff, keeping the items at the front of the buffer so they are written in order. On stop the
+# buffer is drained before returning, so a clean shutdown never loses buffered writes.
+#
+# flush may be called again with items it already wrote (if it failed part way through), so it
+# should be idempotent, e.g. by inserting documents with ids chosen up front.
+
+class WriteBehindBuffer():
+    def __init__(self, flush, max_batch: int = 100, flush_interval: float = 0.5, max_pending: int = 10000, max_retries: int = 5, retry_delay: float = 0.5):
+        self.flush = flush
+        self.max_batch = max(1, max_batch)
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.pending = deque()
+        self._wake = asyncio.Event()
+        self._task = None
+        self._stopping = False
+
+    # Queues an item to be written. Returns False if the buffer is full (e.g. MongoDB has been
+    # down for a while) or stopping, in which case the caller should write it directly.
+    def add(self, item) -> bool:
+        if self._stopping or len(self.pending) >= self.max_pending:
+            return False
+        self.pending.append(item)
+        if len(self.pending) >= self.max_batch:
+            self._wake.set()
+        return True
+
+    # Writes one batch from the front of the buffer, retrying with backoff. After max_retries the
+    # batch is dropped so one bad write can't hold everything behind it up forever.
+    async def _flush_batch(self):
+        batch = [self.pending[index] for index in range(min(self.max_batch, len(self.pending)))]
+        for attempt in range(self.max_retries + 1):
+            try:
+                await self.flush(batch)
+                break
+            except Exception as e:
+                log(f"Error flushing {len(batch)} buffered writes (attempt {attempt + 1}): {e}")
+                if attempt == self.max_retries:
+                    log(f"Dropping {len(batch)} buffered writes after {attempt + 1} attempts")
+                    break
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        for _ in batch:
+            self.pending.popleft()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self.pending:
+                await self._flush_batch()
+                # Only keeps going without waiting while there are full batches to write
+                if len(self.pending) < self.max_batch and not self._stopping:
+                    break
+        while self.pending:
+            await self._flush_batch()
+
+    # Starts the background flush task on the running event loop
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    # Stops taking new items and returns once everything still buffered has been written. A batch
+    # being written when stop is called is finished rather than cancelled.
+    async def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        while self.pending:
+            await self._flush_batch()
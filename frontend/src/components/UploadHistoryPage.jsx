@@ -3,39 +3,66 @@ import ReactMarkdown from 'react-markdown';
 import './UploadHistoryPage.css';
 import React, { useState, useEffect } from 'react';
 
+const API_URL = 'http://127.0.0.1:8000';
+
+// Returns the auth header sent with every history request
+const authHeaders = () => ({
+    'Authorization': `Bearer ${localStorage.getItem('token')}`
+});
+
 // UploadHistoryPage component displays a list of past lecture uploads and related details
 function UploadHistoryPage() {
-    // State to store lectures, expanded lecture index, and button hover state
+    // State to store lectures, the cursor for the next page, loaded lecture details, expanded lecture index, and button hover state
     const [lectures, setLectures] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [lectureDetails, setLectureDetails] = useState({});
     const [expandedLectureIndex, setExpandedLectureIndex] = useState(null);
     const [hover, setHover] = useState(false);
 
-    // Fetches the user's upload history from the server on component mount
-    useEffect(() => {
-        const fetchUploadHistory = async () => {
-            try {
-                // Sends a GET request with the auth token to retrieve upload history
-                const response = await axios.get('http://127.0.0.1:8000/upload-history', {
-                    headers: {
-                        'Authorization': `Bearer ${localStorage.getItem('token')}`
-                    }
-                });
-                // Sorts lectures by creation date, with most recent first
-                const sortedLectures = (response.data.lectures || []).sort(
-                    (a, b) => new Date(b.created_at) - new Date(a.created_at)
-                );
-                setLectures(sortedLectures);
-            } catch (error) {
-                console.error("Error fetching upload history:", error);
+    // Fetches one page of the user's upload history, newest first. The server only sends the file name,
+    // date and response count for each lecture; the rest is fetched when a lecture is opened.
+    const fetchUploadHistory = async (cursor = null) => {
+        try {
+            const response = await axios.get(`${API_URL}/upload-history`, {
+                headers: authHeaders(),
+                params: cursor ? { cursor } : {}
+            });
+            const page = response.data.lectures || [];
+            setLectures(previous => (cursor ? [...previous, ...page] : page));
+            setNextCursor(response.data.next_cursor);
+        } catch (error) {
+            console.error("Error fetching upload history:", error);
+            if (!cursor) {
                 setLectures([]); // Clears lectures if an error occurs
             }
-        };
+        }
+    };
 
+    // Fetches the user's first page of upload history from the server on component mount
+    useEffect(() => {
         fetchUploadHistory();
     }, []);
 
+    // Fetches a lecture's summary and student responses the first time it is opened
+    const fetchLectureDetails = async (lectureId) => {
+        if (lectureDetails[lectureId]) {
+            return;
+        }
+        try {
+            const response = await axios.get(`${API_URL}/upload-history/${lectureId}`, {
+                headers: authHeaders()
+            });
+            setLectureDetails(previous => ({ ...previous, [lectureId]: response.data }));
+        } catch (error) {
+            console.error("Error fetching lecture details:", error);
+        }
+    };
+
     // Toggles the expanded view of lecture details by index
     const toggleLectureDetails = (index) => {
+        if (expandedLectureIndex !== index) {
+            fetchLectureDetails(lectures[index]._id);
+        }
         setExpandedLectureIndex(expandedLectureIndex === index ? null : index);
     };
 
@@ -45,12 +72,14 @@ function UploadHistoryPage() {
             {/* Displays lectures if available, else shows a message */}
             {lectures.length > 0 ? (
                 <ul className="list-group mt-4">
-                    {lectures.map((lecture, index) => (
-                        <li key={index} className="list-group-item text-left">
+                    {lectures.map((lecture, index) => {
+                        const details = lectureDetails[lecture._id];
+                        return (
+                        <li key={lecture._id} className="list-group-item text-left">
                             <h3>Lecture Log</h3>
-                            <p><strong>Lecture Summary:</strong> {lecture.lecture_summary}</p>
                             <p><strong>Lecture File:</strong> {lecture.lecture_file_name}</p>
                             <p><strong>Lecture at:</strong> {new Date(lecture.created_at).toLocaleString()}</p>
+                            <p><strong>Responses:</strong> {lecture.response_count || 0}</p>
                             
                             {/* Button to expand/collapse lecture details */}
                             <button
@@ -71,12 +100,16 @@ function UploadHistoryPage() {
 
                             {/* Conditional rendering for expanded lecture details */}
                             {expandedLectureIndex === index && (
+                                !details ? (
+                                    <p className="mt-3">Loading...</p>
+                                ) : (
                                 <div className="mt-3">
+                                    <p><strong>Lecture Summary:</strong> {details.lecture_summary}</p>
                                     <h5>Student Questions, Responses, LLM Evaluations</h5>
-                                    {lecture.students && lecture.students.length > 0 ? (
+                                    {details.students && details.students.length > 0 ? (
                                         <ul className="list-group">
                                         {/* Displays student questions, responses, and evaluations */}
-                                        {lecture.students.map((student, studentIndex) => (
+                                        {details.students.map((student, studentIndex) => (
                                           <li key={studentIndex} className="list-group-item">
                                             <p><strong>Question:</strong> {student.question}</p>
                                             <p><strong>Answer:</strong> {student.response}</p>
@@ -95,13 +128,21 @@ function UploadHistoryPage() {
                                         <p className="mt-2">No student questions available for this lecture.</p>
                                     )}
                                 </div>
+                                )
                             )}
                         </li>
-                    ))}
+                        );
+                    })}
                 </ul>
             ) : (
                 <p className="mt-4">Nothing to see here yet!</p>
             )}
+            {/* Loads the next page of lectures when there is one */}
+            {nextCursor && (
+                <button className="btn btn-outline-primary mt-3" onClick={() => fetchUploadHistory(nextCursor)}>
+                    Load more
+                </button>
+            )}
         </div>
     );
 }
@@ -84,8 +84,12 @@ function UploadPage() {
       try {
         setIsSummarising(true); // Set specific loading state for summarisation
         // Sending content to summarise route in backend
+        // Logged in users get the summaries of unchanged pages reused when re-uploading an edited file
         const response = await axios.post('http://127.0.0.1:8000/summarise', formData, {
-          headers: { 'Content-Type': 'multipart/form-data' },
+          headers: {
+            'Content-Type': 'multipart/form-data',
+            'Authorization': `Bearer ${localStorage.getItem('token')}`,
+          },
           signal: summariseControllerRef.current.signal,
         });
   
@@ -136,7 +140,7 @@ function UploadPage() {
       }
       
       // Storing new lecture content
-      const lectureId = await storeLecture();
+      const lectureId = await storeLecture(summaries);
       if (!lectureId) {
         console.error('Failed to store lecture. Cannot proceed with evaluation.');
         handleReset(); // Reset the form if lecture storage fails
@@ -149,7 +153,7 @@ function UploadPage() {
       setIsBoxLoading(Array(10).fill(true));
       setIsLoading(true);
       const initialRequests = Array.from({ length: 10 }, (_, index) =>
-        fetchApiResponse(index, summaries)
+        fetchApiResponse(index, summaries, lectureId)
       );
       await Promise.all(initialRequests);
     } catch (error) {
@@ -160,8 +164,8 @@ function UploadPage() {
     }
   };
 
-  // Function to gather questions from the LLM.
-  const fetchApiResponse = async (index, summaries) => {
+  // Function to gather questions from the LLM. Questions for a stored lecture are served from its pre-generated question pool.
+  const fetchApiResponse = async (index, summaries, lectureId = currentLectureId) => {
     const abortController = new AbortController();
     abortControllersRef.current.push(abortController);
 
@@ -181,11 +185,16 @@ function UploadPage() {
     if (summaries && summaries.length > 0) {
       formData.append('summaries', JSON.stringify(summaries));
     }
+    if (lectureId) {
+      formData.append('lecture_id', lectureId);
+    }
 
     // Uses the upload route to generate questions
     try {
       const response = await axios.post('http://127.0.0.1:8000/upload', formData, {
-        
+        headers: {
+          'Authorization': `Bearer ${localStorage.getItem('token')}`
+        },
         signal: abortController.signal,
       });
 
@@ -216,13 +225,16 @@ function UploadPage() {
     }
   };
 
-  // Function to store lectures in MongoDB database
-  const storeLecture = async () => {
+  // Function to store lectures in MongoDB database. The summaries are used to pre-generate questions for the lecture.
+  const storeLecture = async (summaries) => {
     if (textContent.trim() || file) {
       const formData = new FormData();
       formData.append('lecture_summary', textContent.trim() ? textContent : 'N/A');
       const fileName = file ? file.name : 'N/A';
       formData.append('lecture_file_name', fileName);
+      if (summaries && summaries.length > 0) {
+        formData.append('summaries', JSON.stringify(summaries));
+      }
 
       try {
         const response = await axios.post('http://127.0.0.1:8000/store-lecture', formData, {
@@ -259,6 +271,9 @@ function UploadPage() {
       const formData = new FormData();
       formData.append('question', boxResponses[index]);
       formData.append('answer', answer);
+      formData.append('lecture_id', currentLectureId);
+      // The backend records the question, answer and evaluation against the lecture itself
+      formData.append('store', 'true');
 
       setIsEvaluating((prev) => {
         const newEvaluatingState = [...prev];
@@ -285,19 +300,6 @@ function UploadPage() {
           return newEvaluations;
         });
 
-        const storeData = new FormData();
-        storeData.append('lecture_id', currentLectureId);
-        storeData.append('question', boxResponses[index]);
-        storeData.append('response', answer);
-        storeData.append('evaluation', evaluation);
-
-        await axios.post('http://127.0.0.1:8000/store-student-response', storeData, {
-          headers: {
-            'Authorization': `Bearer ${localStorage.getItem('token')}`,
-            'Content-Type': 'multipart/form-data',
-          },
-        });
-
       } catch (error) {
         if (error.name === 'CanceledError') {
           console.log('Evaluate request canceled:', error.message);